@@ -0,0 +1,149 @@
+import os
+import pickle
+import sqlite3
+import stat
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Final, Iterable
+
+from apt_log.log import AptLogEntry
+
+if TYPE_CHECKING:
+    from apt_log.details import LogFileIndex
+
+# Bump whenever the pickled representation of log entries changes.
+CACHE_FORMAT_VERSION: Final[int] = 5
+
+
+def get_default_cache_path() -> Path:
+    cache_home = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(cache_home) / 'apt-log' / 'entries.sqlite3'
+
+
+def _check_private(path: Path):
+    # Raises PermissionError unless the file or directory is owned by the effective user and writable by nobody else
+    path_stat = path.stat()
+    if path_stat.st_uid != os.geteuid() or path_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"{path} must be owned by the current user and not writable by anyone else.")
+
+
+@dataclass(frozen=True)
+class LogFileIdentity:
+    path: str
+    inode: int
+    size: int
+    mtime_ns: int
+
+    @classmethod
+    def of(cls, path: Path) -> 'LogFileIdentity':
+        stat = path.stat()
+        return cls(str(path.absolute()), stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+@dataclass
+class AptLogCache:
+    path: Path = field(default_factory=get_default_cache_path)
+
+    _connection: sqlite3.Connection | None = field(default=None, init=False, repr=False)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # Cached entries are pickled, so loading a cache that someone else can write to would let them run code as
+            # the current user, such as root under sudo with the HOME of the invoking user. New caches are private.
+            self.path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            _check_private(self.path.parent)
+            self.path.touch(mode=0o600, exist_ok=True)
+            _check_private(self.path)
+
+            connection = sqlite3.connect(self.path)
+            connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS files '
+                '(path TEXT PRIMARY KEY, inode INTEGER, size INTEGER, mtime_ns INTEGER, entries BLOB)',
+            )
+            # Indexes of the dpkg and terminal logs (see apt_log.details)
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS indexes '
+                '(path TEXT PRIMARY KEY, inode INTEGER, size INTEGER, mtime_ns INTEGER, log_index BLOB)',
+            )
+
+            # Entries pickled by a different version of apt-log can not be trusted to load correctly.
+            row = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is None or row[0] != CACHE_FORMAT_VERSION:
+                with connection:
+                    connection.execute('DELETE FROM files')
+                    connection.execute('DELETE FROM indexes')
+                    connection.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (CACHE_FORMAT_VERSION,),
+                    )
+
+            self._connection = connection
+
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def get(self, identity: LogFileIdentity) -> list[AptLogEntry] | None:
+        row = self._connect().execute(
+            'SELECT entries FROM files WHERE path = ? AND inode = ? AND size = ? AND mtime_ns = ?',
+            (identity.path, identity.inode, identity.size, identity.mtime_ns),
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        # The cache file is private to the user (see _connect), so its content is trusted.
+        try:
+            return pickle.loads(row[0])  # noqa: S301
+        except Exception:
+            return None
+
+    def put(self, identity: LogFileIdentity, entries: list[AptLogEntry]):
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO files (path, inode, size, mtime_ns, entries) VALUES (?, ?, ?, ?, ?)',
+                (identity.path, identity.inode, identity.size, identity.mtime_ns, pickle.dumps(entries)),
+            )
+
+    def get_index(self, path: str) -> 'tuple[LogFileIdentity, LogFileIndex] | None':
+        # Returns the index of the log file at the given path along with the identity of the file it has been built of,
+        # which may have changed since
+        row = self._connect().execute(
+            'SELECT inode, size, mtime_ns, log_index FROM indexes WHERE path = ?', (path,),
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        try:
+            return LogFileIdentity(path, *row[:3]), pickle.loads(row[3])  # noqa: S301
+        except Exception:
+            return None
+
+    def put_index(self, identity: LogFileIdentity, index: 'LogFileIndex'):
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO indexes (path, inode, size, mtime_ns, log_index) VALUES (?, ?, ?, ?, ?)',
+                (identity.path, identity.inode, identity.size, identity.mtime_ns, pickle.dumps(index)),
+            )
+
+    def prune(self, log_files: Iterable[Path]):
+        # Forget about all log files except the given ones
+        paths = [str(path.absolute()) for path in log_files]
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                f'DELETE FROM files WHERE path NOT IN ({", ".join("?" * len(paths))})',  # noqa: S608
+                paths,
+            )
+
+    def clear(self):
+        connection = self._connect()
+        with connection:
+            connection.execute('DELETE FROM files')
+            connection.execute('DELETE FROM indexes')
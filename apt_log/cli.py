@@ -1,19 +1,236 @@
+import enum
+import os
+import re
+import signal
+import sys
+from dataclasses import dataclass
 from datetime import datetime
+from functools import cache
 from itertools import takewhile
-from typing import Annotated, Optional
+from pathlib import Path
+from typing import TYPE_CHECKING, Annotated, Callable, Iterator, Optional, TypeVar
 
-import humanize
 import typer
 from click import ClickException
-from rich import box
-from rich.console import Console
-from rich.table import Table
 
-from apt_log.log import AptLogEntry, ChangedPackage, InvalidAptLogEntryIDError
-from apt_log.reader import build_system_apt_log
+from apt_log.export import ExportFormat, ExportGranularity
+from apt_log.log import (
+    AptLog,
+    AptLogEntry,
+    AptLogQuery,
+    ChangedPackage,
+    InvalidAptLogEntryIDError,
+    PackageAction,
+    compile_package_pattern,
+    is_entry_key,
+)
+from apt_log.reader import (
+    AptLogReader,
+    build_system_apt_log,
+    find_last_system_log_entry,
+    find_system_log_entry,
+    get_system_log_paths,
+)
+from apt_log.stats import DEFAULT_PERCENTILES, DateBucket, StatsField
+from apt_log.timing import enable_timings, get_timings, measure
+
+if TYPE_CHECKING:
+    from rich.console import Console
+
+    from apt_log.cache import AptLogCache
+    from apt_log.details import AptLogEntryDetails
+    from apt_log.fleet import AptFleetLog
+    from apt_log.server import AptLogClient
+
+# Since the tool is often run for short queries, dependencies that only some commands need (rich tables, humanize,
+# sqlite3, pyarrow, ...) are imported by those commands rather than here.
 
 app = typer.Typer()
-console = Console()
+
+T = TypeVar('T')
+
+
+@cache
+def get_console() -> 'Console':
+    from rich.console import Console
+
+    return Console()
+
+
+@dataclass
+class Settings:
+    cache_file: Path | None = None
+    use_cache: bool = True
+    jobs: int | None = 1
+    fleet_dir: Path | None = None
+    socket_path: Path | None = None
+    use_server: bool = True
+    deduplicate: bool = False
+
+
+settings = Settings()
+
+
+@app.callback()
+def main(
+        ctx: typer.Context,
+        *,
+        cache_file: Annotated[Optional[Path], typer.Option(
+            "--cache-file",
+            envvar="APT_LOG_CACHE_FILE",
+            show_default=False,
+            help="Location of the cache of parsed log files. [default: ~/.cache/apt-log/entries.sqlite3]",
+        )] = None,
+        use_cache: Annotated[bool, typer.Option(
+            "--cache/--no-cache",
+            help="Cache parsed log files so that unchanged files are not parsed again.",
+        )] = True,
+        clear_cache: Annotated[bool, typer.Option(
+            "--clear-cache",
+            help="Invalidate the cache before reading the log files.",
+        )] = False,
+        jobs: Annotated[int, typer.Option(
+            "--jobs", "-j",
+            min=0,
+            help="Number of processes that parse log files in parallel (0 uses all CPUs).",
+        )] = 1,
+        deduplicate: Annotated[bool, typer.Option(
+            "--deduplicate",
+            help="Keep entries that occur more than once, such as in overlapping copies of log files, only once.",
+        )] = False,
+        socket_path: Annotated[Optional[Path], typer.Option(
+            "--socket",
+            envvar="APT_LOG_SOCKET",
+            show_default=False,
+            help="Unix socket of 'apt-log serve'. [default: $XDG_RUNTIME_DIR/apt-log.sock]",
+        )] = None,
+        use_server: Annotated[bool, typer.Option(
+            "--server/--no-server",
+            help="Answer queries through 'apt-log serve' if it is running instead of reading the log files.",
+        )] = True,
+        show_timings: Annotated[bool, typer.Option(
+            "--timings",
+            help="Print the time spent in each stage of processing to stderr.",
+        )] = False,
+        profile: Annotated[Optional[Path], typer.Option(
+            "--profile",
+            metavar='PATH',
+            help="Profile the command and write the statistics to the given file (see pstats).",
+        )] = None,
+):
+    if show_timings:
+        timings = enable_timings()
+        ctx.call_on_close(lambda: typer.echo(timings.format(), err=True))
+
+    if profile is not None:
+        import cProfile
+
+        profiler = cProfile.Profile()
+
+        def _dump_profile():
+            profiler.disable()
+            profiler.dump_stats(profile)
+
+        ctx.call_on_close(_dump_profile)
+        profiler.enable()
+
+    settings.jobs = jobs or None
+    settings.cache_file = cache_file
+    settings.use_cache = use_cache
+    settings.socket_path = socket_path
+    settings.deduplicate = deduplicate
+    settings.use_server = use_server
+
+    if clear_cache:
+        import sqlite3
+
+        from apt_log.cache import AptLogCache, get_default_cache_path
+
+        try:
+            AptLogCache(cache_file or get_default_cache_path()).clear()
+        except (sqlite3.Error, OSError) as err:
+            raise ClickException(f"Could not clear cache: {err}") from err
+
+
+def _get_reader(query: AptLogQuery | None = None) -> AptLogReader:
+    return AptLogReader(lazy=True, query=query, deduplicate=settings.deduplicate)
+
+
+def _build_log(query: AptLogQuery | None = None) -> AptLog:
+    with measure('build_log'):
+        return _build_system_apt_log(query)
+
+
+def _with_cache(function: Callable[['AptLogCache | None'], T]) -> T:
+    # Calls the function with the cache, unless it is disabled, and again without it if it is not usable. The cache
+    # is merely an optimization, so the command does not fail because of it.
+    if settings.use_cache:
+        import sqlite3
+
+        from apt_log.cache import AptLogCache, get_default_cache_path
+
+        cache = AptLogCache(settings.cache_file or get_default_cache_path())
+        try:
+            return function(cache)
+        except (sqlite3.Error, OSError):
+            pass
+        finally:
+            cache.close()
+
+    return function(None)
+
+
+def _build_system_apt_log(query: AptLogQuery | None = None) -> AptLog:
+    # The cache holds all entries, so the query is applied to the log only. Without the cache, it is applied while
+    # parsing already, which skips building whatever does not match.
+    return _with_cache(lambda cache: build_system_apt_log(
+        cache, jobs=settings.jobs, reader=_get_reader(query if cache is None else None),
+    ))
+
+
+def _get_socket_path() -> Path:
+    from apt_log.server import get_default_socket_path
+
+    return settings.socket_path or get_default_socket_path()
+
+
+def _get_client() -> 'AptLogClient | None':
+    # Returns a client of the server if one may be running. Commands that get no answer from it fall back to reading the
+    # log files themselves.
+    if not settings.use_server:
+        return None
+
+    socket_path = _get_socket_path()
+    if not socket_path.is_socket():
+        return None
+
+    from apt_log.server import AptLogClient
+
+    return AptLogClient(socket_path)
+
+
+def _query_server(query: Callable[['AptLogClient'], T]) -> T | None:
+    # Returns the result of the query, or None if there is no server to answer it
+    if (client := _get_client()) is None:
+        return None
+
+    from http.client import HTTPException
+
+    from apt_log.server import AptLogServerError
+
+    try:
+        with measure('server'):
+            return query(client)
+    except (OSError, HTTPException):
+        return None
+    except AptLogServerError as err:
+        raise ClickException(str(err)) from err
+
+
+class ListFormat(enum.StrEnum):
+    TABLE = "table"
+    PLAIN = "plain"
+    TSV = "tsv"
 
 
 @app.command("list", help="List APT log entries.")
@@ -40,28 +257,81 @@ def list_entries(
             metavar='PACKAGE_NAME',
             help="Filter entries by the name of the package (supports glob-style pattern matching).",
         )] = None,
+        architecture: Annotated[Optional[str], typer.Option(
+            "--architecture",
+            help="Filter entries by the architecture of the package.",
+        )] = None,
+        version: Annotated[Optional[str], typer.Option(
+            "--version",
+            help="Filter entries by the version of the package.",
+        )] = None,
+        actions: Annotated[Optional[list[PackageAction]], typer.Option(
+            "--action",
+            case_sensitive=False,
+            help="Filter entries by the action on the package (may be given several times).",
+        )] = None,
+        requested_by: Annotated[Optional[str], typer.Option(
+            "--requested-by", "-u",
+            metavar='USER',
+            help="Filter entries by the user who requested the transaction.",
+        )] = None,
+        command_pattern: Annotated[Optional[str], typer.Option(
+            "--command",
+            metavar='REGEX',
+            help="Filter entries by a regular expression that the command line must contain a match of.",
+        )] = None,
+        limit: Annotated[Optional[int], typer.Option(
+            "--limit", "-l",
+            min=0,
+            help="Show at most the given number of entries.",
+        )] = None,
+        offset: Annotated[int, typer.Option(
+            "--offset",
+            min=0,
+            help="Skip the given number of entries.",
+        )] = 0,
+        reverse: Annotated[bool, typer.Option(
+            "--reverse", "-r",
+            help="Show the most recent entries first.",
+        )] = False,
+        list_format: Annotated[ListFormat, typer.Option(
+            "--format", "-f",
+            help="Output format. Unlike tables, plain and tab-separated output is printed while entries are read.",
+        )] = ListFormat.TABLE,
 ):
-    entries = build_system_apt_log().get_entries(
+    if command_pattern is not None:
+        try:
+            re.compile(command_pattern)
+        except re.error as err:
+            raise typer.BadParameter(f"Invalid regular expression: {err}", param_hint="'--command'") from err
+
+    query = AptLogQuery(
         start_date=start_date,
         end_date=end_date,
         package_name=package_name,
+        architecture=architecture,
+        version=version,
+        actions=actions or None,
+        requested_by=requested_by,
+        command_pattern=command_pattern,
     )
 
-    table = Table(header_style='bold magenta', box=box.SIMPLE_HEAD)
-    table.add_column("ID", style='cyan')
-    table.add_column("DATE", style='green')
+    entries = _query_server(
+        lambda client: client.get_matching_entries(query, offset=offset, limit=limit, reverse=reverse),
+    )
+    if entries is None:
+        entries = _build_log(query).get_matching_entries(query, offset=offset, limit=limit, reverse=reverse)
 
-    if show_commands:
-        table.add_column("COMMAND", style='yellow')
+    use_markup = list_format == ListFormat.TABLE
 
-    table.add_column("ACTION", style='blue')
-    table.add_column("PACKAGES", style='yellow')
+    def _dim(string: str) -> str:
+        return f"[dim]{string}[/dim]" if use_markup else string
 
     def _join_strings(strings: list[str], *, use_and: bool = True) -> str:
         if use_and and len(strings) > 1:
-            return f"{_join_strings(strings[:-1], use_and=False)} [dim]and[/dim] {strings[-1]}"
+            return f"{_join_strings(strings[:-1], use_and=False)} {_dim('and')} {strings[-1]}"
         else:
-            return "[dim],[/dim] ".join(strings)
+            return f"{_dim(',')} ".join(strings)
 
     def _build_packages_string(
             packages: list[ChangedPackage] | None = None,
@@ -72,61 +342,108 @@ def list_entries(
 
         if packages:
             if show_versions:
-                strings.extend(f"{package.name} [dim]({package.version})[/dim]" for package in packages)
+                strings.extend(f"{package.name} {_dim(f'({package.version})')}" for package in packages)
             else:
                 strings.extend(package.name for package in packages)
         if other_package_count > 0:
-            strings.append(f"[dim]{other_package_count} other packages[/dim]")
+            strings.append(_dim(f"{other_package_count} other packages"))
         if dependency_count > 0:
-            strings.append(f"[dim]{dependency_count} dependencies[/dim]")
+            strings.append(_dim(f"{dependency_count} dependencies"))
 
         return _join_strings(strings, use_and=other_package_count + dependency_count > 0)
 
-    for entry in entries:
-        base_columns = [str(entry.id), entry.start_date.strftime('%Y-%m-%d %H:%M')]
+    def _iter_rows() -> Iterator[list[str]]:
+        for entry in entries:
+            date = entry.start_date.strftime('%Y-%m-%d %H:%M') if entry.start_date is not None else ""
+            base_columns = [str(entry.id), date]
+
+            if show_commands:
+                base_columns.append(entry.command_line or "")
+
+            if entry.has_changed_packages():
+                for n, (action, packages) in enumerate(entry.changed_packages_by_action.items()):
+                    # Packages that are marked as 'automatic' are considered dependencies. They should not be displayed.
+
+                    # Count dependencies (Since packages is sorted, dependencies come last.)
+                    dependencies_count = sum(
+                        1 for _ in
+                        takewhile(lambda package: package.is_automatic, reversed(packages))
+                    ) if package_name is None else 0
+                    non_dependencies_count = len(packages) - dependencies_count
+
+                    if non_dependencies_count > 3:
+                        packages_string = _build_packages_string(
+                            packages[:2],
+                            other_package_count=non_dependencies_count - 2,
+                            dependency_count=dependencies_count,
+                        )
+                    else:
+                        packages_string = _build_packages_string(
+                            packages[:non_dependencies_count],
+                            dependency_count=dependencies_count,
+                        )
+
+                    yield [
+                        *(base_columns if n == 0 or not use_markup else [""] * len(base_columns)),
+                        action,
+                        packages_string,
+                    ]
+
+            elif entry.error:
+                yield [*base_columns, "ERROR", entry.error]
+
+            else:
+                yield [*base_columns, "UNKNOWN", ""]
+
+    if (timings := get_timings()) is not None:
+        entries = timings.iterate(entries, 'filter', unit='entries')
+
+    if list_format == ListFormat.TABLE:
+        from rich import box
+        from rich.table import Table
+
+        table = Table(header_style='bold magenta', box=box.SIMPLE_HEAD)
+        table.add_column("ID", style='cyan')
+        table.add_column("DATE", style='green')
 
         if show_commands:
-            base_columns.append(entry.command_line)
-
-        if entry.has_changed_packages():
-            for n, (action, packages) in enumerate(entry.changed_packages_by_action.items()):
-                # Packages that are marked as 'automatic' are considered dependencies. They should not be displayed.
-
-                # Count dependencies (Since packages is sorted, dependencies come last.)
-                dependencies_count = sum(
-                    1 for _ in
-                    takewhile(lambda package: package.is_automatic, reversed(packages))
-                ) if package_name is None else 0
-                non_dependencies_count = len(packages) - dependencies_count
-
-                if non_dependencies_count > 3:
-                    packages_string = _build_packages_string(
-                        packages[:2],
-                        other_package_count=non_dependencies_count - 2,
-                        dependency_count=dependencies_count,
-                    )
-                else:
-                    packages_string = _build_packages_string(
-                        packages[:non_dependencies_count],
-                        dependency_count=dependencies_count,
-                    )
-
-                table.add_row(
-                    *(base_columns if n == 0 else [""] * len(base_columns)),
-                    action,
-                    packages_string,
-                )
-
-        elif entry.error:
-            table.add_row(*base_columns, "ERROR", entry.error)
+            table.add_column("COMMAND", style='yellow')
 
-        else:
-            table.add_row(*base_columns, "UNKNOWN", "")
+        table.add_column("ACTION", style='blue')
+        table.add_column("PACKAGES", style='yellow')
 
-    console.print(table)
+        with measure('format'):
+            for row in _iter_rows():
+                table.add_row(*row)
+
+        with measure('render'):
+            get_console().print(table)
+
+    else:
+        # Rows are written as soon as they are produced. Plain rows are padded to fixed widths, since they can not be
+        # aligned to the widest value.
+        widths = [6, 16, *([40] if show_commands else []), 9]
+
+        with measure('format'):
+            try:
+                for row in _iter_rows():
+                    if list_format == ListFormat.PLAIN:
+                        line = " ".join([*map(str.ljust, row[:-1], widths), row[-1]])
+                    else:
+                        line = "\t".join(row)
+                    sys.stdout.write(line + "\n")
+                sys.stdout.flush()
+            except BrokenPipeError:
+                # The reader has gone away, as 'head' does once it has read enough lines.
+                os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
 
 
 def _show_entry(entry: AptLogEntry):
+    import humanize
+    from rich import box
+    from rich.table import Table
+
+    console = get_console()
     table = Table(show_header=False, box=None)
     table.add_column(style='bold magenta')
     table.add_column(style='blue')
@@ -143,6 +460,9 @@ def _show_entry(entry: AptLogEntry):
     if entry.requested_by:
         table.add_row("USER", entry.requested_by)
 
+    if entry.key is not None:
+        table.add_row("KEY", f"[dim]{entry.key}")
+
     if entry.error:
         table.add_row("ERROR MESSAGE", entry.error)
 
@@ -175,18 +495,561 @@ def _show_entry(entry: AptLogEntry):
         console.print(table)
 
 
+def _get_entry_details(entry: AptLogEntry) -> 'AptLogEntryDetails':
+    from apt_log.details import get_entry_details
+
+    # The indexes of the dpkg and terminal logs are cached along with the entries.
+    return _with_cache(lambda cache: get_entry_details(entry, cache=cache))
+
+
+def _show_entry_details(entry: AptLogEntry):
+    from rich import box
+    from rich.table import Table
+
+    console = get_console()
+    details = _get_entry_details(entry)
+
+    if details.dpkg_status_changes:
+        table = Table(header_style='bold magenta', box=box.SIMPLE_HEAD)
+        table.add_column("TIME", style='green')
+        table.add_column("STATUS", style='blue')
+        table.add_column("PACKAGE", style='yellow')
+        table.add_column("VERSION", style='cyan')
+
+        for change in details.dpkg_status_changes:
+            table.add_row(change.date.strftime('%H:%M:%S'), change.status, change.package, change.version)
+
+        console.print(table)
+
+    if details.terminal_output:
+        console.rule("[bold magenta]TERMINAL OUTPUT", align='left')
+        console.print(details.terminal_output, markup=False, highlight=False)
+
+    for path in details.unreadable_log_paths:
+        console.print(f"Details unavailable from {path} (not readable)", style='dim', markup=False, highlight=False)
+
+
+def _find_entry(entry_ref: str) -> AptLogEntry:
+    if is_entry_key(entry_ref) or not entry_ref.isdigit():
+        key = entry_ref.lower()
+        return _query_server(lambda client: client.get_entry_by_key(key)) or _build_log().get_entry_by_key(key)
+
+    entry_id = int(entry_ref)
+
+    if (entry := _query_server(lambda client: client.get_entry_by_id(entry_id))) is not None:
+        return entry
+    elif settings.deduplicate:
+        # Entries are looked up without building the log by counting them, duplicates included.
+        return _build_log().get_entry_by_id(entry_id)
+    else:
+        return find_system_log_entry(entry_id)
+
+
+_DETAILS_OPTION = typer.Option(
+    "--details/--no-details",
+    show_default=False,
+    help="Show the dpkg status changes and terminal output of the transaction. [default: if it has failed]",
+)
+
+
 @app.command("show", help="Inspect a single log entry.")
 def show_entry(
-        entry_id: int = typer.Argument(
-            metavar="ENTRY_ID", help="The ID of the log entry.",
+        entry_ref: str = typer.Argument(
+            metavar="ENTRY_ID|KEY",
+            help="The ID of the log entry, or its key, which unlike the ID does not change when log files are deleted.",
         ),
+        *,
+        show_details: Annotated[Optional[bool], _DETAILS_OPTION] = None,
 ):
     try:
-        _show_entry(build_system_apt_log().get_entry_by_id(entry_id))
+        entry = _find_entry(entry_ref)
     except InvalidAptLogEntryIDError as err:
         raise ClickException(str(err)) from err
 
+    _show_entry(entry)
+    if show_details or (show_details is None and entry.error):
+        _show_entry_details(entry)
+
 
 @app.command("last", help="Inspect the last log entry.")
-def show_last_entry():
-    _show_entry(build_system_apt_log().get_last_entry())
+def show_last_entry(
+        *,
+        show_details: Annotated[Optional[bool], _DETAILS_OPTION] = None,
+):
+    entry = _query_server(lambda client: client.get_last_entry()) or find_last_system_log_entry()
+
+    if entry is None:
+        raise ClickException("The log is empty.")
+
+    _show_entry(entry)
+    if show_details or (show_details is None and entry.error):
+        _show_entry_details(entry)
+
+
+@app.command("package", help="Show the version history of a package.")
+def show_package_timeline(
+        package_name: str = typer.Argument(
+            metavar="PACKAGE_NAME", help="The name of the package (supports glob-style pattern matching).",
+        ),
+):
+    from rich import box
+    from rich.table import Table
+
+    console = get_console()
+    timelines = _query_server(lambda client: client.get_package_timelines(package_name))
+    if timelines is None:
+        timelines = _build_log().get_package_timelines(package_name)
+
+    if not timelines:
+        raise ClickException(f"No package matching '{package_name}' in the log.")
+
+    for name, timeline in timelines.items():
+        if len(timelines) > 1:
+            console.rule(f"[bold magenta]{name}", align='left')
+
+        table = Table(header_style='bold magenta', box=box.SIMPLE_HEAD)
+        table.add_column("ID", style='cyan')
+        table.add_column("DATE", style='green')
+        table.add_column("ACTION", style='blue')
+        table.add_column("ARCH", style='blue')
+        table.add_column("PREVIOUS VERSION", style='cyan dim')
+        table.add_column("VERSION", style='cyan')
+
+        for change in timeline:
+            table.add_row(
+                str(change.entry_id),
+                change.date.strftime('%Y-%m-%d %H:%M') if change.date is not None else "",
+                f"{change.action} [dim](automatic)[/dim]" if change.is_automatic else str(change.action),
+                change.architecture,
+                change.previous_version or "",
+                change.version,
+            )
+
+        console.print(table)
+
+
+def _parse_log_point(value: str | None) -> tuple[int | None, datetime | None]:
+    # Points of the log are given as either an entry ID or a date.
+    if value is None or value.isdigit():
+        return (None if value is None else int(value)), None
+
+    try:
+        return None, datetime.fromisoformat(value)
+    except ValueError as err:
+        raise typer.BadParameter(f"'{value}' is neither an entry ID nor a date.") from err
+
+
+@app.command("state", help="List the packages installed at a point of the log.")
+def show_state(
+        *,
+        at: Annotated[Optional[str], typer.Option(
+            "--at", "-a",
+            metavar='DATE|ENTRY_ID',
+            show_default=False,
+            help="Show the packages installed as of the given date or after the given entry. [default: now]",
+        )] = None,
+        package_name: Annotated[Optional[str], typer.Option(
+            "--package", "-p",
+            metavar='PACKAGE_NAME',
+            help="Filter packages by name (supports glob-style pattern matching).",
+        )] = None,
+):
+    from rich import box
+    from rich.table import Table
+
+    entry_id, date = _parse_log_point(at)
+
+    try:
+        state = _build_log().get_state(entry_id=entry_id, date=date)
+    except InvalidAptLogEntryIDError as err:
+        raise ClickException(str(err)) from err
+
+    pattern = None if package_name is None else compile_package_pattern(package_name)
+
+    table = Table(header_style='bold magenta', box=box.SIMPLE_HEAD)
+    table.add_column("PACKAGE", style='yellow')
+    table.add_column("ARCH", style='blue')
+    table.add_column("VERSION", style='cyan')
+
+    for package in sorted(state.values(), key=lambda package: (package.name, package.architecture)):
+        if pattern is None or pattern.match(package.name):
+            table.add_row(
+                f"{package.name} [dim](automatic)[/dim]" if package.is_automatic else package.name,
+                package.architecture,
+                package.version,
+            )
+
+    get_console().print(table)
+
+
+@app.command("diff", help="Compare the packages installed at two points of the log.")
+def show_state_diff(
+        old: str = typer.Argument(
+            metavar="OLD", help="A date or entry ID.",
+        ),
+        new: Optional[str] = typer.Argument(
+            None, metavar="[NEW]", help="A date or entry ID. [default: now]", show_default=False,
+        ),
+):
+    from rich import box
+    from rich.table import Table
+
+    old_entry_id, old_date = _parse_log_point(old)
+    new_entry_id, new_date = _parse_log_point(new)
+
+    try:
+        changes = _build_log().diff_states(old_entry_id, old_date, new_entry_id, new_date)
+    except InvalidAptLogEntryIDError as err:
+        raise ClickException(str(err)) from err
+
+    table = Table(header_style='bold magenta', box=box.SIMPLE_HEAD)
+    table.add_column("CHANGE", style='blue')
+    table.add_column("PACKAGE", style='yellow')
+    table.add_column("ARCH", style='blue')
+    table.add_column("OLD VERSION", style='cyan dim')
+    table.add_column("NEW VERSION", style='cyan')
+
+    for change in changes:
+        table.add_row(
+            "Installed" if change.old is None else "Removed" if change.new is None else "Changed",
+            change.name,
+            change.architecture,
+            change.old.version if change.old is not None else "",
+            change.new.version if change.new is not None else "",
+        )
+
+    get_console().print(table)
+
+
+@app.command("stats", help="Count entries and changed packages and summarize durations (in seconds) by group.")
+def show_stats(
+        *,
+        group_by: Annotated[Optional[list[StatsField]], typer.Option(
+            "--group-by", "-g",
+            help="Group by the given field (may be given several times).",
+        )] = None,
+        bucket: Annotated[DateBucket, typer.Option(
+            "--bucket", "-b",
+            help="Period by which to group dates.",
+        )] = DateBucket.MONTH,
+        start_date: Annotated[Optional[datetime], typer.Option(
+            "--start-date", "-s",
+            help="Count only entries younger than the given date.",
+        )] = None,
+        end_date: Annotated[Optional[datetime], typer.Option(
+            "--end-date", "-e",
+            help="Count only entries older than the given date.",
+        )] = None,
+        package_name: Annotated[Optional[str], typer.Option(
+            "--package", "-p",
+            metavar='PACKAGE_NAME',
+            help="Count only packages matching the name (supports glob-style pattern matching).",
+        )] = None,
+        stats_format: Annotated[ListFormat, typer.Option(
+            "--format", "-f",
+            help="Output format.",
+        )] = ListFormat.TABLE,
+):
+    group_by = group_by or []
+    groups = _build_log().get_stats(
+        group_by,
+        bucket,
+        start_date=start_date,
+        end_date=end_date,
+        package_name=package_name,
+    )
+
+    header = [*(str(group_field).upper() for group_field in group_by), "ENTRIES", "PACKAGES"]
+    header.extend(f"P{percentile:g} (s)" for percentile in DEFAULT_PERCENTILES)
+    rows = []
+
+    for group in groups:
+        percentiles = group.get_duration_percentiles(DEFAULT_PERCENTILES)
+        rows.append([
+            *group.key,
+            str(group.entry_count),
+            str(group.package_count),
+            *(f"{value:.1f}" for value in percentiles or ()),
+            *([""] * len(DEFAULT_PERCENTILES) if percentiles is None else ()),
+        ])
+
+    if stats_format == ListFormat.TABLE:
+        from rich import box
+        from rich.table import Table
+
+        table = Table(header_style='bold magenta', box=box.SIMPLE_HEAD)
+        for n, column in enumerate(header):
+            if n < len(group_by):
+                table.add_column(column, style='yellow', no_wrap=True)
+            else:
+                table.add_column(column, style='cyan', justify='right')
+
+        for row in rows:
+            table.add_row(*row)
+
+        get_console().print(table)
+
+    elif stats_format == ListFormat.TSV:
+        for row in [header, *rows]:
+            typer.echo("\t".join(row))
+
+    else:
+        widths = [max(map(len, column)) for column in zip(header, *rows, strict=True)]
+        for row in [header, *rows]:
+            typer.echo("  ".join(map(str.ljust, row, widths)).rstrip())
+
+
+fleet_app = typer.Typer(help="Query the logs of many hosts, collected in one subdirectory per host.")
+app.add_typer(fleet_app, name="fleet")
+
+
+@fleet_app.callback()
+def fleet_main(
+        *,
+        fleet_dir: Annotated[Path, typer.Option(
+            "--dir", "-d",
+            envvar="APT_LOG_FLEET_DIR",
+            exists=True,
+            file_okay=False,
+            help="Directory with a subdirectory of log files per host, named after the host.",
+        )],
+):
+    settings.fleet_dir = fleet_dir
+
+
+def _build_fleet_log() -> 'AptFleetLog':
+    from apt_log.fleet import build_fleet_log
+
+    with measure('build_log'):
+        return build_fleet_log(settings.fleet_dir, jobs=settings.jobs)
+
+
+@fleet_app.command("hosts", help="List the hosts and the periods covered by their logs.")
+def list_fleet_hosts():
+    from rich import box
+    from rich.table import Table
+
+    table = Table(header_style='bold magenta', box=box.SIMPLE_HEAD)
+    table.add_column("HOST", style='yellow')
+    table.add_column("ENTRIES", style='cyan', justify='right')
+    table.add_column("FIRST", style='green')
+    table.add_column("LAST", style='green')
+
+    for host in _build_fleet_log().hosts.values():
+        table.add_row(
+            host.name,
+            str(host.entry_count),
+            host.first_date.strftime('%Y-%m-%d %H:%M') if host.first_date is not None else "",
+            host.last_date.strftime('%Y-%m-%d %H:%M') if host.last_date is not None else "",
+        )
+
+    get_console().print(table)
+
+
+@fleet_app.command("changes", help="Show which hosts changed a package, and when.")
+def show_fleet_changes(
+        package_name: str = typer.Argument(
+            metavar="PACKAGE_NAME", help="The name of the package.",
+        ),
+        *,
+        start_date: Annotated[Optional[datetime], typer.Option(
+            "--start-date", "-s",
+            help="Show only changes younger than the given date.",
+        )] = None,
+        end_date: Annotated[Optional[datetime], typer.Option(
+            "--end-date", "-e",
+            help="Show only changes older than the given date.",
+        )] = None,
+        actions: Annotated[Optional[list[PackageAction]], typer.Option(
+            "--action",
+            case_sensitive=False,
+            help="Show only the given actions (may be given several times).",
+        )] = None,
+):
+    from rich import box
+    from rich.table import Table
+
+    changes_by_host = _build_fleet_log().get_changes(package_name, start_date, end_date, actions or None)
+
+    table = Table(header_style='bold magenta', box=box.SIMPLE_HEAD)
+    table.add_column("HOST", style='yellow')
+    table.add_column("ID", style='cyan')
+    table.add_column("DATE", style='green')
+    table.add_column("ACTION", style='blue')
+    table.add_column("PREVIOUS VERSION", style='cyan dim')
+    table.add_column("VERSION", style='cyan')
+
+    for host_name, changes in changes_by_host.items():
+        for n, change in enumerate(changes):
+            table.add_row(
+                host_name if n == 0 else "",
+                str(change.entry_id),
+                change.date.strftime('%Y-%m-%d %H:%M') if change.date is not None else "",
+                str(change.action),
+                change.previous_version or "",
+                change.version,
+            )
+        table.add_section()
+
+    get_console().print(table)
+
+
+@fleet_app.command("installed", help="Show which hosts have a package installed, and at which version.")
+def show_fleet_installed(
+        package_name: str = typer.Argument(
+            metavar="PACKAGE_NAME", help="The name of the package.",
+        ),
+        *,
+        version: Annotated[Optional[str], typer.Option(
+            "--version",
+            help="Show only hosts that are on the given version.",
+        )] = None,
+):
+    from rich import box
+    from rich.table import Table
+
+    installed_by_host = _build_fleet_log().get_installed_packages(package_name)
+
+    table = Table(header_style='bold magenta', box=box.SIMPLE_HEAD)
+    table.add_column("HOST", style='yellow')
+    table.add_column("ARCH", style='blue')
+    table.add_column("VERSION", style='cyan')
+
+    for host_name, packages in installed_by_host.items():
+        for package in packages:
+            if version is None or package.version == version:
+                table.add_row(host_name, package.architecture, package.version)
+
+    get_console().print(table)
+
+
+@app.command("follow", help="Inspect new log entries as they are written.")
+def follow_entries(
+        *,
+        poll_interval: Annotated[float, typer.Option(
+            "--interval", "-i",
+            min=0.1,
+            help="Seconds between checks for new entries (if inotify is not available).",
+        )] = 1.0,
+):
+    from apt_log.follow import build_followed_system_apt_log
+
+    console = get_console()
+    log, follower = build_followed_system_apt_log(_get_reader())
+
+    try:
+        for entry in follower.follow(log, poll_interval=poll_interval):
+            console.rule(f"[bold magenta]{entry.id}", align='left')
+            _show_entry(entry)
+    except KeyboardInterrupt:
+        pass
+
+
+@app.command("serve", help="Keep the log in memory and answer the queries of other apt-log commands.")
+def serve():
+    from apt_log.follow import build_followed_system_apt_log
+    from apt_log.server import AptLogServer, AptLogServerError
+
+    # The log files are read once, after which only new entries are read from the current log file.
+    with measure('build_log'):
+        log, follower = build_followed_system_apt_log(_get_reader())
+
+    socket_path = _get_socket_path()
+    typer.echo(f"Serving {len(log.entries)} entries on {socket_path}", err=True)
+
+    # Shut down cleanly when stopped by a service manager, which removes the socket
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    try:
+        AptLogServer(log, follower).serve(socket_path)
+    except AptLogServerError as err:
+        raise ClickException(str(err)) from err
+    except KeyboardInterrupt:
+        pass
+
+
+@app.command("export", help="Export APT log entries in a machine-readable format.")
+def export(
+        *,
+        start_date: Annotated[Optional[datetime], typer.Option(
+            "--start-date", "-s",
+            help="Export only entries younger than the given date.",
+        )] = None,
+        end_date: Annotated[Optional[datetime], typer.Option(
+            "--end-date", "-e",
+            help="Export only entries older than the given date.",
+        )] = None,
+        package_name: Annotated[Optional[str], typer.Option(
+            "--package", "-p",
+            metavar='PACKAGE_NAME',
+            help="Filter entries by the name of the package (supports glob-style pattern matching).",
+        )] = None,
+        architecture: Annotated[Optional[str], typer.Option(
+            "--architecture",
+            help="Filter entries by the architecture of the package.",
+        )] = None,
+        version: Annotated[Optional[str], typer.Option(
+            "--version",
+            help="Filter entries by the version of the package.",
+        )] = None,
+        actions: Annotated[Optional[list[PackageAction]], typer.Option(
+            "--action",
+            case_sensitive=False,
+            help="Filter entries by the action on the package (may be given several times).",
+        )] = None,
+        requested_by: Annotated[Optional[str], typer.Option(
+            "--requested-by", "-u",
+            metavar='USER',
+            help="Filter entries by the user who requested the transaction.",
+        )] = None,
+        command_pattern: Annotated[Optional[str], typer.Option(
+            "--command",
+            metavar='REGEX',
+            help="Filter entries by a regular expression that the command line must contain a match of.",
+        )] = None,
+        export_format: Annotated[ExportFormat, typer.Option(
+            "--format", "-f",
+            help="Output format. Arrow and Parquet require pyarrow.",
+        )] = ExportFormat.JSONL,
+        granularity: Annotated[ExportGranularity, typer.Option(
+            "--rows", "-r",
+            help="Write one row per log entry or per changed package.",
+        )] = ExportGranularity.ENTRY,
+        output: Annotated[Optional[Path], typer.Option(
+            "--output", "-o",
+            help="Write to the given file instead of the standard output.",
+        )] = None,
+):
+    from apt_log.export import export_entries
+
+    if command_pattern is not None:
+        try:
+            re.compile(command_pattern)
+        except re.error as err:
+            raise typer.BadParameter(f"Invalid regular expression: {err}", param_hint="'--command'") from err
+
+    query = AptLogQuery(
+        start_date=start_date,
+        end_date=end_date,
+        package_name=package_name,
+        architecture=architecture,
+        version=version,
+        actions=actions or None,
+        requested_by=requested_by,
+        command_pattern=command_pattern,
+    )
+
+    # The entries are streamed from the log files rather than taken from a log, so that they are not kept in memory
+    # (unless the log files are out of order, see AptLogReader.iter_matching_entries).
+    reader = AptLogReader(query=query, deduplicate=settings.deduplicate)
+    entries = reader.iter_matching_entries(*get_system_log_paths())
+
+    try:
+        if output is None:
+            export_entries(entries, sys.stdout.buffer, export_format, granularity)
+            sys.stdout.buffer.flush()
+        else:
+            with output.open('wb') as file:
+                export_entries(entries, file, export_format, granularity)
+    except ImportError as err:
+        raise ClickException(str(err)) from err
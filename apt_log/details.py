@@ -0,0 +1,256 @@
+import re
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Final, Iterator, Pattern, Sequence
+
+from apt_log.log import AptLogEntry
+from apt_log.reader import get_system_dpkg_log_paths, get_system_term_log_paths, open_log_file
+from apt_log.timing import measure
+
+if TYPE_CHECKING:
+    from apt_log.cache import AptLogCache
+
+CHUNK_SIZE: Final[int] = 1 << 16
+
+
+@dataclass(frozen=True, slots=True)
+class DpkgStatusChange:
+    date: datetime
+    status: str
+    package: str
+    version: str
+
+
+@dataclass
+class AptLogEntryDetails:
+    # What dpkg and the terminal logged during the transaction of an entry
+    dpkg_status_changes: list[DpkgStatusChange] = field(default_factory=list)
+    terminal_output: str = ""
+
+    # Log files that could not be read, such as the terminal log, which only root and the adm group may read
+    unreadable_log_paths: list[Path] = field(default_factory=list)
+
+
+@dataclass
+class LogFileIndex:
+    # Dates at which runs of dpkg (or APT) start in a log file and the byte offsets of their first lines, in
+    # chronological order
+    dates: list[datetime] = field(default_factory=list)
+    offsets: list[int] = field(default_factory=list)
+
+    def get_offset_range(self, start_date: datetime, end_date: datetime | None) -> tuple[int, int | None] | None:
+        # Returns the byte range of the runs that start within the given period, or of the first run that starts at or
+        # after the start date if there is no end date. The end is None if the range extends to the end of the file.
+        first = bisect_left(self.dates, start_date)
+        last = first + 1 if end_date is None else bisect_right(self.dates, end_date)
+
+        if first >= min(last, len(self.dates)):
+            return None
+
+        return self.offsets[first], self.offsets[last] if last < len(self.offsets) else None
+
+
+@dataclass(frozen=True)
+class TimeIndexedLog:
+    # Lines that start a run, with its date as first group
+    marker: Pattern[bytes]
+    date_format: str
+
+    def iter_markers(self, path: Path, offset: int = 0) -> Iterator[tuple[datetime, int]]:
+        # Scans the raw bytes from the given offset, which must be at the start of a line, for marker lines, without
+        # splitting the file into lines
+        buffer = b''
+
+        with open_log_file(path, 'rb') as file:
+            file.seek(offset)
+
+            while True:
+                chunk = file.read(CHUNK_SIZE)
+                buffer += chunk
+
+                # Search complete lines only, so that each search starts at the beginning of a line.
+                end = len(buffer) if not chunk else buffer.rfind(b'\n') + 1
+                for match in self.marker.finditer(buffer, 0, end):
+                    yield datetime.strptime(match[1].decode(), self.date_format), offset + match.start()
+
+                if not chunk:
+                    break
+
+                offset += end
+                buffer = buffer[end:]
+
+    def get_first_date(self, path: Path, cache: 'AptLogCache | None' = None) -> datetime | None:
+        # Taken from the cached index of the log file if there is one, which saves decompressing compressed log files
+        if cache is not None and (index := self._get_cached_index(path, cache)) is not None:
+            return index.dates[0] if index.dates else None
+
+        return next((date for date, _ in self.iter_markers(path)), None)
+
+    def build_index(self, path: Path, index: LogFileIndex | None = None) -> LogFileIndex:
+        # Indexes the log file, or extends the given index of the file before something has been appended to it. Its
+        # last run is indexed again, since it may have been incomplete.
+        if index is not None and index.offsets:
+            offset = index.offsets[-1]
+            index = LogFileIndex(index.dates[:-1], index.offsets[:-1])
+        else:
+            offset = 0
+            index = LogFileIndex()
+
+        run_count = len(index.offsets)
+
+        with measure('index'):
+            for date, marker_offset in self.iter_markers(path, offset):
+                index.dates.append(date)
+                index.offsets.append(marker_offset)
+
+        # The last run is expected where it has been, or else the file has been replaced in between.
+        if offset > 0 and index.offsets[run_count:run_count + 1] != [offset]:
+            return self.build_index(path)
+
+        return index
+
+    @staticmethod
+    def _get_cached_index(path: Path, cache: 'AptLogCache') -> LogFileIndex | None:
+        from apt_log.cache import LogFileIdentity
+
+        cached_identity, index = cache.get_index(str(path.absolute())) or (None, None)
+        return index if cached_identity == LogFileIdentity.of(path) else None
+
+    def get_index(self, path: Path, cache: 'AptLogCache | None' = None) -> LogFileIndex:
+        # Indexes are cached by the identity of the log file, so that the file is not scanned again unless it changes.
+        # The current log files, which dpkg and APT append to, are only scanned from their last run on then.
+        if cache is None:
+            return self.build_index(path)
+
+        from apt_log.cache import LogFileIdentity
+
+        identity = LogFileIdentity.of(path)
+        cached_identity, index = cache.get_index(identity.path) or (None, None)
+
+        if cached_identity == identity:
+            return index
+
+        if (
+            cached_identity is not None and cached_identity.inode == identity.inode
+            and cached_identity.size < identity.size and path.suffix != '.gz'
+        ):
+            index = self.build_index(path, index)
+        else:
+            index = self.build_index(path)
+
+        cache.put_index(identity, index)
+        return index
+
+    def read(
+            self,
+            paths: Sequence[Path],
+            start_date: datetime,
+            end_date: datetime | None = None,
+            cache: 'AptLogCache | None' = None,
+    ) -> Iterator[bytes]:
+        # Reads the runs that start in the given period from the log files, given oldest first. Only the log files that
+        # may contain the period are indexed, which the dates of their first runs tell, and only the runs themselves
+        # are read by seeking to them. Without a cache, those log files are scanned for the index every time. (Seeking
+        # in compressed log files decompresses everything before the position as well.)
+        first_dates = [self.get_first_date(path, cache) for path in paths]
+
+        for n, (path, first_date) in enumerate(zip(paths, first_dates, strict=True)):
+            next_date = next((date for date in first_dates[n + 1:] if date is not None), None)
+
+            if first_date is None or (end_date is not None and first_date > end_date):
+                continue
+            if next_date is not None and next_date <= start_date:
+                continue
+
+            offset_range = self.get_index(path, cache).get_offset_range(start_date, end_date)
+            if offset_range is None:
+                continue
+
+            start_offset, end_offset = offset_range
+            with open_log_file(path, 'rb') as file:
+                file.seek(start_offset)
+                yield file.read() if end_offset is None else file.read(end_offset - start_offset)
+
+            # Without an end date, only the first run after the start date is read.
+            if end_date is None:
+                return
+
+
+DPKG_LOG: Final[TimeIndexedLog] = TimeIndexedLog(
+    re.compile(rb'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d) startup ', re.MULTILINE),
+    '%Y-%m-%d %H:%M:%S',
+)
+TERM_LOG: Final[TimeIndexedLog] = TimeIndexedLog(
+    re.compile(rb'^Log started: (\d{4}-\d\d-\d\d  \d\d:\d\d:\d\d)', re.MULTILINE),
+    '%Y-%m-%d  %H:%M:%S',
+)
+
+_TERM_LOG_MARKER_LINE: Final[Pattern] = re.compile(r'^Log (started|ended): .*\n?', re.MULTILINE)
+
+
+def parse_dpkg_status_changes(
+        raw_log: bytes,
+        start_date: datetime,
+        end_date: datetime | None = None,
+) -> list[DpkgStatusChange]:
+    # Lines look like '2023-01-01 10:00:05 status installed openssl:amd64 3.0.1'.
+    changes = []
+
+    for line in raw_log.decode(errors='replace').splitlines():
+        date_string, rest = line[:19], line[20:].split(' ')
+
+        if len(rest) != 4 or rest[0] != 'status':
+            continue
+
+        date = datetime.strptime(date_string, '%Y-%m-%d %H:%M:%S')
+        if date >= start_date and (end_date is None or date <= end_date):
+            changes.append(DpkgStatusChange(date, *rest[1:]))
+
+    return changes
+
+
+def _get_readable_paths(paths: Sequence[Path], unreadable_paths: list[Path]) -> list[Path]:
+    readable_paths = []
+
+    for path in paths:
+        try:
+            with open_log_file(path, 'rb'):
+                readable_paths.append(path)
+        except OSError:
+            unreadable_paths.append(path)
+
+    return readable_paths
+
+
+def get_entry_details(
+        entry: AptLogEntry,
+        dpkg_log_paths: Sequence[Path] | None = None,
+        term_log_paths: Sequence[Path] | None = None,
+        cache: 'AptLogCache | None' = None,
+) -> AptLogEntryDetails:
+    # Finds the dpkg status changes and terminal output of the transaction of the entry. Without an end date, as for
+    # interrupted transactions, the first runs of dpkg and APT that start with or after the transaction are taken. The
+    # indexes of the log files are kept in the given cache. Log files that can not be read are left out and listed in
+    # the details instead, so that whatever the others hold is still found.
+    details = AptLogEntryDetails()
+
+    if entry.start_date is None:
+        return details
+
+    if dpkg_log_paths is None:
+        dpkg_log_paths = get_system_dpkg_log_paths()
+    if term_log_paths is None:
+        term_log_paths = get_system_term_log_paths()
+
+    dpkg_log_paths = _get_readable_paths(dpkg_log_paths, details.unreadable_log_paths)
+    term_log_paths = _get_readable_paths(term_log_paths, details.unreadable_log_paths)
+
+    for raw_log in DPKG_LOG.read(dpkg_log_paths, entry.start_date, entry.end_date, cache):
+        details.dpkg_status_changes.extend(parse_dpkg_status_changes(raw_log, entry.start_date, entry.end_date))
+
+    terminal_output = b''.join(TERM_LOG.read(term_log_paths, entry.start_date, entry.end_date, cache))
+    details.terminal_output = _TERM_LOG_MARKER_LINE.sub('', terminal_output.decode(errors='replace')).strip()
+
+    return details
@@ -0,0 +1,160 @@
+import csv
+import enum
+import io
+import json
+from datetime import datetime
+from itertools import islice
+from typing import Any, BinaryIO, Final, Iterable, Iterator
+
+from apt_log.log import AptLogEntry, PackageAction
+
+
+class ExportFormat(enum.StrEnum):
+    JSONL = "jsonl"
+    CSV = "csv"
+    ARROW = "arrow"
+    PARQUET = "parquet"
+
+
+class ExportGranularity(enum.StrEnum):
+    ENTRY = "entry"
+    PACKAGE = "package"
+
+
+ENTRY_COLUMNS: Final[tuple[str, ...]] = (
+    'id', 'key', 'start_date', 'end_date', 'command_line', 'requested_by', 'error',
+    *(f'{action.lower()}_count' for action in PackageAction),
+)
+PACKAGE_COLUMNS: Final[tuple[str, ...]] = (
+    'entry_id', 'entry_key', 'start_date', 'end_date', 'command_line', 'requested_by',
+    'action', 'name', 'architecture', 'version', 'previous_version', 'is_automatic',
+)
+
+# Columns that are neither dates nor strings in columnar formats
+_INTEGER_COLUMNS: Final[frozenset[str]] = frozenset(
+    ('id', 'entry_id', *(f'{action.lower()}_count' for action in PackageAction)),
+)
+_BOOLEAN_COLUMNS: Final[frozenset[str]] = frozenset(('is_automatic',))
+_DATE_COLUMNS: Final[frozenset[str]] = frozenset(('start_date', 'end_date'))
+
+
+def iter_entry_rows(entries: Iterable[AptLogEntry]) -> Iterator[dict[str, Any]]:
+    for entry in entries:
+        changed_packages_by_action = entry.changed_packages_by_action
+
+        yield {
+            'id': entry.id,
+            'key': entry.key,
+            'start_date': entry.start_date,
+            'end_date': entry.end_date,
+            'command_line': entry.command_line,
+            'requested_by': entry.requested_by,
+            'error': entry.error,
+            **{
+                f'{action.lower()}_count': len(changed_packages_by_action.get(action, ()))
+                for action in PackageAction
+            },
+        }
+
+
+def iter_package_rows(entries: Iterable[AptLogEntry]) -> Iterator[dict[str, Any]]:
+    for entry in entries:
+        for action, packages in entry.changed_packages_by_action.items():
+            for package in packages:
+                yield {
+                    'entry_id': entry.id,
+                    'entry_key': entry.key,
+                    'start_date': entry.start_date,
+                    'end_date': entry.end_date,
+                    'command_line': entry.command_line,
+                    'requested_by': entry.requested_by,
+                    'action': str(action),
+                    'name': package.name,
+                    'architecture': package.architecture,
+                    'version': package.version,
+                    'previous_version': package.previous_version,
+                    'is_automatic': package.is_automatic,
+                }
+
+
+def _format_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _write_jsonl(rows: Iterable[dict[str, Any]], file: io.TextIOBase):
+    for row in rows:
+        file.write(json.dumps({key: _format_value(value) for key, value in row.items()}))
+        file.write('\n')
+
+
+def _write_csv(rows: Iterable[dict[str, Any]], file: io.TextIOBase, columns: tuple[str, ...]):
+    writer = csv.DictWriter(file, fieldnames=columns)
+    writer.writeheader()
+
+    for row in rows:
+        writer.writerow({key: _format_value(value) for key, value in row.items()})
+
+
+def _write_columnar(
+        rows: Iterable[dict[str, Any]],
+        file: BinaryIO,
+        columns: tuple[str, ...],
+        export_format: ExportFormat,
+        batch_size: int,
+):
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as err:
+        raise ImportError(f"Exporting to {export_format} requires pyarrow (pip install 'apt-log[arrow]').") from err
+
+    # Dates are stored as typed timestamps and strings as dictionaries, since most of them recur in many rows.
+    schema = pa.schema([
+        pa.field(column, (
+            pa.int64() if column in _INTEGER_COLUMNS else
+            pa.bool_() if column in _BOOLEAN_COLUMNS else
+            pa.timestamp('s') if column in _DATE_COLUMNS else
+            pa.dictionary(pa.int32(), pa.string())
+        ))
+        for column in columns
+    ])
+
+    if export_format == ExportFormat.PARQUET:
+        writer = pyarrow.parquet.ParquetWriter(file, schema)
+    else:
+        writer = pyarrow.ipc.new_stream(file, schema)
+
+    with writer:
+        rows = iter(rows)
+        while batch := list(islice(rows, batch_size)):
+            writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+
+
+def export_entries(
+        entries: Iterable[AptLogEntry],
+        file: BinaryIO,
+        export_format: ExportFormat = ExportFormat.JSONL,
+        granularity: ExportGranularity = ExportGranularity.ENTRY,
+        batch_size: int = 10_000,
+):
+    # Writes one row per entry or per changed package. Rows are produced and written as the entries are consumed,
+    # columnar formats in batches of the given size, so the memory use does not depend on the number of entries.
+    if granularity == ExportGranularity.ENTRY:
+        rows, columns = iter_entry_rows(entries), ENTRY_COLUMNS
+    else:
+        rows, columns = iter_package_rows(entries), PACKAGE_COLUMNS
+
+    if export_format in (ExportFormat.ARROW, ExportFormat.PARQUET):
+        _write_columnar(rows, file, columns, export_format, batch_size)
+        return
+
+    text_file = io.TextIOWrapper(file, encoding='utf-8', newline='', write_through=True)
+    try:
+        if export_format == ExportFormat.CSV:
+            _write_csv(rows, text_file, columns)
+        else:
+            _write_jsonl(rows, text_file)
+    finally:
+        # Leave the binary file open for the caller
+        text_file.detach()
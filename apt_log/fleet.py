@@ -0,0 +1,206 @@
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from sys import intern
+from typing import Callable, Collection, Iterator, TypeVar
+
+from apt_log.log import (
+    MAX_TIMESTAMP,
+    MIN_TIMESTAMP,
+    AptLog,
+    AptLogQuery,
+    InstalledPackage,
+    PackageAction,
+    PackageChange,
+    PackageState,
+    date_to_timestamp,
+)
+from apt_log.reader import LOG_FILE_GLOB_PATTERN, AptLogReader, get_log_paths
+from apt_log.timing import measure
+
+T = TypeVar('T')
+
+
+def get_host_log_dirs(root_dir: Path) -> dict[str, Path]:
+    # The logs of each host are expected in a subdirectory that is named after the host.
+    return {
+        path.name: path
+        for path in sorted(root_dir.iterdir())
+        if path.is_dir() and next(path.glob(LOG_FILE_GLOB_PATTERN), None) is not None
+    }
+
+
+@dataclass
+class FleetHost:
+    name: str
+    log_dir: Path
+
+    entry_count: int = 0
+    first_date: datetime | None = None
+    last_date: datetime | None = None
+
+
+@dataclass(slots=True)
+class HostPackageSummary:
+    # What the log of a host tells about a package: the packages of that name that are installed at its end (one per
+    # architecture) and the start dates of the entries that changed it, as ascending timestamps. The changes themselves
+    # are not kept, but read from the log of the host when they are asked for.
+    installed: tuple[InstalledPackage, ...] = ()
+    change_timestamps: array = field(default_factory=lambda: array('q'))
+
+    def has_changes_between(self, start_timestamp: int | None, end_timestamp: int | None) -> bool:
+        if start_timestamp is None and end_timestamp is None:
+            return True
+
+        n = bisect_left(self.change_timestamps, MIN_TIMESTAMP if start_timestamp is None else start_timestamp)
+        return n < len(self.change_timestamps) and self.change_timestamps[n] <= (
+            MAX_TIMESTAMP if end_timestamp is None else end_timestamp
+        )
+
+
+def _summarize_log(log: AptLog) -> dict[str, HostPackageSummary]:
+    summaries = {}
+    state: PackageState = {}
+
+    for entry in log.entries:
+        for packages in entry.changed_packages_by_action.values():
+            for package in packages:
+                summary = summaries.setdefault(package.name, HostPackageSummary())
+                if entry.start_timestamp is not None:
+                    summary.change_timestamps.append(entry.start_timestamp)
+
+        # Installed packages are replayed like for the state of a single log.
+        entry.apply_to_state(state)
+
+    for (package_name, _), package in sorted(state.items()):
+        summary = summaries[package_name]
+        summary.installed = (*summary.installed, package)
+
+    return summaries
+
+
+def _index_host(reader: AptLogReader, host: FleetHost) -> tuple[FleetHost, dict[str, HostPackageSummary]]:
+    # Parses the logs of a single host and returns a summary by package only. Its entries are discarded, so that
+    # their package lists do not need to be kept (or passed between processes).
+    log = replace(reader, host=host.name).build_log(*get_log_paths(host.log_dir))
+
+    if log.entries:
+        host = replace(
+            host,
+            entry_count=len(log.entries),
+            first_date=log.entries[0].start_date,
+            last_date=log.entries[-1].start_date,
+        )
+
+    return host, _summarize_log(log)
+
+
+def _read_host_changes(reader: AptLogReader, query: AptLogQuery, host: FleetHost) -> list[PackageChange]:
+    # Reads the changes of the package of the query from the logs of a single host. Only the matching packages are
+    # built (see AptLogReader.query), which keeps their entry IDs.
+    log = replace(reader, host=host.name, query=query).build_log(*get_log_paths(host.log_dir))
+
+    return [
+        change for change in log.get_package_timeline(query.package_name)
+        if (query.start_date is None or (change.date is not None and change.date >= query.start_date))
+        and (query.end_date is None or (change.date is not None and change.date <= query.end_date))
+    ]
+
+
+def _map_hosts(function: Callable[[FleetHost], T], hosts: list[FleetHost], jobs: int | None) -> Iterator[T]:
+    if (jobs is None or jobs > 1) and len(hosts) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Hosts are handed to the processes in chunks, since the logs of a single host are quickly parsed.
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            yield from executor.map(function, hosts, chunksize=8)
+    else:
+        yield from map(function, hosts)
+
+
+@dataclass
+class AptFleetLog:
+    hosts: dict[str, FleetHost] = field(default_factory=dict)
+
+    # Maps package names to the hosts with changes of the package and their summaries of it. The index is shared by
+    # all hosts, which answers questions about a package across hosts with a single lookup. Its size depends on the
+    # number of packages per host, not on the number of changes.
+    package_index: dict[str, dict[str, HostPackageSummary]] = field(default_factory=dict)
+
+    reader: AptLogReader = field(default_factory=AptLogReader, repr=False)
+    jobs: int | None = 1
+
+    # Installed packages that are equal across hosts, which most are, share a single instance.
+    _installed_packages: dict[InstalledPackage, InstalledPackage] = field(default_factory=dict, init=False, repr=False)
+
+    def add_host(self, host: FleetHost, summaries: dict[str, HostPackageSummary]):
+        self.hosts[host.name] = host
+
+        for package_name, summary in summaries.items():
+            summary.installed = tuple(
+                self._installed_packages.setdefault(package, package) for package in summary.installed
+            )
+            self.package_index.setdefault(intern(package_name), {})[host.name] = summary
+
+    def get_host_log(self, host_name: str) -> AptLog:
+        # Builds the complete log of a single host, with all entries tagged with the host
+        host = self.hosts[host_name]
+        return replace(self.reader, host=host_name).build_log(*get_log_paths(host.log_dir))
+
+    def get_changes(
+            self,
+            package_name: str,
+            start_date: datetime | None = None,
+            end_date: datetime | None = None,
+            actions: Collection[PackageAction] | None = None,
+    ) -> dict[str, list[PackageChange]]:
+        # Returns the changes of the package in the given period by host, for hosts with such changes only. The changes
+        # are read from the logs of those hosts whose summaries have changes in the period.
+        start_timestamp = None if start_date is None else date_to_timestamp(start_date)
+        end_timestamp = None if end_date is None else date_to_timestamp(end_date)
+
+        hosts = [
+            self.hosts[host_name] for host_name, summary in sorted(self.package_index.get(package_name, {}).items())
+            if summary.has_changes_between(start_timestamp, end_timestamp)
+        ]
+        query = AptLogQuery(start_date=start_date, end_date=end_date, package_name=package_name, actions=actions)
+
+        with measure('read_changes'):
+            changes = _map_hosts(partial(_read_host_changes, self.reader, query), hosts, self.jobs)
+            return {host.name: host_changes for host, host_changes in zip(hosts, changes, strict=True) if host_changes}
+
+    def get_installed_packages(self, package_name: str) -> dict[str, list[InstalledPackage]]:
+        # Returns the installed packages of the given name (one per architecture) by host, as of the end of their logs
+        return {
+            host_name: list(summary.installed)
+            for host_name, summary in sorted(self.package_index.get(package_name, {}).items())
+            if summary.installed
+        }
+
+    def get_hosts_on_version(self, package_name: str, version: str) -> list[str]:
+        return [
+            host_name for host_name, packages in self.get_installed_packages(package_name).items()
+            if any(package.version == version for package in packages)
+        ]
+
+
+def build_fleet_log(
+        root_dir: Path,
+        jobs: int | None = 1,
+        reader: AptLogReader | None = None,
+) -> AptFleetLog:
+    # Reads the logs of all hosts below the root directory in parallel processes. Only one host's entries at a time
+    # are held in memory per process, while the fleet log keeps the package index.
+    reader = reader or AptLogReader()
+    log_dirs = get_host_log_dirs(root_dir)
+    fleet_log = AptFleetLog(reader=reader, jobs=jobs)
+    hosts = [FleetHost(host_name, log_dir) for host_name, log_dir in log_dirs.items()]
+
+    with measure('build_fleet_log'):
+        for host, summaries in _map_hosts(partial(_index_host, reader), hosts, jobs):
+            fleet_log.add_host(host, summaries)
+
+    return fleet_log
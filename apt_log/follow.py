@@ -0,0 +1,174 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import time
+from dataclasses import dataclass, field
+from itertools import chain
+from pathlib import Path
+from typing import BinaryIO, Final, Iterator
+
+from apt_log.log import AptLog, AptLogEntry
+from apt_log.reader import AptLogReader, get_current_system_log_path, get_system_log_paths
+
+# inotify(7) events on the log directory that may indicate new log content
+_IN_MODIFY: Final[int] = 0x002
+_IN_CLOSE_WRITE: Final[int] = 0x008
+_IN_MOVED_FROM: Final[int] = 0x040
+_IN_MOVED_TO: Final[int] = 0x080
+_IN_CREATE: Final[int] = 0x100
+_IN_DELETE: Final[int] = 0x200
+_IN_NONBLOCK: Final[int] = os.O_NONBLOCK
+_IN_CLOEXEC: Final[int] = os.O_CLOEXEC
+
+
+class _InotifyWatch:
+
+    def __init__(self, directory: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+        self._fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), mask) < 0:
+            os.close(self._fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout: float):
+        # The events themselves are of no interest, since the log file is checked for changes after any event.
+        if select.select([self._fd], [], [], timeout)[0]:
+            try:
+                while os.read(self._fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        os.close(self._fd)
+
+
+@dataclass
+class AptLogFollower:
+    path: Path
+    reader: AptLogReader = field(default_factory=AptLogReader)
+
+    # Byte offset up to which the log file has been read
+    offset: int = 0
+
+    _file: BinaryIO | None = field(default=None, init=False, repr=False)
+    _inode: int | None = field(default=None, init=False, repr=False)
+    _buffer: bytes = field(default=b'', init=False, repr=False)
+
+    def _open(self) -> bool:
+        try:
+            self._file = self.path.open('rb')
+        except FileNotFoundError:
+            return False
+
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self._file.seek(self.offset)
+        return True
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _read(self) -> list[str]:
+        # Reads everything appended since the last read and returns the complete log entries. Since APT writes an entry
+        # over the course of a transaction, the lines of an entry without End-Date are held back until either its
+        # End-Date line or the blank line that precedes the next entry is written.
+        self._buffer += self._file.read()
+        self.offset = self._file.tell()
+
+        *lines, partial_line = self._buffer.split(b'\n')
+        log_entries = []
+        block: list[bytes] = []
+
+        for line in lines:
+            if line:
+                block.append(line)
+
+            if block and (not line or line.startswith(b'End-Date: ')):
+                log_entries.append(b'\n'.join(block).decode(errors='replace'))
+                block = []
+
+        self._buffer = b'\n'.join([*block, partial_line])
+        return log_entries
+
+    def _flush(self) -> list[str]:
+        # Returns whatever is left of an incomplete entry, once the log file is not going to be written to anymore
+        log_entries = list(self.reader.read_log_entries(self._buffer.decode(errors='replace')))
+        self._buffer = b''
+        return log_entries
+
+    def read_new_entries(self) -> list[AptLogEntry]:
+        log_entries = []
+
+        if self._file is None and not self._open():
+            return []
+
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            stat = None
+
+        if stat is not None and stat.st_ino != self._inode:
+            # The log file has been rotated by renaming it and creating a new one. Read the rest of the old file
+            # before switching to the new one.
+            log_entries.extend(self._read())
+            log_entries.extend(self._flush())
+            self._close()
+            self.offset = 0
+            self._open()
+        elif stat is not None and stat.st_size < self.offset:
+            # The log file has been rotated by copying and truncating it. Start over from the beginning.
+            self._buffer = b''
+            self.offset = 0
+            self._file.seek(0)
+
+        if self._file is not None:
+            log_entries.extend(self._read())
+
+        return [self.reader.parse_log_entry(log_entry) for log_entry in log_entries]
+
+    def follow(self, log: AptLog | None = None, poll_interval: float = 1.0) -> Iterator[AptLogEntry]:
+        # Yields new entries as they are written to the log file. If a log is given, the entries are appended to it,
+        # which assigns them IDs that continue those of the log. Uses inotify if available and polling otherwise.
+        try:
+            watch = _InotifyWatch(self.path.parent)
+        except (OSError, AttributeError, TypeError):
+            watch = None
+
+        try:
+            while True:
+                for entry in self.read_new_entries():
+                    if log is not None:
+                        log.append(entry)
+                    yield entry
+
+                if watch is not None:
+                    watch.wait(poll_interval)
+                else:
+                    time.sleep(poll_interval)
+        finally:
+            if watch is not None:
+                watch.close()
+            self._close()
+
+
+def build_followed_system_apt_log(reader: AptLogReader | None = None) -> tuple[AptLog, AptLogFollower]:
+    # Builds the log from all system log files, reading the current log file through a follower, which then continues
+    # where the log ends.
+    reader = reader or AptLogReader()
+    follower = AptLogFollower(get_current_system_log_path(), reader=reader)
+
+    rotated_paths = [path for path in get_system_log_paths() if path != follower.path]
+    log = AptLog(
+        chain(reader.parse_log_files(*rotated_paths), follower.read_new_entries()),
+        deduplicate=reader.deduplicate,
+    )
+
+    return log, follower
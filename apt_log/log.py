@@ -1,8 +1,20 @@
 import enum
-from dataclasses import dataclass, field, replace
+import operator
+import re
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from copy import copy
+from dataclasses import dataclass, field, fields
 from datetime import datetime, timedelta
-from fnmatch import fnmatch
-from typing import Collection, Iterable, Iterator
+from fnmatch import translate
+from functools import cached_property, lru_cache
+from itertools import accumulate, chain, islice
+from typing import TYPE_CHECKING, Callable, Collection, Final, Iterable, Iterator, Pattern, Sequence
+
+from apt_log.timing import measure
+
+if TYPE_CHECKING:
+    from apt_log.stats import DateBucket, StatsField, StatsGroup
 
 
 class PackageAction(enum.StrEnum):
@@ -14,7 +26,54 @@ class PackageAction(enum.StrEnum):
     PURGE = "Purge"
 
 
-@dataclass
+# Dates of entries are kept as integer timestamps, the seconds since 1970-01-01 in the (naive) local time that APT logs,
+# and only turned into datetimes when they are accessed. Dates in logs have a resolution of seconds.
+_EPOCH: Final[datetime] = datetime(1970, 1, 1)
+_EPOCH_ORDINAL: Final[int] = _EPOCH.toordinal()
+
+
+def date_to_timestamp(date: datetime) -> int:
+    # Rounds down to whole seconds
+    return (date.toordinal() - _EPOCH_ORDINAL) * 86400 + date.hour * 3600 + date.minute * 60 + date.second
+
+
+def timestamp_to_date(timestamp: int) -> datetime:
+    return _EPOCH + timedelta(seconds=timestamp)
+
+
+MIN_TIMESTAMP: Final[int] = date_to_timestamp(datetime.min)
+MAX_TIMESTAMP: Final[int] = date_to_timestamp(datetime.max)
+
+
+class _TimestampDate:
+    # A date field of a dataclass that is stored as a timestamp in another attribute and read as a datetime
+
+    def __init__(self, timestamp_name: str):
+        self.timestamp_name = timestamp_name
+
+    def __get__(self, instance, owner=None) -> datetime | None:
+        if instance is None:
+            # The default of the field
+            return None
+
+        timestamp = instance.__dict__[self.timestamp_name]
+        return None if timestamp is None else timestamp_to_date(timestamp)
+
+    def __set__(self, instance, date: datetime | None):
+        instance.__dict__[self.timestamp_name] = None if date is None else date_to_timestamp(date)
+
+
+@lru_cache(maxsize=256)
+def compile_package_pattern(package_name: str) -> Pattern:
+    # Compiles a glob-style pattern for matching package names (like fnmatch.fnmatchcase)
+    return re.compile(translate(package_name))
+
+
+def is_package_pattern(package_name: str) -> bool:
+    return any(char in package_name for char in '*?[')
+
+
+@dataclass(slots=True)
 class ChangedPackage:
     name: str
     architecture: str
@@ -26,19 +85,75 @@ class ChangedPackage:
     is_automatic: bool = False
 
 
+@dataclass(slots=True)
+class PackageChange:
+    # A change of a single package in the timeline of that package
+    entry_id: int
+    date: datetime | None
+    action: PackageAction
+    architecture: str
+    version: str
+    previous_version: str | None = None
+    is_automatic: bool = False
+
+
+@dataclass(frozen=True, slots=True)
+class InstalledPackage:
+    name: str
+    architecture: str
+    version: str
+    is_automatic: bool = False
+
+
+# Installed packages by name and architecture
+PackageState = dict[tuple[str, str], InstalledPackage]
+
+
+@dataclass(frozen=True, slots=True)
+class PackageStateChange:
+    name: str
+    architecture: str
+
+    # The package is missing from either state if it has been installed or removed in between.
+    old: InstalledPackage | None
+    new: InstalledPackage | None
+
+
+def diff_package_states(old_state: PackageState, new_state: PackageState) -> list[PackageStateChange]:
+    # Returns the packages that have been installed, removed or changed their version, ordered by name
+    changes = []
+
+    for key in sorted(old_state.keys() | new_state.keys()):
+        old, new = old_state.get(key), new_state.get(key)
+        if old is None or new is None or old.version != new.version:
+            changes.append(PackageStateChange(*key, old, new))
+
+    return changes
+
+
 @dataclass
 class AptLogEntry:
     id: int | None = None
 
     changed_packages_by_action: dict[PackageAction, list[ChangedPackage]] = field(default_factory=dict)
 
-    start_date: datetime | None = None
-    end_date: datetime | None = None
+    start_date: datetime | None = _TimestampDate('start_timestamp')
+    end_date: datetime | None = _TimestampDate('end_timestamp')
 
     command_line: str | None = None
     requested_by: str | None = None
     error: str | None = None
 
+    # The host whose log the entry comes from, when the logs of several hosts are read
+    host: str | None = None
+
+    # A hash of the content of the entry in the log file, which identifies it regardless of its position in the log
+    key: str | None = field(default=None, compare=False)
+
+    # The dates as timestamps, which are set along with the dates (and may be set instead of them)
+    start_timestamp: int | None = field(init=False, repr=False, compare=False)
+    end_timestamp: int | None = field(init=False, repr=False, compare=False)
+
     def is_before(self, date: datetime) -> bool:
         return self.end_date is not None and self.end_date < date
 
@@ -47,10 +162,10 @@ class AptLogEntry:
 
     @property
     def duration(self) -> timedelta | None:
-        if self.start_date is None or self.end_date is None:
+        if self.start_timestamp is None or self.end_timestamp is None:
             return None
         else:
-            return self.end_date - self.start_date
+            return timedelta(seconds=self.end_timestamp - self.start_timestamp)
 
     def filter(
             self,
@@ -58,6 +173,20 @@ class AptLogEntry:
             architecture: str | None = None,
             version: str | None = None,
             actions: Collection[PackageAction] | None = None,
+    ) -> 'AptLogEntry':
+        return self._filter(
+            name_matches=None if package_name is None else compile_package_pattern(package_name).match,
+            architecture=architecture,
+            version=version,
+            actions=actions,
+        )
+
+    def _filter(
+            self,
+            name_matches: Callable[[str], object] | None,
+            architecture: str | None,
+            version: str | None,
+            actions: Collection[PackageAction] | None,
     ) -> 'AptLogEntry':
         changed_packages_by_action = {}
 
@@ -66,7 +195,7 @@ class AptLogEntry:
                 filtered_packages = [
                     package for package in changed_packages
                     if all((
-                        package_name is None or fnmatch(package.name, package_name),
+                        name_matches is None or name_matches(package.name),
                         architecture is None or architecture == package.architecture,
                         version is None or version == package.version,
                     ))
@@ -74,20 +203,186 @@ class AptLogEntry:
                 if filtered_packages:
                     changed_packages_by_action[action] = filtered_packages
 
-        return replace(self, changed_packages_by_action=changed_packages_by_action)
+        # Copy rather than replace the entry, which would convert its dates back and forth.
+        entry = copy(self)
+        entry.changed_packages_by_action = changed_packages_by_action
+        return entry
 
     def has_changed_packages(self) -> bool:
         return bool(self.changed_packages_by_action)
 
+    def apply_to_state(self, state: PackageState):
+        # Replays the changes of the entry on the given installed packages
+        for action, packages in self.changed_packages_by_action.items():
+            for package in packages:
+                key = (package.name, package.architecture)
+
+                if action in (PackageAction.REMOVE, PackageAction.PURGE):
+                    state.pop(key, None)
+                else:
+                    # Only installations record whether a package has been installed automatically.
+                    previous = state.get(key)
+                    if action != PackageAction.INSTALL and previous is not None:
+                        is_automatic = previous.is_automatic
+                    else:
+                        is_automatic = package.is_automatic
+
+                    state[key] = InstalledPackage(package.name, package.architecture, package.version, is_automatic)
+
     def has_version_changes(self) -> bool:
         return any(
             action in self.changed_packages_by_action for action in (PackageAction.UPGRADE, PackageAction.DOWNGRADE)
         )
 
 
+class LazyAptLogEntry(AptLogEntry):
+    # Keeps the raw package lists of the log entry and parses them on first access of changed_packages_by_action.
+    _raw_package_lists: dict[PackageAction, str] | None = None
+    _parse_package_list: Callable[[str, PackageAction], list[ChangedPackage]] | None = None
+
+    def set_raw_package_lists(
+            self,
+            raw_package_lists: dict[PackageAction, str],
+            parse_package_list: Callable[[str, PackageAction], list[ChangedPackage]],
+    ):
+        self._raw_package_lists = raw_package_lists
+        self._parse_package_list = parse_package_list
+
+    @property
+    def changed_packages_by_action(self) -> dict[PackageAction, list[ChangedPackage]]:
+        if self._raw_package_lists is not None:
+            self._changed_packages_by_action = {
+                action: self._parse_package_list(raw_packages, action)
+                for action, raw_packages in self._raw_package_lists.items()
+            }
+            self._raw_package_lists = self._parse_package_list = None
+
+        return self._changed_packages_by_action
+
+    @changed_packages_by_action.setter
+    def changed_packages_by_action(self, changed_packages_by_action: dict[PackageAction, list[ChangedPackage]]):
+        self._changed_packages_by_action = changed_packages_by_action
+        self._raw_package_lists = self._parse_package_list = None
+
+    def has_changed_packages(self) -> bool:
+        if self._raw_package_lists is not None:
+            return bool(self._raw_package_lists)
+        else:
+            return super().has_changed_packages()
+
+    def has_version_changes(self) -> bool:
+        if self._raw_package_lists is not None:
+            return any(action in self._raw_package_lists for action in (PackageAction.UPGRADE, PackageAction.DOWNGRADE))
+        else:
+            return super().has_version_changes()
+
+    def __eq__(self, other):
+        # Lazy entries are equal to eager ones with the same content, compared like eager entries are among each other.
+        if isinstance(other, AptLogEntry):
+            return all(getattr(self, f.name) == getattr(other, f.name) for f in fields(AptLogEntry) if f.compare)
+        else:
+            return NotImplemented
+
+
+@dataclass(frozen=True)
+class AptLogQuery:
+    # Selects entries that overlap the date range, were requested by the given user and whose command line contains a
+    # match of the regular expression, as well as those of their changed packages that match the glob-style pattern,
+    # architecture, version and actions. Unset fields select anything.
+    start_date: datetime | None = None
+    end_date: datetime | None = None
+    package_name: str | None = None
+    architecture: str | None = None
+    version: str | None = None
+    actions: Collection[PackageAction] | None = None
+    requested_by: str | None = None
+    command_pattern: str | None = None
+
+    def __post_init__(self):
+        if self.actions is not None:
+            object.__setattr__(self, 'actions', frozenset(self.actions))
+
+    @cached_property
+    def _name_matches(self) -> Callable[[str], object] | None:
+        return None if self.package_name is None else compile_package_pattern(self.package_name).match
+
+    @cached_property
+    def _command_search(self) -> Callable[[str], object] | None:
+        return None if self.command_pattern is None else re.compile(self.command_pattern).search
+
+    @cached_property
+    def _start_timestamp(self) -> int | None:
+        # Rounded up, so that entries that have ended before the start date in fractions of a second do not match
+        if self.start_date is None:
+            return None
+        return date_to_timestamp(self.start_date) + (self.start_date.microsecond > 0)
+
+    @cached_property
+    def _end_timestamp(self) -> int | None:
+        return None if self.end_date is None else date_to_timestamp(self.end_date)
+
+    def filters_packages(self) -> bool:
+        return any(value is not None for value in (self.package_name, self.architecture, self.version, self.actions))
+
+    def matches_timestamps(self, start_timestamp: int | None, end_timestamp: int | None) -> bool:
+        query_start, query_end = self._start_timestamp, self._end_timestamp
+        return not (
+            (query_start is not None and end_timestamp is not None and end_timestamp < query_start)
+            or (query_end is not None and start_timestamp is not None and start_timestamp > query_end)
+        )
+
+    def matches_header(self, requested_by: str | None, command_line: str | None) -> bool:
+        # APT logs the user as 'name (uid)', which is matched by either the name or the whole field.
+        if self.requested_by is not None and (
+            requested_by is None
+            or (self.requested_by != requested_by and self.requested_by != requested_by.split(' (', 1)[0])
+        ):
+            return False
+        elif self._command_search is not None:
+            return command_line is not None and bool(self._command_search(command_line))
+        else:
+            return True
+
+    def matches_entry(self, entry: AptLogEntry) -> bool:
+        return (
+            self.matches_timestamps(entry.start_timestamp, entry.end_timestamp)
+            and self.matches_header(entry.requested_by, entry.command_line)
+        )
+
+    def matches_action(self, action: PackageAction) -> bool:
+        return self.actions is None or action in self.actions
+
+    def matches_package(self, name: str, architecture: str, version: str) -> bool:
+        return (
+            (self._name_matches is None or bool(self._name_matches(name)))
+            and (self.architecture is None or self.architecture == architecture)
+            and (self.version is None or self.version == version)
+        )
+
+    def filter(self, entry: AptLogEntry) -> AptLogEntry | None:
+        # Returns the entry reduced to the matching packages, or None if it does not match
+        if not self.matches_entry(entry):
+            return None
+
+        if self.filters_packages():
+            entry = entry._filter(self._name_matches, self.architecture, self.version, self.actions)
+
+        return entry if entry.has_changed_packages() else None
+
+
+_ENTRY_KEY_FORMAT: Final[Pattern] = re.compile(r'[0-9a-fA-F]{16}')
+
+
+def is_entry_key(entry_ref: str) -> bool:
+    # Keys are 16 hexadecimal digits (see apt_log.reader.get_entry_key). Some consist of decimal digits only, which
+    # tells them apart from IDs by their length alone, since no log has that many entries.
+    return _ENTRY_KEY_FORMAT.fullmatch(entry_ref) is not None
+
+
 @dataclass
 class InvalidAptLogEntryIDError(Exception):
-    wrong_entry_id: int
+    # The ID or key of the entry
+    wrong_entry_id: int | str
 
     def __str__(self):
         return f"Invalid log entry: {self.wrong_entry_id}"
@@ -96,9 +391,36 @@ class InvalidAptLogEntryIDError(Exception):
 class AptLog:
     entries: list[AptLogEntry]
 
-    def __init__(self, entries: Iterable[AptLogEntry]):
-        # Sort entries chronologically
-        entries = sorted(entries, key=lambda entry: entry.start_date)
+    # Number of entries between snapshots of the installed packages, from which states are reconstructed
+    STATE_CHECKPOINT_INTERVAL: int = 256
+
+    def __init__(self, entries: Iterable[AptLogEntry], *, deduplicate: bool = False):
+        # Entries are indexed by key. If deduplicate is set, entries that are given more than once, such as those of
+        # overlapping copies of log files, are recognized by their keys and kept once only. (Entries without key are
+        # all kept.) Either is done in a single pass.
+        self._entries_by_key: dict[str, AptLogEntry] = {}
+        entries = self._index_keys(entries, self._entries_by_key, deduplicate=deduplicate)
+
+        start_timestamps = [entry.start_timestamp for entry in entries]
+        is_dated = None not in start_timestamps
+        if not is_dated:
+            start_timestamps = self._get_sort_timestamps(start_timestamps)
+
+        # Sort entries chronologically. Log files are chronological and do not overlap, so entries are usually in order
+        # already if they are given oldest log file first and form one ascending run per log file otherwise. The sort
+        # is skipped in the former case and merges the runs in the latter (as timsort does with runs). Like any stable
+        # sort, it keeps entries that started at the same time in their given order.
+        with measure('sort') as stage:
+            if not all(map(operator.le, start_timestamps, islice(start_timestamps, 1, None))):
+                if is_dated:
+                    entries.sort(key=operator.attrgetter('start_timestamp'))
+                    start_timestamps.sort()
+                else:
+                    order = sorted(range(len(entries)), key=start_timestamps.__getitem__)
+                    entries = [entries[n] for n in order]
+                    start_timestamps = [start_timestamps[n] for n in order]
+            if stage is not None:
+                stage.counts['entries'] += len(entries)
 
         # Assign entry IDs in ascending chronological order starting with 1
         for n, entry in enumerate(entries, 1):
@@ -106,6 +428,175 @@ class AptLog:
 
         self.entries = entries
 
+        # Index for resolving date ranges by bisection. Since entries are sorted by start date, entries that start after
+        # a given date form a suffix of the list. The running maximum of end dates is sorted as well and bounds the
+        # prefix of entries that have all ended before a given date. Entries without end date, such as interrupted
+        # transactions, have never ended and would hold the maximum for all later entries. They count as ended when
+        # they started instead and are listed separately, to be added to any range that starts after them.
+        # (Dates are compared as timestamps, which is cheaper than comparing datetimes.)
+        self._start_timestamps = start_timestamps
+        self._max_end_timestamps = list(accumulate(
+            (
+                start_timestamp if entry.end_timestamp is None else entry.end_timestamp
+                for start_timestamp, entry in zip(start_timestamps, entries, strict=True)
+            ),
+            max,
+        ))
+        self._unended_positions = [position for position, entry in enumerate(entries) if entry.end_timestamp is None]
+
+    @staticmethod
+    def _index_keys(
+            entries: Iterable[AptLogEntry],
+            entries_by_key: dict[str, AptLogEntry],
+            *,
+            deduplicate: bool,
+    ) -> list[AptLogEntry]:
+        kept_entries = []
+
+        with measure('index_keys'):
+            for entry in entries:
+                if (key := entry.key) is not None:
+                    if key not in entries_by_key:
+                        entries_by_key[key] = entry
+                    elif deduplicate:
+                        continue
+                kept_entries.append(entry)
+
+        return kept_entries
+
+    @staticmethod
+    def _get_sort_timestamps(start_timestamps: list[int | None]) -> list[int]:
+        # Entries without start date are sorted as if they had started along with the entry that precedes them (or
+        # before all entries if there is none), which keeps them in place among the entries of their log file.
+        sort_timestamps = []
+        timestamp = MIN_TIMESTAMP
+
+        for start_timestamp in start_timestamps:
+            if start_timestamp is not None:
+                timestamp = start_timestamp
+            sort_timestamps.append(timestamp)
+
+        return sort_timestamps
+
+    def _get_date_range(self, start_date: datetime | None, end_date: datetime | None) -> range:
+        # Returns the positions of entries that may overlap the given dates. Entries within the range may still have
+        # ended before the start date though, if an earlier entry ended later.
+        return range(
+            0 if start_date is None else bisect_left(self._max_end_timestamps, date_to_timestamp(start_date)),
+            len(self.entries) if end_date is None else bisect_right(
+                self._start_timestamps, date_to_timestamp(end_date),
+            ),
+        )
+
+    def _get_unended_positions(self, positions: range) -> list[int]:
+        # Returns the positions of entries without end date that precede the given date range, which overlap the dates
+        # all the same
+        return self._unended_positions[:bisect_left(self._unended_positions, min(positions.start, positions.stop))]
+
+    @cached_property
+    def _package_indexes(self) -> tuple[dict[str, list[int]], dict[str, list[int]]]:
+        # Maps package names and architectures to the ascending positions of the entries that contain them. The
+        # indexes are built on first use only, since this requires all package lists to be parsed.
+        name_index, architecture_index = defaultdict(list), defaultdict(list)
+
+        with measure('index'):
+            for position, entry in enumerate(self.entries):
+                self._index_packages(position, entry, name_index, architecture_index)
+
+        return name_index, architecture_index
+
+    @staticmethod
+    def _index_packages(
+            position: int,
+            entry: AptLogEntry,
+            name_index: dict[str, list[int]],
+            architecture_index: dict[str, list[int]],
+    ):
+        for packages in entry.changed_packages_by_action.values():
+            for package in packages:
+                for index, key in ((name_index, package.name), (architecture_index, package.architecture)):
+                    positions = index[key]
+                    if not positions or positions[-1] != position:
+                        positions.append(position)
+
+    @cached_property
+    def _package_timelines(self) -> dict[str, list[PackageChange]]:
+        # Maps package names to their changes in chronological order. Like the package indexes, the timelines of all
+        # packages are built in a single pass on first use.
+        timelines = defaultdict(list)
+
+        with measure('timelines'):
+            for entry in self.entries:
+                self._add_package_changes(entry, timelines)
+
+        return timelines
+
+    @staticmethod
+    def _add_package_changes(entry: AptLogEntry, timelines: dict[str, list[PackageChange]]):
+        start_date = entry.start_date
+
+        for packages in entry.changed_packages_by_action.values():
+            for package in packages:
+                timelines[package.name].append(PackageChange(
+                    entry.id,
+                    start_date,
+                    package.action,
+                    package.architecture,
+                    package.version,
+                    package.previous_version,
+                    package.is_automatic,
+                ))
+
+    def get_package_timeline(self, package_name: str) -> list[PackageChange]:
+        # Returns the changes of the package with the given name in chronological order
+        return list(self._package_timelines.get(package_name, ()))
+
+    def get_package_timelines(self, package_name: str) -> dict[str, list[PackageChange]]:
+        # Returns the timelines of all packages whose names match the given glob-style pattern, ordered by name
+        if is_package_pattern(package_name):
+            pattern = compile_package_pattern(package_name)
+            package_names = sorted(name for name in self._package_timelines if pattern.match(name))
+        else:
+            package_names = [package_name] if package_name in self._package_timelines else []
+
+        return {name: self.get_package_timeline(name) for name in package_names}
+
+    def get_package_names(self, package_name: str | None = None) -> set[str]:
+        # Returns the distinct names of all packages in the log that match the given glob-style pattern
+        name_index, _ = self._package_indexes
+
+        if package_name is None:
+            return set(name_index)
+        elif not is_package_pattern(package_name):
+            return {package_name} if package_name in name_index else set()
+        else:
+            pattern = compile_package_pattern(package_name)
+            return {name for name in name_index if pattern.match(name)}
+
+    def _get_indexed_positions(self, package_names: set[str] | None, architecture: str | None) -> list[int] | None:
+        if package_names is None and architecture is None:
+            return None
+
+        name_index, architecture_index = self._package_indexes
+        positions = None
+
+        if package_names is not None:
+            if len(package_names) == 1:
+                positions = name_index[next(iter(package_names))]
+            else:
+                positions = sorted(set(chain.from_iterable(name_index[name] for name in package_names)))
+
+        if architecture is not None:
+            architecture_positions = architecture_index.get(architecture, [])
+
+            if positions is None:
+                positions = architecture_positions
+            else:
+                architecture_positions = set(architecture_positions)
+                positions = [position for position in positions if position in architecture_positions]
+
+        return positions
+
     def get_entries(
             self,
             start_date: datetime | None = None,
@@ -114,19 +605,78 @@ class AptLog:
             architecture: str | None = None,
             version: str | None = None,
             actions: Collection[PackageAction] | None = None,
+            requested_by: str | None = None,
+            command_pattern: str | None = None,
+            *,
+            offset: int = 0,
+            limit: int | None = None,
+            reverse: bool = False,
     ) -> Iterator[AptLogEntry]:
-        for entry in self.entries:
-            if start_date is not None and entry.is_before(start_date):
+        query = AptLogQuery(
+            start_date, end_date, package_name, architecture, version, actions, requested_by, command_pattern,
+        )
+        return self.get_matching_entries(query, offset=offset, limit=limit, reverse=reverse)
+
+    def get_matching_entries(
+            self,
+            query: AptLogQuery,
+            *,
+            offset: int = 0,
+            limit: int | None = None,
+            reverse: bool = False,
+    ) -> Iterator[AptLogEntry]:
+        positions = self._get_date_range(query.start_date, query.end_date)
+        unended_positions = self._get_unended_positions(positions)
+        package_names = None if query.package_name is None else self.get_package_names(query.package_name)
+
+        # Look up entries that contain the requested packages in the index instead of filtering all entries.
+        indexed_positions = self._get_indexed_positions(package_names, query.architecture)
+        if indexed_positions is not None:
+            positions = indexed_positions[
+                bisect_left(indexed_positions, positions.start):bisect_left(indexed_positions, positions.stop)
+            ]
+            unended_positions = [
+                position for position in unended_positions
+                if (n := bisect_left(indexed_positions, position)) < len(indexed_positions)
+                and indexed_positions[n] == position
+            ]
+
+        if reverse:
+            positions = chain(reversed(positions), reversed(unended_positions))
+        else:
+            positions = chain(unended_positions, positions)
+
+        entries = self._filter_entries(positions, query, package_names)
+
+        # Entries are filtered only until the limit is reached.
+        yield from islice(entries, offset, None if limit is None else offset + limit)
+
+    def _filter_entries(
+            self,
+            positions: Iterable[int],
+            query: AptLogQuery,
+            package_names: set[str] | None,
+    ) -> Iterator[AptLogEntry]:
+        filters_packages = query.filters_packages()
+
+        for position in positions:
+            entry = self.entries[position]
+
+            if not query.matches_entry(entry):
                 continue
 
-            if end_date is not None and entry.is_after(end_date):
+            # Without package filters, there is no need to copy the entry (or to parse its packages, if it is lazy).
+            if not filters_packages:
+                if entry.has_changed_packages():
+                    yield entry
                 continue
 
-            filtered_entry = entry.filter(
-                package_name=package_name,
-                architecture=architecture,
-                version=version,
-                actions=actions,
+            # The names have already been matched against the pattern in the index.
+            filtered_entry = entry._filter(
+                name_matches=None if package_names is None else package_names.__contains__,
+                architecture=query.architecture,
+                version=query.version,
+                actions=query.actions,
             )
 
             if filtered_entry.has_changed_packages():
@@ -138,5 +688,120 @@ class AptLog:
         except IndexError as err:
             raise InvalidAptLogEntryIDError(entry_id) from err
 
+    def get_entry_by_key(self, key: str) -> AptLogEntry:
+        try:
+            return self._entries_by_key[key]
+        except KeyError as err:
+            raise InvalidAptLogEntryIDError(key) from err
+
+    @cached_property
+    def _state_checkpoints(self) -> list[PackageState]:
+        # The n-th checkpoint holds the packages installed after the first n * STATE_CHECKPOINT_INTERVAL entries.
+        checkpoints = [{}]
+        state = {}
+
+        with measure('checkpoints'):
+            for position, entry in enumerate(self.entries, 1):
+                entry.apply_to_state(state)
+                if position % self.STATE_CHECKPOINT_INTERVAL == 0:
+                    checkpoints.append(state.copy())
+
+        return checkpoints
+
+    def _get_state(self, position: int, state: PackageState | None = None, state_position: int = 0) -> PackageState:
+        # Returns the packages installed after the entries before the given position. They are replayed from the
+        # nearest checkpoint, or from the given state at an earlier position if that is nearer.
+        checkpoints = self._state_checkpoints
+        checkpoint = min(position // self.STATE_CHECKPOINT_INTERVAL, len(checkpoints) - 1)
+        checkpoint_position = checkpoint * self.STATE_CHECKPOINT_INTERVAL
+
+        if state is None or not checkpoint_position <= state_position <= position:
+            state, state_position = checkpoints[checkpoint], checkpoint_position
+
+        state = state.copy()
+        for entry in self.entries[state_position:position]:
+            entry.apply_to_state(state)
+
+        return state
+
+    def _get_state_position(self, entry_id: int | None, date: datetime | None) -> int:
+        if entry_id is not None:
+            if not 1 <= entry_id <= len(self.entries):
+                raise InvalidAptLogEntryIDError(entry_id)
+            return entry_id
+        elif date is not None:
+            # Entries that have started at the given date count as done.
+            return bisect_right(self._start_timestamps, date_to_timestamp(date))
+        else:
+            return len(self.entries)
+
+    def get_state(self, entry_id: int | None = None, date: datetime | None = None) -> PackageState:
+        # Returns the packages installed after the entry with the given ID, as of the given date or after all entries
+        with measure('state'):
+            return self._get_state(self._get_state_position(entry_id, date))
+
+    def diff_states(
+            self,
+            old_entry_id: int | None = None,
+            old_date: datetime | None = None,
+            new_entry_id: int | None = None,
+            new_date: datetime | None = None,
+    ) -> list[PackageStateChange]:
+        # Compares the installed packages at two points of the log given like in get_state
+        with measure('state'):
+            old_position = self._get_state_position(old_entry_id, old_date)
+            new_position = self._get_state_position(new_entry_id, new_date)
+
+            old_state = self._get_state(old_position)
+            new_state = self._get_state(new_position, old_state, old_position)
+
+        return diff_package_states(old_state, new_state)
+
+    def get_stats(
+            self,
+            group_by: Sequence['StatsField'] = (),
+            bucket: 'DateBucket | None' = None,
+            start_date: datetime | None = None,
+            end_date: datetime | None = None,
+            package_name: str | None = None,
+    ) -> list['StatsGroup']:
+        # Aggregates the entries that match the given filters (see apt_log.stats)
+        from apt_log.stats import DateBucket, aggregate_entries
+
+        entries = self.get_entries(start_date=start_date, end_date=end_date, package_name=package_name)
+
+        with measure('aggregate'):
+            return aggregate_entries(entries, group_by, bucket or DateBucket.MONTH)
+
     def get_last_entry(self) -> AptLogEntry:
         return self.entries[- 1]
+
+    def append(self, entry: AptLogEntry):
+        # Adds an entry that is younger than all entries of the log, such as one that APT has just written. The entry
+        # is assigned the next ID and all indexes are updated.
+        position = len(self.entries)
+        entry.id = position + 1
+
+        self.entries.append(entry)
+        if entry.key is not None:
+            self._entries_by_key.setdefault(entry.key, entry)
+        if entry.start_timestamp is not None:
+            self._start_timestamps.append(entry.start_timestamp)
+        else:
+            self._start_timestamps.append(self._start_timestamps[-1] if self._start_timestamps else MIN_TIMESTAMP)
+        end_timestamp = entry.end_timestamp
+        if end_timestamp is None:
+            end_timestamp = self._start_timestamps[-1]
+            self._unended_positions.append(position)
+        self._max_end_timestamps.append(
+            max(self._max_end_timestamps[-1], end_timestamp) if self._max_end_timestamps else end_timestamp,
+        )
+
+        if '_package_indexes' in self.__dict__:
+            self._index_packages(position, entry, *self._package_indexes)
+
+        if '_package_timelines' in self.__dict__:
+            self._add_package_changes(entry, self._package_timelines)
+
+        if '_state_checkpoints' in self.__dict__ and len(self.entries) % self.STATE_CHECKPOINT_INTERVAL == 0:
+            self._state_checkpoints.append(self._get_state(len(self.entries)))
@@ -1,97 +1,535 @@
-import gzip
+import io
+import os
 import re
-from dataclasses import dataclass
+from collections import deque
+from dataclasses import dataclass, replace
 from datetime import datetime
+from functools import lru_cache
+from hashlib import blake2b
+from itertools import chain, islice
 from pathlib import Path
-from typing import Final, Iterator, Pattern, TextIO
+from sys import intern
+from typing import IO, TYPE_CHECKING, Final, Iterable, Iterator, Pattern, Sequence
 
-from dataclass_builder import dataclass_builder
+from apt_log.log import (
+    MIN_TIMESTAMP,
+    AptLog,
+    AptLogEntry,
+    AptLogQuery,
+    ChangedPackage,
+    InvalidAptLogEntryIDError,
+    LazyAptLogEntry,
+    PackageAction,
+    date_to_timestamp,
+    is_package_pattern,
+    timestamp_to_date,
+)
+from apt_log.timing import TimedFunction, Timings, get_timings, measure
 
-from apt_log.log import AptLog, AptLogEntry, ChangedPackage, PackageAction
+if TYPE_CHECKING:
+    from apt_log.cache import AptLogCache
+
+
+DATE_FORMAT: Final[str] = '%Y-%m-%d  %H:%M:%S'
+
+
+@lru_cache(maxsize=1024)
+def _parse_day(day_string: str) -> int:
+    # Returns the timestamp of the start of the day. Entries of the same day share it, so it is parsed once only.
+    return date_to_timestamp(datetime.strptime(day_string, '%Y-%m-%d'))
+
+
+def parse_timestamp(date_string: str) -> int:
+    # Parses dates in the fixed-width format of the log, 'YYYY-MM-DD  HH:MM:SS' (or with a single space), by slicing
+    # rather than with strptime, which is much slower. Anything that does not fit the format exactly is left to
+    # strptime, which either parses or rejects it like it always did.
+    time_string = date_string[-8:]
+
+    if (
+        len(date_string) in (19, 20) and date_string[10:-8].isspace()
+        and time_string[2] == ':' and time_string[5] == ':'
+        and time_string.replace(':', '').isdigit() and time_string.isascii()
+    ):
+        hour, minute, second = int(time_string[:2]), int(time_string[3:5]), int(time_string[6:])
+        if hour < 24 and minute < 60 and second < 60:
+            try:
+                return _parse_day(date_string[:10]) + hour * 3600 + minute * 60 + second
+            except ValueError:
+                pass
+
+    return date_to_timestamp(datetime.strptime(date_string, DATE_FORMAT))
+
+
+def get_entry_key(log_entry: str) -> str:
+    # A hash of the raw entry, which is the same wherever the entry is read from. 64 bits make collisions between the
+    # entries of a log practically impossible.
+    return blake2b(log_entry.encode(), digest_size=8).hexdigest()
 
 
 @dataclass
 class AptLogReader:
-    LOG_ENTRY_FORMAT: Final[Pattern] = re.compile(r'(^\n|\n\n)(.+?)(?=\n\n|\n$)', re.DOTALL)
     PACKAGE_FORMAT: Final[Pattern] = re.compile(r'(\S+):(\S+) \(([^()]*)\)')
+    ENTRY_HEADER: Final[bytes] = b'Start-Date: '
+    ENTRY_FIRST_LINE: Final[Pattern[bytes]] = re.compile(rb'\n\n([^\n]+)(?=\n)')
+    CHUNK_SIZE: Final[int] = 1 << 16
 
-    def read_log_entries(self, file: str | TextIO) -> Iterator[str]:
-        for m in self.LOG_ENTRY_FORMAT.finditer(file if isinstance(file, str) else file.read()):
-            yield m.group(2)
+    # Defer parsing of package lists until they are accessed for the first time
+    lazy: bool = False
 
-    def parse_package_list(self, raw_packages: str, action: PackageAction) -> Iterator[ChangedPackage]:
-        for m in self.PACKAGE_FORMAT.finditer(raw_packages):
-            name, architecture, version = m.groups()
+    # Build only the entries and packages that match the query. Other entries are reduced to their dates, so that they
+    # still take their place in the log and matching entries are assigned the same IDs as without a query. Entries are
+    # parsed eagerly then, since only the matching packages are kept.
+    query: AptLogQuery | None = None
 
-            builder = dataclass_builder(ChangedPackage)(
-                name=name,
-                architecture=architecture,
-                version=version,
-                action=action,
-            )
+    # Tag entries with the host whose log is read
+    host: str | None = None
+
+    # Build logs of entries that are unique by key, for log files that may overlap (see AptLog)
+    deduplicate: bool = False
+
+    def read_log_entries(self, file: str | Path | Iterable[str]) -> Iterator[str]:
+        if isinstance(file, str):
+            file = io.StringIO(file)
+        elif isinstance(file, Path):
+            file = read_log_file(file)
 
-            if builder.version.endswith(', automatic'):
-                builder.version = builder.version[:-11]
-                builder.is_automatic = True
+        # Log entries are separated by blank lines. Only the lines of the current entry are held in memory.
+        block: list[str] = []
 
-            if ', ' in builder.version:
-                builder.previous_version, builder.version = builder.version.split(', ')
+        for line in file:
+            if line := line.rstrip('\n'):
+                block.append(line)
+            elif block:
+                yield '\n'.join(block)
+                block = []
 
-            yield builder.build()
+        if block:
+            yield '\n'.join(block)
+
+    def parse_package_list(
+            self,
+            raw_packages: str,
+            action: PackageAction,
+            query: AptLogQuery | None = None,
+    ) -> Iterator[ChangedPackage]:
+        for name, architecture, version in self.PACKAGE_FORMAT.findall(raw_packages):
+            previous_version = None
+            is_automatic = version.endswith(', automatic')
+
+            if is_automatic:
+                version = version[:-11]
+
+            if ', ' in version:
+                previous_version, version = version.split(', ')
+
+            if query is not None and not query.matches_package(name, architecture, version):
+                continue
+
+            if previous_version is not None:
+                previous_version = intern(previous_version)
+
+            # Names, architectures and versions recur across many entries, so share a single copy of each.
+            yield ChangedPackage(
+                intern(name),
+                intern(architecture),
+                intern(version),
+                action,
+                previous_version,
+                is_automatic,
+            )
+
+    def parse_sorted_package_list(
+            self,
+            raw_packages: str,
+            action: PackageAction,
+            query: AptLogQuery | None = None,
+    ) -> list[ChangedPackage]:
+        return sorted(
+            self.parse_package_list(raw_packages, action, query),
+            key=lambda package: (package.is_automatic, package.name),
+        )
 
     def parse_date(self, date_string: str) -> datetime:
-        return datetime.strptime(date_string, '%Y-%m-%d  %H:%M:%S')
+        return timestamp_to_date(self.parse_timestamp(date_string))
+
+    def parse_timestamp(self, date_string: str) -> int:
+        # Entries keep their dates as timestamps, so they are parsed into timestamps right away.
+        return parse_timestamp(date_string)
 
     def parse_log_entry(self, log_entry: str) -> AptLogEntry:
-        entry_builder = dataclass_builder(AptLogEntry)(changed_packages_by_action={})
+        if self.query is not None:
+            return self._parse_queried_log_entry(log_entry, self.query)
+
+        key = get_entry_key(log_entry)
+        entry = LazyAptLogEntry(host=self.host, key=key) if self.lazy else AptLogEntry(host=self.host, key=key)
+        raw_package_lists = {}
 
         for line in log_entry.splitlines():
             key, value = line.split(': ', 1)
 
             if key == 'Start-Date':
-                entry_builder.start_date = self.parse_date(value)
+                entry.start_timestamp = self.parse_timestamp(value)
             elif key == 'End-Date':
-                entry_builder.end_date = self.parse_date(value)
+                entry.end_timestamp = self.parse_timestamp(value)
             elif key == 'Commandline':
-                entry_builder.command_line = value
+                entry.command_line = value
             elif key == 'Requested-By':
-                entry_builder.requested_by = value
+                entry.requested_by = value
             elif key == 'Error':
-                entry_builder.error = value
+                entry.error = value
             else:
                 try:
-                    action = PackageAction[key.upper()]
-                    entry_builder.changed_packages_by_action[action] = list(self.parse_package_list(value, action))
+                    raw_package_lists[PackageAction[key.upper()]] = value
                 except KeyError as err:
                     raise ValueError(f"Malformed log: Unknown entry: {key}") from err
 
-            for action, changed_packages in entry_builder.changed_packages_by_action.items():
-                entry_builder.changed_packages_by_action[action] = sorted(
-                    changed_packages, key=lambda package: (package.is_automatic, package.name),
-                )
+        if self.lazy:
+            entry.set_raw_package_lists(raw_package_lists, self.parse_sorted_package_list)
+        else:
+            entry.changed_packages_by_action = {
+                action: self.parse_sorted_package_list(raw_packages, action)
+                for action, raw_packages in raw_package_lists.items()
+            }
+
+        return entry
+
+    def _parse_queried_log_entry(self, log_entry: str, query: AptLogQuery) -> AptLogEntry:
+        values = dict(line.split(': ', 1) for line in log_entry.splitlines())
+        entry = AptLogEntry(host=self.host, key=get_entry_key(log_entry))
+
+        if (start_date := values.pop('Start-Date', None)) is not None:
+            entry.start_timestamp = self.parse_timestamp(start_date)
+        if (end_date := values.pop('End-Date', None)) is not None:
+            entry.end_timestamp = self.parse_timestamp(end_date)
 
-        return entry_builder.build()
+        command_line = values.pop('Commandline', None)
+        requested_by = values.pop('Requested-By', None)
+        error = values.pop('Error', None)
+
+        raw_package_lists = {}
+        for key, value in values.items():
+            try:
+                raw_package_lists[PackageAction[key.upper()]] = value
+            except KeyError as err:
+                raise ValueError(f"Malformed log: Unknown entry: {key}") from err
+
+        # Skip the rest of entries that do not match as a whole.
+        if not query.matches_timestamps(entry.start_timestamp, entry.end_timestamp):
+            return entry
+        if not query.matches_header(requested_by, command_line):
+            return entry
+
+        # Skip package lists whose action does not match, or that can not contain a package with the given name.
+        changed_packages_by_action = {}
+        name = query.package_name
+        if name is not None and is_package_pattern(name):
+            name = None
+
+        for action, raw_packages in raw_package_lists.items():
+            if query.matches_action(action) and (name is None or f'{name}:' in raw_packages):
+                if packages := self.parse_sorted_package_list(raw_packages, action, query):
+                    changed_packages_by_action[action] = packages
+
+        # Without matching packages, the entry does not match either.
+        if changed_packages_by_action or not query.filters_packages():
+            entry.changed_packages_by_action = changed_packages_by_action
+            entry.command_line = command_line
+            entry.requested_by = requested_by
+            entry.error = error
+
+        return entry
+
+    def parse_log_files(self, *log_files: str | Path | Iterable[str]) -> Iterator[AptLogEntry]:
+        if (timings := get_timings()) is not None:
+            yield from self._parse_log_files_timed(timings, *log_files)
+            return
 
-    def parse_log_files(self, *log_files: str | TextIO) -> Iterator[AptLogEntry]:
         for log_file in log_files:
             for log_entry in self.read_log_entries(log_file):
                 yield self.parse_log_entry(log_entry)
 
-    def build_log(self, *log_files: str | TextIO) -> AptLog:
-        return AptLog(self.parse_log_files(*log_files))
+    def _parse_log_files_timed(self, timings: Timings, *log_files: str | Path | Iterable[str]) -> Iterator[AptLogEntry]:
+        # Parses with a copy of the reader whose parsing steps record their timings.
+        reader = replace(self)
+        reader.parse_timestamp = TimedFunction(self.parse_timestamp, timings, 'parse_date')
+        reader.parse_sorted_package_list = TimedFunction(
+            self.parse_sorted_package_list, timings, 'parse_package_list', unit='packages',
+        )
+
+        for log_file in log_files:
+            for log_entry in timings.iterate(reader.read_log_entries(log_file), 'read', unit='entries'):
+                with timings.measure('parse_log_entry') as stage:
+                    entry = reader.parse_log_entry(log_entry)
+                    stage.counts['entries'] += 1
+
+                yield entry
+
+    def _parse_log_file(self, log_file: str | Path | Iterable[str]) -> list[AptLogEntry]:
+        return list(self.parse_log_files(log_file))
+
+    def parse_each_log_file(
+            self,
+            log_files: Sequence[str | Path | Iterable[str]],
+            jobs: int | None = 1,
+    ) -> Iterator[list[AptLogEntry]]:
+        # Log files are independent of each other and can therefore be parsed in separate processes. With more than
+        # one job, log files must be given as strings or paths, since open files can not be passed to other processes.
+        # The entries are yielded in the order of the given log files in either case. (jobs=None uses all CPUs.)
+        if (jobs is None or jobs > 1) and len(log_files) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                yield from executor.map(self._parse_log_file, log_files)
+        else:
+            yield from map(self._parse_log_file, log_files)
+
+    def scan_start_timestamps(self, log_file: Path) -> Iterator[int | None]:
+        # Yields the start timestamp of each entry, or None for entries without start date, from the raw bytes without
+        # splitting the file into lines, let alone parsing the entries. Like in read_log_entries, an entry is any block
+        # of lines and starts wherever a line follows a blank line or the start of the file.
+        buffer = b'\n\n'
+
+        with open_log_file(log_file, 'rb') as file:
+            while True:
+                chunk = file.read(self.CHUNK_SIZE)
+                buffer += chunk or b'\n'
+
+                # Only complete lines are searched. The rest is carried over along with the newline that precedes it,
+                # which is part of the blank line before an entry that starts in the next chunk.
+                end = buffer.rfind(b'\n')
+                for match in self.ENTRY_FIRST_LINE.finditer(buffer, 0, end + 1):
+                    if (line := match[1]).startswith(self.ENTRY_HEADER):
+                        yield self.parse_timestamp(line[len(self.ENTRY_HEADER):].decode())
+                    else:
+                        yield None
+
+                if not chunk:
+                    break
+                buffer = buffer[end - 1:]
+
+    def count_log_entries(self, log_file: Path) -> int:
+        return sum(1 for _ in self.scan_start_timestamps(log_file))
+
+    def _count_chronological_log_entries(self, log_files: Sequence[Path]) -> list[int] | None:
+        # Counts the entries of each log file, or returns None if the entries of all log files together are not in the
+        # order that AptLog sorts them in. Entries without start date are sorted along with the entry that precedes
+        # them, in the same or an earlier log file, and are therefore always in order.
+        entry_counts = []
+        timestamp = MIN_TIMESTAMP
+
+        for log_file in log_files:
+            entry_count = 0
+
+            for start_timestamp in self.scan_start_timestamps(log_file):
+                if start_timestamp is not None:
+                    if start_timestamp < timestamp:
+                        return None
+                    timestamp = start_timestamp
+                entry_count += 1
+
+            entry_counts.append(entry_count)
+
+        return entry_counts
+
+    def read_log_entry(self, log_file: Path, position: int) -> str | None:
+        # Returns the entry at the given position of the log file, starting with 1
+        log_entries = self.read_log_entries(log_file)
+        try:
+            return next(islice(log_entries, position - 1, None), None)
+        finally:
+            log_entries.close()
+
+    def read_last_log_entry(self, log_file: Path) -> str | None:
+        # Compressed files can not be read backwards.
+        if log_file.suffix == '.gz':
+            last_log_entries = deque(self.read_log_entries(log_file), maxlen=1)
+            return last_log_entries[0] if last_log_entries else None
+
+        # Read the file backwards chunk by chunk until the header of the last entry is found.
+        with log_file.open('rb') as file:
+            position = file.seek(0, os.SEEK_END)
+            buffer = b''
+
+            while position > 0:
+                chunk_size = min(self.CHUNK_SIZE, position)
+                position -= chunk_size
+                file.seek(position)
+                buffer = file.read(chunk_size) + buffer
+
+                if (index := buffer.rfind(b'\n' + self.ENTRY_HEADER)) >= 0:
+                    buffer = buffer[index:]
+                    break
+
+        last_log_entries = deque(self.read_log_entries(buffer.decode()), maxlen=1)
+        return last_log_entries[0] if last_log_entries else None
+
+    def find_log_entry(self, log_files: Sequence[Path], entry_id: int) -> AptLogEntry:
+        # Finds the entry that would be assigned the given ID by AptLog without parsing any other entry. This relies on
+        # the log files being given in chronological order and each being chronological itself, as written by APT. The
+        # start dates of all entries are checked for that while the entries are counted. If they are out of order, this
+        # falls back to building the entire log.
+        if entry_id < 1:
+            raise InvalidAptLogEntryIDError(entry_id)
+
+        if (entry_counts := self._count_chronological_log_entries(log_files)) is None:
+            return self.build_log(*log_files).get_entry_by_id(entry_id)
+
+        position = entry_id
+
+        for log_file, entry_count in zip(log_files, entry_counts, strict=True):
+            if position > entry_count:
+                position -= entry_count
+                continue
+
+            entry = self.parse_log_entry(self.read_log_entry(log_file, position))
+            entry.id = entry_id
+            return entry
+
+        raise InvalidAptLogEntryIDError(entry_id)
+
+    def find_last_log_entry(self, log_files: Sequence[Path]) -> AptLogEntry | None:
+        # Relies on and checks the order of the log files and their entries, as does find_log_entry.
+        if (entry_counts := self._count_chronological_log_entries(log_files)) is None:
+            log = self.build_log(*log_files)
+            return log.get_last_entry() if log.entries else None
+
+        for log_file, entry_count in zip(reversed(log_files), reversed(entry_counts), strict=True):
+            if entry_count and (log_entry := self.read_last_log_entry(log_file)) is not None:
+                entry = self.parse_log_entry(log_entry)
+                entry.id = sum(entry_counts)
+                return entry
+
+        return None
+
+    def iter_matching_entries(self, *log_files: Path) -> Iterator[AptLogEntry]:
+        # Yields the entries that match the query, or all entries with packages without one, while the log files are
+        # read, and keeps none of them (but their keys, if deduplicate is set). The entries are numbered in the order
+        # they are read, which is the order AptLog sorts them in if the log files are chronological. This is checked
+        # beforehand (see find_log_entry), and the entries are taken from a complete log if it is not the case.
+        if self._count_chronological_log_entries(log_files) is None:
+            yield from self.build_log(*log_files).get_matching_entries(self.query or AptLogQuery())
+            return
+
+        seen_keys = set()
+        entry_id = 0
+
+        for entry in self.parse_log_files(*log_files):
+            if self.deduplicate and entry.key is not None:
+                if entry.key in seen_keys:
+                    continue
+                seen_keys.add(entry.key)
+
+            entry_id += 1
+            entry.id = entry_id
+
+            if entry.has_changed_packages():
+                yield entry
+
+    def build_log(self, *log_files: str | Path | Iterable[str], jobs: int | None = 1) -> AptLog:
+        if jobs == 1:
+            entries = self.parse_log_files(*log_files)
+        else:
+            entries = chain.from_iterable(self.parse_each_log_file(log_files, jobs=jobs))
+
+        return AptLog(entries, deduplicate=self.deduplicate)
 
 
 LOG_DIR: Path = Path('/var/log/apt/')
 LOG_FILE_GLOB_PATTERN: str = 'history.log*'
 
+# The terminal output of APT and the package status changes by dpkg, which are logged alongside the history
+TERM_LOG_FILE_GLOB_PATTERN: str = 'term.log*'
+DPKG_LOG_DIR: Path = Path('/var/log/')
+DPKG_LOG_FILE_GLOB_PATTERN: str = 'dpkg.log*'
+
+_ROTATION_NUMBER: Final[Pattern] = re.compile(r'\.log\.(\d+)')
+
+
+def open_log_file(path: Path, mode: str = 'rt') -> IO:
+    if path.suffix == '.gz':
+        import gzip
+
+        return gzip.open(path, mode)
+    else:
+        return path.open(mode)
+
+
+def _get_rotation_number(path: Path) -> int:
+    # history.log -> 0, history.log.1 -> 1, history.log.2.gz -> 2, ...
+    match = _ROTATION_NUMBER.search(path.name)
+    return int(match[1]) if match is not None else 0
+
+
+def get_log_paths(log_dir: Path, glob_pattern: str = LOG_FILE_GLOB_PATTERN) -> list[Path]:
+    # Oldest log files first
+    return sorted(log_dir.glob(glob_pattern), key=lambda path: (-_get_rotation_number(path), path.name))
+
+
+def get_system_log_paths() -> list[Path]:
+    return get_log_paths(LOG_DIR)
+
+
+def get_system_term_log_paths() -> list[Path]:
+    return get_log_paths(LOG_DIR, TERM_LOG_FILE_GLOB_PATTERN)
+
+
+def get_system_dpkg_log_paths() -> list[Path]:
+    return get_log_paths(DPKG_LOG_DIR, DPKG_LOG_FILE_GLOB_PATTERN)
+
+
+def get_current_system_log_path() -> Path:
+    # The log file that APT is currently writing to
+    return LOG_DIR / 'history.log'
+
+
+def read_log_file(path: Path) -> Iterator[str]:
+    # The file is opened only once iteration starts and closed as soon as it is exhausted.
+    if (timings := get_timings()) is not None:
+        timings.add('read', 0, calls=0, bytes=path.stat().st_size)
+
+    with open_log_file(path) as file:
+        yield from file
+
+
+def get_system_log_files() -> Iterator[Iterator[str]]:
+    for path in get_system_log_paths():
+        yield read_log_file(path)
+
+
+def build_system_apt_log(
+        cache: 'AptLogCache | None' = None,
+        jobs: int | None = 1,
+        reader: AptLogReader | None = None,
+) -> AptLog:
+    paths = get_system_log_paths()
+    reader = reader or AptLogReader()
+
+    if cache is None:
+        return reader.build_log(*paths, jobs=jobs)
+
+    from apt_log.cache import LogFileIdentity
+
+    identities = [LogFileIdentity.of(path) for path in paths]
+    with measure('cache_load'):
+        entries_by_file = [cache.get(identity) for identity in identities]
+
+    # Parse only those log files that are new or have changed since they were cached
+    missing = [n for n, entries in enumerate(entries_by_file) if entries is None]
+    parsed_entries = reader.parse_each_log_file([paths[n] for n in missing], jobs=jobs)
+
+    for n, entries in zip(missing, parsed_entries, strict=True):
+        with measure('cache_store'):
+            cache.put(identities[n], entries)
+        entries_by_file[n] = entries
+
+    cache.prune(paths)
+
+    return AptLog(chain.from_iterable(entries_by_file), deduplicate=reader.deduplicate)
 
-def get_system_log_files() -> Iterator[TextIO]:
-    for f in LOG_DIR.glob(LOG_FILE_GLOB_PATTERN):
-        file_open = gzip.open if f.suffix == '.gz' else open
 
-        with file_open(LOG_DIR / f, 'rt') as file:
-            yield file.read()
+def find_system_log_entry(entry_id: int) -> AptLogEntry:
+    return AptLogReader().find_log_entry(get_system_log_paths(), entry_id)
 
 
-def build_system_apt_log() -> AptLog:
-    return AptLogReader().build_log(*get_system_log_files())
+def find_last_system_log_entry() -> AptLogEntry | None:
+    return AptLogReader().find_last_log_entry(get_system_log_paths())
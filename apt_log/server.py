@@ -0,0 +1,332 @@
+import json
+import os
+import re
+import socket
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+from http import HTTPStatus
+from http.client import HTTPConnection, HTTPException
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlsplit
+
+from apt_log.log import (
+    AptLog,
+    AptLogEntry,
+    AptLogQuery,
+    ChangedPackage,
+    InvalidAptLogEntryIDError,
+    PackageAction,
+    PackageChange,
+    is_entry_key,
+)
+
+if TYPE_CHECKING:
+    from socketserver import UnixStreamServer
+
+    from apt_log.follow import AptLogFollower
+
+
+def get_default_socket_path() -> Path:
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or Path.home() / '.cache' / 'apt-log'
+    return Path(runtime_dir) / 'apt-log.sock'
+
+
+@dataclass
+class AptLogServerError(Exception):
+    message: str
+
+    def __str__(self):
+        return self.message
+
+
+def _format_date(date: datetime | None) -> str | None:
+    return None if date is None else date.isoformat()
+
+
+def _parse_date(value: str | None) -> datetime | None:
+    return None if value is None else datetime.fromisoformat(value)
+
+
+def _encode_entry(entry: AptLogEntry) -> dict[str, Any]:
+    return {
+        'id': entry.id,
+        'start_date': _format_date(entry.start_date),
+        'end_date': _format_date(entry.end_date),
+        'command_line': entry.command_line,
+        'requested_by': entry.requested_by,
+        'error': entry.error,
+        'host': entry.host,
+        'key': entry.key,
+        'packages': {
+            str(action): [
+                {
+                    'name': package.name,
+                    'architecture': package.architecture,
+                    'version': package.version,
+                    'previous_version': package.previous_version,
+                    'is_automatic': package.is_automatic,
+                }
+                for package in packages
+            ]
+            for action, packages in entry.changed_packages_by_action.items()
+        },
+    }
+
+
+def _decode_entry(data: dict[str, Any]) -> AptLogEntry:
+    return AptLogEntry(
+        id=data['id'],
+        changed_packages_by_action={
+            PackageAction(action): [ChangedPackage(action=PackageAction(action), **package) for package in packages]
+            for action, packages in data['packages'].items()
+        },
+        start_date=_parse_date(data['start_date']),
+        end_date=_parse_date(data['end_date']),
+        command_line=data['command_line'],
+        requested_by=data['requested_by'],
+        error=data['error'],
+        host=data['host'],
+        key=data['key'],
+    )
+
+
+def _encode_change(change: PackageChange) -> dict[str, Any]:
+    return {
+        'entry_id': change.entry_id,
+        'date': _format_date(change.date),
+        'action': str(change.action),
+        'architecture': change.architecture,
+        'version': change.version,
+        'previous_version': change.previous_version,
+        'is_automatic': change.is_automatic,
+    }
+
+
+def _decode_change(data: dict[str, Any]) -> PackageChange:
+    return PackageChange(**{**data, 'date': _parse_date(data['date']), 'action': PackageAction(data['action'])})
+
+
+def _encode_query(query: AptLogQuery) -> dict[str, Any]:
+    params = {}
+
+    for query_field in fields(query):
+        value = getattr(query, query_field.name)
+        if isinstance(value, datetime):
+            params[query_field.name] = value.isoformat()
+        elif query_field.name == 'actions' and value is not None:
+            params[query_field.name] = sorted(map(str, value))
+        elif value is not None:
+            params[query_field.name] = value
+
+    return params
+
+
+def _decode_query(params: dict[str, list[str]]) -> AptLogQuery:
+    # Raises ValueError for parameters that can not be parsed
+    values = {name: values[-1] for name, values in params.items()}
+
+    if (command_pattern := values.get('command_pattern')) is not None:
+        try:
+            re.compile(command_pattern)
+        except re.error as err:
+            raise ValueError(f"Invalid regular expression: {err}") from err
+
+    return AptLogQuery(
+        start_date=_parse_date(values.get('start_date')),
+        end_date=_parse_date(values.get('end_date')),
+        package_name=values.get('package_name'),
+        architecture=values.get('architecture'),
+        version=values.get('version'),
+        actions=[PackageAction(action) for action in params['actions']] if 'actions' in params else None,
+        requested_by=values.get('requested_by'),
+        command_pattern=command_pattern,
+    )
+
+
+@dataclass
+class AptLogServer:
+    # Keeps a parsed log, including its lazily built indexes, in memory and answers queries over HTTP on a Unix socket.
+    # Before each request, the entries that have been appended to the current log file since are read by the follower
+    # and appended to the log, so the log is kept up to date without parsing it again.
+    log: AptLog
+    follower: 'AptLogFollower | None' = field(default=None, repr=False)
+
+    def refresh(self):
+        if self.follower is not None:
+            for entry in self.follower.read_new_entries():
+                self.log.append(entry)
+
+    def handle_request(self, path: str, params: dict[str, list[str]]) -> tuple[HTTPStatus, Any]:
+        # Returns the status and JSON body of the response to a GET request of the given path and query parameters
+        self.refresh()
+
+        try:
+            if path == '/entries':
+                query = _decode_query(params)
+                offset = int(params.get('offset', ['0'])[-1])
+                limit = int(params['limit'][-1]) if 'limit' in params else None
+                reverse = params.get('reverse', ['false'])[-1] == 'true'
+
+                entries = self.log.get_matching_entries(query, offset=offset, limit=limit, reverse=reverse)
+                return HTTPStatus.OK, {'entries': [_encode_entry(entry) for entry in entries]}
+
+            elif path == '/entries/last':
+                if not self.log.entries:
+                    return HTTPStatus.NOT_FOUND, {'error': "The log is empty."}
+                return HTTPStatus.OK, _encode_entry(self.log.get_last_entry())
+
+            elif path.startswith('/entries/'):
+                # Entries are referred to by ID or key.
+                entry_ref = path.removeprefix('/entries/')
+                if is_entry_key(entry_ref) or not entry_ref.isdigit():
+                    return HTTPStatus.OK, _encode_entry(self.log.get_entry_by_key(entry_ref))
+
+                entry_id = int(entry_ref)
+                if not 1 <= entry_id <= len(self.log.entries):
+                    raise InvalidAptLogEntryIDError(entry_id)
+                return HTTPStatus.OK, _encode_entry(self.log.get_entry_by_id(entry_id))
+
+            elif path == '/packages':
+                timelines = self.log.get_package_timelines(params.get('name', ['*'])[-1])
+                return HTTPStatus.OK, {
+                    'packages': {
+                        name: [_encode_change(change) for change in timeline] for name, timeline in timelines.items()
+                    },
+                }
+
+        except InvalidAptLogEntryIDError as err:
+            return HTTPStatus.NOT_FOUND, {'error': str(err)}
+        except ValueError as err:
+            return HTTPStatus.BAD_REQUEST, {'error': str(err)}
+
+        return HTTPStatus.NOT_FOUND, {'error': f"Unknown path: {path}"}
+
+    def create_http_server(self, socket_path: Path) -> 'UnixStreamServer':
+        # Requests are handled one at a time, which is what keeps the log consistent while it is refreshed.
+        from http.server import BaseHTTPRequestHandler
+        from socketserver import UnixStreamServer
+
+        server = self
+
+        class _RequestHandler(BaseHTTPRequestHandler):
+            timeout = 10
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                status, body = server.handle_request(unquote(url.path), parse_qs(url.query))
+                content = json.dumps(body).encode()
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                # Requests are too frequent to be worth logging.
+                pass
+
+        if socket_path.exists():
+            if AptLogClient(socket_path).is_running():
+                raise AptLogServerError(f"A server is already listening on {socket_path}.")
+            # Left behind by a server that has not shut down cleanly
+            socket_path.unlink()
+
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        return UnixStreamServer(str(socket_path), _RequestHandler)
+
+    def serve(self, socket_path: Path):
+        http_server = self.create_http_server(socket_path)
+
+        try:
+            with http_server:
+                http_server.serve_forever()
+        finally:
+            socket_path.unlink(missing_ok=True)
+
+
+class _UnixHTTPConnection(HTTPConnection):
+
+    def __init__(self, socket_path: Path, timeout: float):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(str(self.socket_path))
+
+
+@dataclass
+class AptLogClient:
+    # Queries a running AptLogServer. Raises OSError or http.client.HTTPException if the server can not be reached and
+    # AptLogServerError if it rejects a request.
+    socket_path: Path
+    timeout: float = 30.0
+
+    def _get(self, path: str, params: dict[str, Any] | None = None) -> tuple[HTTPStatus, Any]:
+        connection = _UnixHTTPConnection(self.socket_path, self.timeout)
+        try:
+            connection.request('GET', f'{path}?{urlencode(params, doseq=True)}' if params else path)
+            response = connection.getresponse()
+            return HTTPStatus(response.status), json.loads(response.read())
+        finally:
+            connection.close()
+
+    def _get_ok(self, path: str, params: dict[str, Any] | None = None) -> Any:
+        status, body = self._get(path, params)
+        if status != HTTPStatus.OK:
+            raise AptLogServerError(body.get('error', status.phrase))
+        return body
+
+    def is_running(self) -> bool:
+        try:
+            self._get('/entries/last')
+        except (OSError, HTTPException):
+            return False
+        else:
+            return True
+
+    def get_matching_entries(
+            self,
+            query: AptLogQuery,
+            *,
+            offset: int = 0,
+            limit: int | None = None,
+            reverse: bool = False,
+    ) -> list[AptLogEntry]:
+        params = _encode_query(query)
+        params['offset'] = offset
+        if limit is not None:
+            params['limit'] = limit
+        if reverse:
+            params['reverse'] = 'true'
+
+        return [_decode_entry(data) for data in self._get_ok('/entries', params)['entries']]
+
+    def _get_entry(self, entry_ref: int | str) -> AptLogEntry:
+        status, body = self._get(f'/entries/{quote(str(entry_ref))}')
+        if status == HTTPStatus.NOT_FOUND:
+            raise InvalidAptLogEntryIDError(entry_ref)
+        elif status != HTTPStatus.OK:
+            raise AptLogServerError(body.get('error', status.phrase))
+        return _decode_entry(body)
+
+    def get_entry_by_id(self, entry_id: int) -> AptLogEntry:
+        return self._get_entry(entry_id)
+
+    def get_entry_by_key(self, key: str) -> AptLogEntry:
+        return self._get_entry(key)
+
+    def get_last_entry(self) -> AptLogEntry | None:
+        status, body = self._get('/entries/last')
+        if status == HTTPStatus.NOT_FOUND:
+            return None
+        elif status != HTTPStatus.OK:
+            raise AptLogServerError(body.get('error', status.phrase))
+        return _decode_entry(body)
+
+    def get_package_timelines(self, package_name: str) -> dict[str, list[PackageChange]]:
+        packages = self._get_ok('/packages', {'name': package_name})['packages']
+        return {name: [_decode_change(data) for data in timeline] for name, timeline in packages.items()}
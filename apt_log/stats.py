@@ -0,0 +1,145 @@
+import enum
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime
+from math import floor
+from pathlib import PurePosixPath
+from typing import Final, Iterable, Sequence
+
+from apt_log.log import AptLogEntry
+
+
+class StatsField(enum.StrEnum):
+    DATE = "date"
+    USER = "user"
+    COMMAND = "command"
+    ACTION = "action"
+    ARCHITECTURE = "architecture"
+    PACKAGE = "package"
+
+
+class DateBucket(enum.StrEnum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+    YEAR = "year"
+
+
+# Fields that differ between the changed packages of an entry rather than between entries
+PACKAGE_FIELDS: Final[frozenset[StatsField]] = frozenset(
+    (StatsField.ACTION, StatsField.ARCHITECTURE, StatsField.PACKAGE),
+)
+
+DEFAULT_PERCENTILES: Final[tuple[float, ...]] = (50, 90, 99)
+
+
+@dataclass
+class StatsGroup:
+    # Values of the grouped fields, in the order in which they have been requested
+    key: tuple[str, ...]
+
+    entry_count: int = 0
+    package_count: int = 0
+
+    # Durations of the entries in seconds, of entries with both start and end date only
+    durations: array = field(default_factory=lambda: array('d'), repr=False)
+
+    def add_entry(self, entry: AptLogEntry):
+        self.entry_count += 1
+        if (duration := entry.duration) is not None:
+            self.durations.append(duration.total_seconds())
+
+    def get_duration_percentiles(self, percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> list[float] | None:
+        if not self.durations:
+            return None
+
+        try:
+            import numpy as np
+        except ImportError:
+            return [_get_percentile(sorted(self.durations), percentile) for percentile in percentiles]
+
+        return np.percentile(np.frombuffer(self.durations, dtype=np.float64), percentiles).tolist()
+
+
+def _get_percentile(sorted_values: list[float], percentile: float) -> float:
+    # Interpolates linearly between the closest ranks like numpy.percentile does by default
+    rank = percentile / 100 * (len(sorted_values) - 1)
+    lower = floor(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def format_date_bucket(date: datetime | None, bucket: DateBucket) -> str:
+    if date is None:
+        return ""
+    elif bucket == DateBucket.DAY:
+        return date.strftime('%Y-%m-%d')
+    elif bucket == DateBucket.WEEK:
+        year, week, _ = date.isocalendar()
+        return f'{year}-W{week:02}'
+    elif bucket == DateBucket.MONTH:
+        return date.strftime('%Y-%m')
+    else:
+        return date.strftime('%Y')
+
+
+def get_command(command_line: str | None) -> str:
+    # Reduces the command line to the program and its first argument that is not an option, such as 'apt install'.
+    if not command_line:
+        return ""
+
+    program, *arguments = command_line.split()
+    subcommand = next((argument for argument in arguments if not argument.startswith('-')), None)
+    program = PurePosixPath(program).name
+
+    return program if subcommand is None else f'{program} {subcommand}'
+
+
+def aggregate_entries(
+        entries: Iterable[AptLogEntry],
+        group_by: Sequence[StatsField] = (),
+        bucket: DateBucket = DateBucket.MONTH,
+) -> list[StatsGroup]:
+    # Counts entries and changed packages and collects durations for each combination of values of the given fields,
+    # all in a single pass over the entries. Entries that fall into a group by several of their packages are counted
+    # (and their duration collected) once per group. The groups are ordered by key.
+    groups: dict[tuple[str, ...], StatsGroup] = {}
+    last_entries: dict[tuple[str, ...], AptLogEntry] = {}
+    by_package = any(group_field in PACKAGE_FIELDS for group_field in group_by)
+
+    def _get_group(key: tuple[str, ...]) -> StatsGroup:
+        if (group := groups.get(key)) is None:
+            group = groups[key] = StatsGroup(key)
+        return group
+
+    for entry in entries:
+        entry_values = {
+            StatsField.DATE: format_date_bucket(entry.start_date, bucket) if StatsField.DATE in group_by else "",
+            StatsField.USER: entry.requested_by or "",
+            StatsField.COMMAND: get_command(entry.command_line) if StatsField.COMMAND in group_by else "",
+        }
+
+        if not by_package:
+            group = _get_group(tuple(entry_values[group_field] for group_field in group_by))
+            group.package_count += sum(map(len, entry.changed_packages_by_action.values()))
+            group.add_entry(entry)
+            continue
+
+        for action, packages in entry.changed_packages_by_action.items():
+            for package in packages:
+                package_values = {
+                    **entry_values,
+                    StatsField.ACTION: str(action),
+                    StatsField.ARCHITECTURE: package.architecture,
+                    StatsField.PACKAGE: package.name,
+                }
+                key = tuple(package_values[group_field] for group_field in group_by)
+                group = _get_group(key)
+                group.package_count += 1
+
+                # Entries are compared by identity, since they need not have IDs.
+                if last_entries.get(key) is not entry:
+                    last_entries[key] = entry
+                    group.add_entry(entry)
+
+    return [groups[key] for key in sorted(groups)]
@@ -0,0 +1,122 @@
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any, Callable, ContextManager, Iterable, Iterator, TypeVar
+
+T = TypeVar('T')
+
+
+@dataclass
+class Stage:
+    name: str
+    seconds: float = 0.0
+    calls: int = 0
+    counts: Counter[str] = field(default_factory=Counter)
+
+
+@dataclass
+class Timings:
+    # Records wall time, number of calls and counts of processed items (entries, packages, bytes) per stage. Stages may
+    # be nested in others, in which case their time is included in both.
+    stages: dict[str, Stage] = field(default_factory=dict)
+
+    def get_stage(self, name: str) -> Stage:
+        if name not in self.stages:
+            self.stages[name] = Stage(name)
+        return self.stages[name]
+
+    def add(self, name: str, seconds: float, calls: int = 1, **counts: int):
+        stage = self.get_stage(name)
+        stage.seconds += seconds
+        stage.calls += calls
+        stage.counts.update(counts)
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[Stage]:
+        stage = self.get_stage(name)
+        start = perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds += perf_counter() - start
+            stage.calls += 1
+
+    def iterate(self, iterable: Iterable[T], name: str, unit: str) -> Iterator[T]:
+        # Measures the time spent producing the items of the iterable, but not the time spent consuming them
+        stage = self.get_stage(name)
+        iterator = iter(iterable)
+
+        while True:
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                stage.seconds += perf_counter() - start
+
+            stage.calls += 1
+            stage.counts[unit] += 1
+            yield item
+
+    def format(self) -> str:
+        units = sorted({unit for stage in self.stages.values() for unit in stage.counts})
+        lines = [f"{'STAGE':<20} {'SECONDS':>10} {'CALLS':>10}" + "".join(f" {unit.upper():>10}" for unit in units)]
+
+        for stage in self.stages.values():
+            lines.append(
+                f"{stage.name:<20} {stage.seconds:>10.4f} {stage.calls:>10}"
+                + "".join(f" {stage.counts[unit]:>10}" for unit in units),
+            )
+
+        return "\n".join(lines)
+
+
+def _return(value: T) -> T:
+    return value
+
+
+@dataclass
+class TimedFunction:
+    function: Callable
+    timings: Timings
+    name: str
+
+    # Counts the items in the result of the function under the given unit
+    unit: str | None = None
+    count: Callable[[Any], int] = len
+
+    def __call__(self, *args, **kwargs):
+        start = perf_counter()
+        result = self.function(*args, **kwargs)
+        self.timings.add(self.name, perf_counter() - start, **({self.unit: self.count(result)} if self.unit else {}))
+        return result
+
+    def __reduce__(self):
+        # The function may be pickled along with objects that keep a reference to it, but the timings stay behind.
+        return _return, (self.function,)
+
+
+# Instrumentation is disabled unless timings are enabled. Code that records timings looks them up through get_timings()
+# once per stage rather than per item, so that it costs next to nothing when disabled.
+_timings: Timings | None = None
+
+
+def enable_timings() -> Timings:
+    global _timings
+    _timings = Timings()
+    return _timings
+
+
+def disable_timings():
+    global _timings
+    _timings = None
+
+
+def get_timings() -> Timings | None:
+    return _timings
+
+
+def measure(name: str) -> ContextManager[Stage | None]:
+    return nullcontext() if _timings is None else _timings.measure(name)
@@ -0,0 +1,145 @@
+import argparse
+import contextlib
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable
+
+from typer.testing import CliRunner
+
+from apt_log import reader
+from apt_log.cli import app
+from apt_log.log import AptLog, AptLogQuery
+from apt_log.reader import DATE_FORMAT, AptLogReader, parse_timestamp, read_log_file
+from benchmarks.synthetic import SyntheticHistory
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+
+
+def _measure(function: Callable[[], Any], repeat: int) -> float:
+    best = float('inf')
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def _get_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],  # noqa: S607
+            capture_output=True, text=True, check=True, cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run_cli(log_dir: Path, *args: str):
+    with contextlib.ExitStack() as stack:
+        stack.callback(setattr, reader, 'LOG_DIR', reader.LOG_DIR)
+        reader.LOG_DIR = log_dir
+
+        # Parse the log files on every run, rather than reading a cache or asking a running server.
+        result = CliRunner().invoke(app, ['--no-cache', '--no-server', *args])
+        if result.exit_code != 0:
+            raise RuntimeError(result.output)
+
+
+def run_benchmarks(size: int, directory: Path, history: SyntheticHistory, repeat: int) -> dict[str, float]:
+    history.entry_count = size
+    paths = history.write(directory)
+    results = {}
+
+    def _benchmark(name: str, function: Callable[[], Any], repeat: int = repeat):
+        results[name] = _measure(function, repeat)
+        print(f"{size:>9} {name:<28} {results[name]:10.4f}s", file=sys.stderr)  # noqa: T201
+
+    date_strings = [
+        line.rstrip('\n').split(': ', 1)[1]
+        for path in paths for line in read_log_file(path)
+        if line.startswith(('Start-Date: ', 'End-Date: '))
+    ]
+    _benchmark('parse_dates_strptime', lambda: [datetime.strptime(date, DATE_FORMAT) for date in date_strings])
+    _benchmark('parse_dates', lambda: [parse_timestamp(date) for date in date_strings])
+
+    _benchmark('ingest', lambda: AptLogReader().build_log(*paths))
+    _benchmark('ingest_lazy', lambda: AptLogReader(lazy=True).build_log(*paths))
+
+    log: AptLog = AptLogReader().build_log(*paths)
+    middle = log.entries[len(log.entries) // 2]
+    package_name = middle.changed_packages_by_action[next(iter(middle.changed_packages_by_action))][0].name
+
+    _benchmark('get_entries', lambda: sum(1 for _ in log.get_entries()))
+    _benchmark('get_entries_date_window', lambda: sum(1 for _ in log.get_entries(
+        start_date=middle.start_date, end_date=middle.end_date,
+    )))
+    _benchmark('get_entries_package', lambda: sum(1 for _ in log.get_entries(package_name=package_name)))
+    _benchmark('get_entries_package_glob', lambda: sum(1 for _ in log.get_entries(package_name='python3-*')))
+    _benchmark('ingest_query_package', lambda: sum(1 for _ in AptLogReader(
+        query=AptLogQuery(package_name=package_name),
+    ).build_log(*paths).get_entries(package_name=package_name)))
+    _benchmark('ingest_lazy_filter_package', lambda: sum(1 for _ in AptLogReader(
+        lazy=True,
+    ).build_log(*paths).get_entries(package_name=package_name)))
+    _benchmark('get_entry_by_id', lambda: log.get_entry_by_id(middle.id))
+    _benchmark('get_last_entry', log.get_last_entry)
+    _benchmark('find_log_entry', lambda: AptLogReader().find_log_entry(paths, middle.id))
+    _benchmark('find_last_log_entry', lambda: AptLogReader().find_last_log_entry(paths))
+
+    _benchmark('cli_list', lambda: _run_cli(directory, 'list'), repeat=1)
+    _benchmark('cli_show', lambda: _run_cli(directory, 'show', str(middle.id)))
+    _benchmark('cli_last', lambda: _run_cli(directory, 'last'))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark apt-log on synthetic APT histories.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Numbers of log entries.")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per benchmark (the best one counts).")
+    parser.add_argument('--packages-per-transaction', type=int, default=10)
+    parser.add_argument('--automatic-ratio', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    parser.add_argument('--rotations', type=int, default=12)
+    parser.add_argument('--output', '-o', type=Path, help="Write results as JSON to the given file.")
+    args = parser.parse_args()
+
+    history = SyntheticHistory(
+        packages_per_transaction=args.packages_per_transaction,
+        automatic_ratio=args.automatic_ratio,
+        error_rate=args.error_rate,
+        rotation_count=args.rotations,
+    )
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            for name, seconds in run_benchmarks(size, Path(directory) / str(size), history, args.repeat).items():
+                results.append({'size': size, 'benchmark': name, 'seconds': seconds})
+
+    report = {
+        'commit': _get_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {key: value for key, value in vars(args).items() if key != 'output'},
+        'results': results,
+    }
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2, default=str)
+    else:
+        with args.output.open('w') as file:
+            json.dump(report, file, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import gzip
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+from typing import Final, Iterator
+
+from apt_log.log import PackageAction
+
+_PACKAGE_PREFIXES: Final[tuple[str, ...]] = (
+    'lib', 'python3-', 'gir1.2-', 'fonts-', 'linux-', 'node-', 'golang-', 'r-cran-', 'ruby-', 'xserver-',
+)
+_PACKAGE_STEMS: Final[tuple[str, ...]] = (
+    'ssl', 'curl', 'gtk', 'glib', 'xml', 'yaml', 'jpeg', 'png', 'sqlite', 'systemd', 'dbus', 'pam', 'krb5', 'ldap',
+    'zstd', 'lzma', 'bz2', 'ffi', 'ncurses', 'readline', 'gnutls', 'nettle', 'idn', 'http', 'json', 'uuid', 'blkid',
+)
+_ARCHITECTURES: Final[tuple[str, ...]] = ('amd64', 'amd64', 'amd64', 'all', 'i386')
+_USERS: Final[tuple[str, ...]] = ('alice (1000)', 'bob (1001)', 'root (0)')
+
+
+@dataclass
+class SyntheticHistory:
+    # Generates a realistic APT history in the format of /var/log/apt/history.log.
+    entry_count: int = 1000
+    packages_per_transaction: int = 10
+    automatic_ratio: float = 0.5
+    error_rate: float = 0.01
+    rotation_count: int = 0
+    package_count: int = 5000
+    start_date: datetime = datetime(2015, 1, 1)
+    duration: timedelta = timedelta(days=10 * 365)
+    seed: int = 0
+
+    def _package_names(self, rng: random.Random) -> list[str]:
+        return [
+            f"{rng.choice(_PACKAGE_PREFIXES)}{rng.choice(_PACKAGE_STEMS)}{n}"
+            for n in range(self.package_count)
+        ]
+
+    def _format_version(self, major: int, minor: int) -> str:
+        return f"{major}.{minor}-{minor % 3 + 1}"
+
+    def _format_date(self, date: datetime) -> str:
+        return date.strftime('%Y-%m-%d  %H:%M:%S')
+
+    def generate_entries(self) -> Iterator[str]:
+        rng = random.Random(self.seed)  # noqa: S311
+        names = self._package_names(rng)
+        architectures = {name: rng.choice(_ARCHITECTURES) for name in names}
+        versions: dict[str, tuple[int, int]] = {}
+        date = self.start_date
+        mean_interval = self.duration.total_seconds() / max(self.entry_count, 1)
+
+        for _ in range(self.entry_count):
+            date += timedelta(seconds=rng.randint(1, max(2, int(2 * mean_interval))))
+            end_date = date + timedelta(seconds=rng.randint(1, 600))
+            action = rng.choices(
+                (PackageAction.INSTALL, PackageAction.UPGRADE, PackageAction.REMOVE, PackageAction.PURGE),
+                weights=(4, 4, 1, 1),
+            )[0]
+
+            packages = []
+            for name in rng.sample(names, min(self.packages_per_transaction, len(names))):
+                major, minor = versions.get(name, (rng.randint(0, 9), 0))
+                package = f"{name}:{architectures[name]} ({self._format_version(major, minor)}"
+
+                if action == PackageAction.UPGRADE:
+                    versions[name] = (major, minor + 1)
+                    package += f", {self._format_version(major, minor + 1)}"
+                else:
+                    versions[name] = (major, minor)
+
+                if action == PackageAction.INSTALL and rng.random() < self.automatic_ratio:
+                    package += ", automatic"
+
+                packages.append(package + ")")
+
+            command = {
+                PackageAction.INSTALL: f"apt-get install {packages[0].split(':')[0]}",
+                PackageAction.UPGRADE: "/usr/bin/unattended-upgrade",
+                PackageAction.REMOVE: f"apt-get remove {packages[0].split(':')[0]}",
+                PackageAction.PURGE: "apt-get autoremove --purge",
+            }[action]
+
+            lines = [f"Start-Date: {self._format_date(date)}", f"Commandline: {command}"]
+            if action != PackageAction.UPGRADE:
+                lines.append(f"Requested-By: {rng.choice(_USERS)}")
+            lines.append(f"{action}: {', '.join(packages)}")
+            if rng.random() < self.error_rate:
+                lines.append("Error: Sub-process /usr/bin/dpkg returned an error code (1)")
+            lines.append(f"End-Date: {self._format_date(end_date)}")
+
+            yield '\n'.join(lines)
+            date = end_date
+
+    def write(self, directory: Path) -> list[Path]:
+        # Writes the history split into the current log file and the given number of gzipped rotations. Returns the
+        # paths of the log files, oldest first.
+        directory.mkdir(parents=True, exist_ok=True)
+        paths = [directory / f'history.log.{n}.gz' for n in range(self.rotation_count, 0, -1)]
+        paths.append(directory / 'history.log')
+
+        entries = self.generate_entries()
+        entries_per_file = -(-self.entry_count // len(paths))
+
+        for n, path in enumerate(paths):
+            file_open = gzip.open if path.suffix == '.gz' else open
+            with file_open(path, 'wt') as file:
+                for entry in islice(entries, entries_per_file if n < len(paths) - 1 else None):
+                    file.write(f"\n{entry}\n")
+
+        return paths
@@ -12,3 +12,9 @@ def test(session):
     session.install("pytest")
     session.run('poetry', 'install')
     session.run('pytest')
+
+
+@nox.session(python=["3.12"])
+def benchmark(session):
+    session.run('poetry', 'install', '--all-extras')
+    session.run('python', '-m', 'benchmarks.bench', *session.posargs)
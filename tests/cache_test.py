@@ -0,0 +1,120 @@
+import gzip
+import os
+import stat
+from datetime import datetime
+
+import pytest
+
+from apt_log import reader
+from apt_log.cache import AptLogCache, LogFileIdentity
+from apt_log.details import LogFileIndex
+from apt_log.reader import build_system_apt_log
+
+
+@pytest.fixture
+def log_dir(tmp_path, monkeypatch, sample_log_file):
+    log_dir = tmp_path / 'log'
+    log_dir.mkdir()
+
+    with gzip.open(log_dir / 'history.log.1.gz', 'wt') as file:
+        file.write(sample_log_file)
+    (log_dir / 'history.log').write_text(sample_log_file.replace('2023', '2024'))
+
+    monkeypatch.setattr(reader, 'LOG_DIR', log_dir)
+    return log_dir
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = AptLogCache(tmp_path / 'cache' / 'entries.sqlite3')
+    yield cache
+    cache.close()
+
+
+class TestAptLogCache:
+
+    def test_get_and_put(self, cache, log_dir):
+        identity = LogFileIdentity.of(log_dir / 'history.log')
+
+        assert cache.get(identity) is None
+
+        cache.put(identity, [])
+        assert cache.get(identity) == []
+
+    def test_get_and_put_index(self, cache, log_dir):
+        identity = LogFileIdentity.of(log_dir / 'history.log')
+        index = LogFileIndex([datetime(2023, 1, 1)], [0])
+
+        assert cache.get_index(identity.path) is None
+
+        cache.put_index(identity, index)
+        assert cache.get_index(identity.path) == (identity, index)
+
+        cache.clear()
+        assert cache.get_index(identity.path) is None
+
+    def test_new_cache_is_private(self, cache):
+        cache.get_index('/var/log/dpkg.log')
+
+        assert stat.S_IMODE(cache.path.stat().st_mode) == 0o600
+        assert stat.S_IMODE(cache.path.parent.stat().st_mode) == 0o700
+
+    @pytest.mark.parametrize('writable_path', ['file', 'directory'])
+    def test_refuse_cache_writable_by_others(self, tmp_path, writable_path):
+        cache = AptLogCache(tmp_path / 'cache' / 'entries.sqlite3')
+        cache.get_index('/var/log/dpkg.log')
+        cache.close()
+
+        path = cache.path if writable_path == 'file' else cache.path.parent
+        path.chmod(path.stat().st_mode | stat.S_IWGRP)
+
+        with pytest.raises(PermissionError):
+            cache.get_index('/var/log/dpkg.log')
+
+    @pytest.mark.skipif(os.geteuid() != 0, reason="Changing the owner of files requires root.")
+    def test_refuse_cache_of_other_user(self, tmp_path):
+        cache = AptLogCache(tmp_path / 'cache' / 'entries.sqlite3')
+        cache.get_index('/var/log/dpkg.log')
+        cache.close()
+
+        os.chown(cache.path, 65534, 65534)
+
+        with pytest.raises(PermissionError):
+            cache.get_index('/var/log/dpkg.log')
+
+    def test_changed_file_is_a_miss(self, cache, log_dir):
+        path = log_dir / 'history.log'
+        cache.put(LogFileIdentity.of(path), [])
+
+        with path.open('a') as file:
+            file.write("\n")
+
+        assert cache.get(LogFileIdentity.of(path)) is None
+
+    def test_clear(self, cache, log_dir):
+        identity = LogFileIdentity.of(log_dir / 'history.log')
+        cache.put(identity, [])
+        cache.clear()
+
+        assert cache.get(identity) is None
+
+    def test_prune(self, cache, log_dir):
+        kept, pruned = LogFileIdentity.of(log_dir / 'history.log'), LogFileIdentity.of(log_dir / 'history.log.1.gz')
+        cache.put(kept, [])
+        cache.put(pruned, [])
+        cache.prune([log_dir / 'history.log'])
+
+        assert cache.get(kept) == []
+        assert cache.get(pruned) is None
+
+    def test_build_system_apt_log(self, cache, log_dir, monkeypatch):
+        log = build_system_apt_log(cache)
+        assert [entry.start_date.year for entry in log.entries] == [2023] * 3 + [2024] * 3
+
+        # Unchanged log files are not read again
+        def _fail(path):
+            raise AssertionError(path)
+
+        monkeypatch.setattr(reader, 'open_log_file', _fail)
+        log = build_system_apt_log(cache)
+        assert [entry.id for entry in log.entries] == list(range(1, 7))
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def format_log_entry(
+        start_date: datetime,
+        packages: str = 'example-package:amd64 (1.0.0)',
+        *,
+        action: str = 'Install',
+        command_line: str | None = 'apt-get install example-package',
+        requested_by: str | None = None,
+        duration: timedelta | None = timedelta(minutes=15),
+) -> str:
+    # Formats an entry like APT writes it to the history log, preceded by the blank line that separates it from the
+    # previous entry. Without duration, the entry lacks its end date, like one that APT is still writing.
+    lines = [f"Start-Date: {start_date:%Y-%m-%d  %H:%M:%S}"]
+
+    if command_line is not None:
+        lines.append(f"Commandline: {command_line}")
+    if requested_by is not None:
+        lines.append(f"Requested-By: {requested_by}")
+
+    lines.append(f"{action}: {packages}")
+
+    if duration is not None:
+        lines.append(f"End-Date: {start_date + duration:%Y-%m-%d  %H:%M:%S}")
+
+    return "\n" + "\n".join(lines) + "\n"
+
+
+@pytest.fixture
+def sample_package_list() -> str:
+    return "example-package:amd64 (1.0.0), auto-package:i386 (1.0.0, automatic), upgraded-package:arm64 (1.0.0, 2.0.0)"
+
+
+@pytest.fixture
+def sample_log_entry(sample_package_list) -> str:
+    return format_log_entry(datetime(2023, 1, 1, 10), sample_package_list, requested_by='user').strip("\n")
+
+
+@pytest.fixture
+def sample_log_file(sample_log_entry) -> str:
+    return f"\n{sample_log_entry}\n" * 3
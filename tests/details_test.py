@@ -0,0 +1,179 @@
+import gzip
+from datetime import datetime
+
+import pytest
+
+from apt_log.cache import AptLogCache
+from apt_log.details import DPKG_LOG, TERM_LOG, DpkgStatusChange, get_entry_details
+from apt_log.log import AptLogEntry
+from apt_log.reader import open_log_file
+
+
+def _dpkg_run(day: int, hour: int, package: str, *, lines: int = 2) -> str:
+    date = f"2023-01-{day:02} {hour:02}:00"
+    return (f"{date}:05 startup archives unpack\n"
+            f"{date}:05 install {package}:amd64 <none> 1.0\n"
+            + "".join(f"{date}:{second:02} status unpacked {package}:amd64 1.0\n" for second in range(6, 6 + lines))
+            + f"{date}:30 status installed {package}:amd64 1.0\n")
+
+
+def _term_log_run(day: int, hour: int, output: str) -> str:
+    date = f"2023-01-{day:02}  {hour:02}:00"
+    return f"\nLog started: {date}:00\n{output}\nLog ended: {date}:59\n"
+
+
+def _entry(day: int, hour: int, *, complete: bool = True) -> AptLogEntry:
+    start_date = datetime(2023, 1, day, hour)
+    return AptLogEntry(start_date=start_date, end_date=start_date.replace(second=59) if complete else None)
+
+
+@pytest.fixture
+def dpkg_log_paths(tmp_path) -> list:
+    rotated_path = tmp_path / 'dpkg.log.1.gz'
+    with gzip.open(rotated_path, 'wt') as file:
+        file.write(_dpkg_run(1, 10, 'old') + _dpkg_run(1, 11, 'older'))
+
+    path = tmp_path / 'dpkg.log'
+    path.write_text(_dpkg_run(2, 10, 'curl') + _dpkg_run(2, 10, 'curl-dependency') + _dpkg_run(3, 10, 'later'))
+
+    return [rotated_path, path]
+
+
+@pytest.fixture
+def term_log_paths(tmp_path) -> list:
+    path = tmp_path / 'term.log'
+    path.write_text(_term_log_run(1, 10, "Unpacking old") + _term_log_run(2, 10, "Unpacking curl\nSetting up curl"))
+    return [path]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = AptLogCache(tmp_path / 'cache' / 'entries.sqlite3')
+    yield cache
+    cache.close()
+
+
+class TestTimeIndexedLog:
+
+    def test_build_index(self, dpkg_log_paths):
+        index = DPKG_LOG.build_index(dpkg_log_paths[1])
+
+        assert index.dates == [datetime(2023, 1, 2, 10, 0, 5)] * 2 + [datetime(2023, 1, 3, 10, 0, 5)]
+        assert dpkg_log_paths[1].read_bytes()[index.offsets[1]:].startswith(b"2023-01-02 10:00:05 startup")
+
+    def test_build_index_across_chunks(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('apt_log.details.CHUNK_SIZE', 16)
+        path = tmp_path / 'term.log'
+        path.write_text(_term_log_run(1, 10, "x" * 40) + _term_log_run(2, 10, "y"))
+
+        index = TERM_LOG.build_index(path)
+
+        assert index.dates == [datetime(2023, 1, 1, 10), datetime(2023, 1, 2, 10)]
+        assert [path.read_bytes()[offset:offset + 12] for offset in index.offsets] == [b"Log started:"] * 2
+
+    def test_read(self, dpkg_log_paths):
+        runs = list(DPKG_LOG.read(dpkg_log_paths, datetime(2023, 1, 1, 11), datetime(2023, 1, 1, 11, 0, 59)))
+
+        assert runs == [_dpkg_run(1, 11, 'older').encode()]
+        assert list(DPKG_LOG.read(dpkg_log_paths, datetime(2023, 1, 4))) == []
+
+
+    def test_cached_index(self, dpkg_log_paths, cache, monkeypatch):
+        index = DPKG_LOG.get_index(dpkg_log_paths[1], cache)
+        assert index == DPKG_LOG.build_index(dpkg_log_paths[1])
+
+        # Unchanged log files are not scanned again, not even for their first dates.
+        DPKG_LOG.get_index(dpkg_log_paths[0], cache)
+        monkeypatch.setattr(type(DPKG_LOG), 'iter_markers', None)
+
+        assert DPKG_LOG.get_index(dpkg_log_paths[1], cache) == index
+        assert DPKG_LOG.get_first_date(dpkg_log_paths[0], cache) == datetime(2023, 1, 1, 10, 0, 5)
+        runs = list(DPKG_LOG.read(dpkg_log_paths, datetime(2023, 1, 1, 11), datetime(2023, 1, 1, 11, 0, 59), cache))
+        assert runs == [_dpkg_run(1, 11, 'older').encode()]
+
+    def test_cached_index_of_appended_file(self, dpkg_log_paths, cache, monkeypatch):
+        path = dpkg_log_paths[1]
+        DPKG_LOG.get_index(path, cache)
+
+        with path.open('a') as file:
+            file.write(_dpkg_run(4, 10, 'appended'))
+
+        # Only the last run and what has been appended are scanned.
+        scanned_offsets = []
+        iter_markers = type(DPKG_LOG).iter_markers
+        monkeypatch.setattr(type(DPKG_LOG), 'iter_markers', lambda self, path, offset=0: (
+            scanned_offsets.append(offset) or iter_markers(self, path, offset)
+        ))
+
+        index = DPKG_LOG.get_index(path, cache)
+
+        assert scanned_offsets == [index.offsets[2]]
+        assert index == DPKG_LOG.build_index(path)
+        assert len(index.dates) == 4
+
+    def test_cached_index_of_replaced_file(self, dpkg_log_paths, cache):
+        path = dpkg_log_paths[1]
+        DPKG_LOG.get_index(path, cache)
+
+        # The file has been truncated and written again, and has grown beyond its previous size.
+        size = path.stat().st_size
+        path.write_text(_dpkg_run(5, 10, 'new', lines=30))
+        assert path.stat().st_size > size
+
+        index = DPKG_LOG.get_index(path, cache)
+
+        assert index.dates == [datetime(2023, 1, 5, 10, 0, 5)]
+        assert index == DPKG_LOG.build_index(path)
+
+
+class TestGetEntryDetails:
+
+    def test_details(self, dpkg_log_paths, term_log_paths):
+        details = get_entry_details(_entry(2, 10), dpkg_log_paths, term_log_paths)
+
+        assert [change.package for change in details.dpkg_status_changes] == ['curl:amd64'] * 3 + [
+            'curl-dependency:amd64',
+        ] * 3
+        assert details.dpkg_status_changes[-1] == DpkgStatusChange(
+            datetime(2023, 1, 2, 10, 0, 30), 'installed', 'curl-dependency:amd64', '1.0',
+        )
+        assert details.terminal_output == "Unpacking curl\nSetting up curl"
+
+    def test_details_from_rotated_log(self, dpkg_log_paths, term_log_paths):
+        details = get_entry_details(_entry(1, 10), dpkg_log_paths, term_log_paths)
+
+        assert {change.package for change in details.dpkg_status_changes} == {'old:amd64'}
+        assert details.terminal_output == "Unpacking old"
+
+    def test_details_without_end_date(self, dpkg_log_paths, term_log_paths):
+        # Only the first run of dpkg is taken.
+        details = get_entry_details(_entry(2, 10, complete=False), dpkg_log_paths, term_log_paths)
+
+        assert {change.package for change in details.dpkg_status_changes} == {'curl:amd64'}
+
+    def test_details_with_cache(self, dpkg_log_paths, term_log_paths, cache):
+        details = get_entry_details(_entry(2, 10), dpkg_log_paths, term_log_paths)
+
+        assert get_entry_details(_entry(2, 10), dpkg_log_paths, term_log_paths, cache) == details
+        assert get_entry_details(_entry(2, 10), dpkg_log_paths, term_log_paths, cache) == details
+
+    def test_details_from_unreadable_log(self, dpkg_log_paths, term_log_paths, cache, monkeypatch):
+        # The terminal log is only readable by root and the adm group.
+        def _open_log_file(path, mode='rt'):
+            if path.name == 'term.log':
+                raise PermissionError(13, "Permission denied", str(path))
+            return open_log_file(path, mode)
+
+        monkeypatch.setattr('apt_log.details.open_log_file', _open_log_file)
+
+        for details in (
+            get_entry_details(_entry(2, 10), dpkg_log_paths, term_log_paths),
+            get_entry_details(_entry(2, 10), dpkg_log_paths, term_log_paths, cache),
+        ):
+            assert len(details.dpkg_status_changes) == 6
+            assert details.terminal_output == ""
+            assert details.unreadable_log_paths == term_log_paths
+
+    def test_no_details(self, dpkg_log_paths, term_log_paths):
+        assert get_entry_details(_entry(5, 10), dpkg_log_paths, term_log_paths).dpkg_status_changes == []
+        assert get_entry_details(AptLogEntry(), dpkg_log_paths, term_log_paths).terminal_output == ""
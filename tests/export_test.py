@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from apt_log.export import ExportFormat, ExportGranularity, export_entries
+from apt_log.log import AptLog, AptLogEntry, ChangedPackage, PackageAction
+
+
+@pytest.fixture
+def sample_log() -> AptLog:
+    return AptLog([
+        AptLogEntry(
+            start_date=datetime(2023, 1, 1, 10, 0, 0),
+            end_date=datetime(2023, 1, 1, 10, 15, 0),
+            command_line="apt-get install example-package",
+            requested_by="user",
+            changed_packages_by_action={PackageAction.INSTALL: [
+                ChangedPackage(name="example-package", architecture="amd64", version="1.0.0",
+                               action=PackageAction.INSTALL),
+                ChangedPackage(name="auto-package", architecture="amd64", version="1.0.0",
+                               action=PackageAction.INSTALL, is_automatic=True),
+            ]},
+        ),
+        AptLogEntry(
+            start_date=datetime(2023, 1, 2, 10, 0, 0),
+            end_date=datetime(2023, 1, 2, 10, 5, 0),
+            command_line="apt-get upgrade",
+            changed_packages_by_action={PackageAction.UPGRADE: [
+                ChangedPackage(name="example-package", architecture="amd64", version="2.0.0",
+                               previous_version="1.0.0", action=PackageAction.UPGRADE),
+            ]},
+        ),
+    ])
+
+
+def _export(entries, export_format, granularity) -> bytes:
+    file = io.BytesIO()
+    export_entries(entries, file, export_format, granularity)
+    return file.getvalue()
+
+
+class TestExport:
+
+    def test_export_jsonl(self, sample_log):
+        output = _export(sample_log.get_entries(), ExportFormat.JSONL, ExportGranularity.ENTRY)
+        rows = [json.loads(line) for line in output.decode().splitlines()]
+
+        assert len(rows) == 2
+        assert rows[0]['id'] == 1
+        assert rows[0]['start_date'] == '2023-01-01T10:00:00'
+        assert rows[0]['install_count'] == 2
+        assert rows[1]['upgrade_count'] == 1
+
+    def test_export_csv(self, sample_log):
+        output = _export(sample_log.get_entries(), ExportFormat.CSV, ExportGranularity.PACKAGE)
+        rows = list(csv.DictReader(io.StringIO(output.decode())))
+
+        assert [(row['entry_id'], row['name'], row['action']) for row in rows] == [
+            ('1', 'example-package', 'Install'),
+            ('1', 'auto-package', 'Install'),
+            ('2', 'example-package', 'Upgrade'),
+        ]
+        assert rows[2]['previous_version'] == '1.0.0'
+
+    def test_export_filtered_entries(self, sample_log):
+        output = _export(sample_log.get_entries(package_name='auto-*'), ExportFormat.JSONL, ExportGranularity.PACKAGE)
+        rows = [json.loads(line) for line in output.decode().splitlines()]
+
+        assert [row['name'] for row in rows] == ['auto-package']
+        assert rows[0]['is_automatic']
+
+    @pytest.mark.parametrize('export_format', [ExportFormat.ARROW, ExportFormat.PARQUET])
+    def test_export_columnar(self, sample_log, export_format):
+        pa = pytest.importorskip('pyarrow')
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        file = io.BytesIO()
+        export_entries(sample_log.get_entries(), file, export_format, ExportGranularity.PACKAGE, batch_size=2)
+        file.seek(0)
+
+        if export_format == ExportFormat.PARQUET:
+            table = pyarrow.parquet.read_table(file)
+        else:
+            table = pyarrow.ipc.open_stream(file).read_all()
+
+        assert table.num_rows == 3
+        assert pa.types.is_timestamp(table.schema.field('start_date').type)
+        assert pa.types.is_dictionary(table.schema.field('name').type)
+        assert table.column('name').to_pylist() == ['example-package', 'auto-package', 'example-package']
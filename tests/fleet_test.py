@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from apt_log.fleet import build_fleet_log, get_host_log_dirs
+from apt_log.log import InstalledPackage, PackageAction, date_to_timestamp
+from tests.conftest import format_log_entry
+
+
+def _log_entry(day: int, action: str, packages: str) -> str:
+    return format_log_entry(
+        datetime(2023, 1, day, 10),
+        packages,
+        action=action,
+        command_line=f'apt-get {action.lower()} example',
+        duration=timedelta(minutes=1),
+    )
+
+
+@pytest.fixture
+def fleet_dir(tmp_path) -> Path:
+    logs = {
+        'alpha': [
+            _log_entry(1, 'Install', 'openssl:amd64 (3.0.1), curl:amd64 (7.0)'),
+            _log_entry(5, 'Upgrade', 'openssl:amd64 (3.0.1, 3.0.2)'),
+        ],
+        'beta': [
+            _log_entry(2, 'Install', 'openssl:amd64 (3.0.1)'),
+        ],
+        'gamma': [
+            _log_entry(3, 'Install', 'openssl:amd64 (3.0.1)'),
+            _log_entry(4, 'Remove', 'openssl:amd64 (3.0.1)'),
+            _log_entry(6, 'Install', 'libssl:amd64 (3.0.1, automatic)'),
+            _log_entry(7, 'Upgrade', 'libssl:amd64 (3.0.1, 3.0.2)'),
+        ],
+    }
+
+    for host, log_entries in logs.items():
+        (tmp_path / host).mkdir()
+        (tmp_path / host / 'history.log').write_text("".join(log_entries))
+
+    # Directories without logs are not hosts.
+    (tmp_path / 'empty').mkdir()
+
+    return tmp_path
+
+
+class TestAptFleetLog:
+
+    def test_get_host_log_dirs(self, fleet_dir):
+        assert list(get_host_log_dirs(fleet_dir)) == ['alpha', 'beta', 'gamma']
+
+    @pytest.mark.parametrize('jobs', [1, 2])
+    def test_build_fleet_log(self, fleet_dir, jobs):
+        fleet_log = build_fleet_log(fleet_dir, jobs=jobs)
+
+        assert {host.name: host.entry_count for host in fleet_log.hosts.values()} == {'alpha': 2, 'beta': 1, 'gamma': 4}
+        assert fleet_log.hosts['alpha'].last_date == datetime(2023, 1, 5, 10)
+        assert sorted(fleet_log.package_index) == ['curl', 'libssl', 'openssl']
+        assert sorted(fleet_log.package_index['curl']) == ['alpha']
+
+        # Only the dates of changes are kept, and the installed packages, which are shared between hosts.
+        summary = fleet_log.package_index['openssl']['gamma']
+        assert list(summary.change_timestamps) == [
+            date_to_timestamp(datetime(2023, 1, 3, 10)), date_to_timestamp(datetime(2023, 1, 4, 10)),
+        ]
+        assert summary.installed == ()
+        assert fleet_log.package_index['curl']['alpha'].installed == (InstalledPackage('curl', 'amd64', '7.0'),)
+
+    @pytest.mark.parametrize('jobs', [1, 2])
+    def test_get_changes(self, fleet_dir, jobs):
+        fleet_log = build_fleet_log(fleet_dir, jobs=jobs)
+
+        changes = fleet_log.get_changes('openssl', actions=[PackageAction.INSTALL, PackageAction.UPGRADE])
+        assert {host: [change.version for change in changes] for host, changes in changes.items()} == {
+            'alpha': ['3.0.1', '3.0.2'],
+            'beta': ['3.0.1'],
+            'gamma': ['3.0.1'],
+        }
+
+        changes = fleet_log.get_changes('openssl', start_date=datetime(2023, 1, 3), end_date=datetime(2023, 1, 4, 12))
+        assert {host: [change.action for change in changes] for host, changes in changes.items()} == {
+            'gamma': [PackageAction.INSTALL, PackageAction.REMOVE],
+        }
+
+        assert [change.entry_id for change in fleet_log.get_changes('openssl')['gamma']] == [1, 2]
+        assert fleet_log.get_changes('openssl', start_date=datetime(2023, 1, 6)) == {}
+        assert fleet_log.get_changes('unknown') == {}
+
+    def test_get_installed_packages(self, fleet_dir):
+        fleet_log = build_fleet_log(fleet_dir)
+
+        assert fleet_log.get_installed_packages('openssl') == {
+            'alpha': [InstalledPackage('openssl', 'amd64', '3.0.2')],
+            'beta': [InstalledPackage('openssl', 'amd64', '3.0.1')],
+        }
+        assert fleet_log.get_hosts_on_version('openssl', '3.0.1') == ['beta']
+
+        # Upgrades keep packages installed automatically, as in the state of the log of a single host.
+        assert fleet_log.get_installed_packages('libssl') == {
+            'gamma': [InstalledPackage('libssl', 'amd64', '3.0.2', is_automatic=True)],
+        }
+        assert fleet_log.get_installed_packages('libssl')['gamma'] == list(
+            fleet_log.get_host_log('gamma').get_state().values(),
+        )
+        assert fleet_log.get_hosts_on_version('openssl', '1.0') == []
+
+    def test_get_host_log(self, fleet_dir):
+        log = build_fleet_log(fleet_dir).get_host_log('gamma')
+
+        assert [entry.host for entry in log.entries] == ['gamma'] * 4
+        assert list(log.get_state()) == [('libssl', 'amd64')]
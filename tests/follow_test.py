@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from apt_log.follow import AptLogFollower
+from apt_log.log import AptLog
+from tests.conftest import format_log_entry
+
+
+def _log_entry(hour: int, *, complete: bool = True) -> str:
+    return format_log_entry(
+        datetime(2023, 1, 1, hour),
+        f'example-package:amd64 (1.0.{hour})',
+        duration=timedelta(minutes=15) if complete else None,
+    )
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    log_file = tmp_path / 'history.log'
+    log_file.write_text(_log_entry(1) + _log_entry(2))
+    return log_file
+
+
+def _get_hours(entries):
+    return [entry.start_date.hour for entry in entries]
+
+
+class TestAptLogFollower:
+
+    def test_read_new_entries(self, log_file):
+        follower = AptLogFollower(log_file)
+
+        assert _get_hours(follower.read_new_entries()) == [1, 2]
+        assert follower.read_new_entries() == []
+
+        # Entries are held back until they are complete
+        with log_file.open('a') as file:
+            file.write(_log_entry(3, complete=False))
+        assert follower.read_new_entries() == []
+
+        with log_file.open('a') as file:
+            file.write("End-Date: 2023-01-01  03:15:00\n" + _log_entry(4)[:30])
+        assert _get_hours(follower.read_new_entries()) == [3]
+
+        with log_file.open('a') as file:
+            file.write(_log_entry(4)[30:])
+        assert _get_hours(follower.read_new_entries()) == [4]
+
+    def test_read_new_entries_with_offset(self, log_file):
+        follower = AptLogFollower(log_file, offset=len(_log_entry(1)))
+
+        assert _get_hours(follower.read_new_entries()) == [2]
+
+    def test_rotation_by_renaming(self, log_file):
+        follower = AptLogFollower(log_file)
+        follower.read_new_entries()
+
+        with log_file.open('a') as file:
+            file.write(_log_entry(3))
+        log_file.rename(log_file.with_name('history.log.1'))
+        log_file.write_text(_log_entry(4))
+
+        assert _get_hours(follower.read_new_entries()) == [3, 4]
+
+    def test_rotation_by_truncating(self, log_file):
+        follower = AptLogFollower(log_file)
+        follower.read_new_entries()
+
+        log_file.write_text(_log_entry(3))
+
+        assert _get_hours(follower.read_new_entries()) == [3]
+
+    def test_follow(self, log_file):
+        follower = AptLogFollower(log_file)
+        log = AptLog(follower.read_new_entries())
+        assert len(list(log.get_entries(package_name='example-package'))) == 2
+
+        with log_file.open('a') as file:
+            file.write(_log_entry(3))
+
+        entry = next(follower.follow(log, poll_interval=0.1))
+
+        assert entry.id == 3
+        assert log.get_last_entry() is entry
+        assert [entry.id for entry in log.get_entries(package_name='example-package')] == [1, 2, 3]
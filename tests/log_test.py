@@ -1,8 +1,20 @@
-from datetime import datetime
+from dataclasses import replace
+from datetime import datetime, timedelta
 
 import pytest
 
-from apt_log.log import AptLog, AptLogEntry, ChangedPackage, InvalidAptLogEntryIDError, PackageAction
+from apt_log.log import (
+    AptLog,
+    AptLogEntry,
+    AptLogQuery,
+    ChangedPackage,
+    InstalledPackage,
+    InvalidAptLogEntryIDError,
+    PackageAction,
+    PackageChange,
+    PackageStateChange,
+    is_entry_key,
+)
 
 
 @pytest.fixture
@@ -35,6 +47,66 @@ def sample_log_entries() -> list[AptLogEntry]:
         )]
 
 
+def test_is_entry_key():
+    assert is_entry_key('0f1e2d3c4b5a6978')
+    assert is_entry_key('0123456789012345')
+    assert is_entry_key('0F1E2D3C4B5A6978')
+    assert not is_entry_key('12')
+    assert not is_entry_key('0f1e2d3c4b5a697')
+    assert not is_entry_key('0f1e2d3c4b5a697g')
+
+
+class TestAptLogQuery:
+
+    def test_filter(self, sample_log_entries):
+        entry = sample_log_entries[0]
+
+        assert AptLogQuery().filter(entry) is entry
+        assert AptLogQuery(requested_by='user', command_pattern='install').filter(entry) is entry
+        assert AptLogQuery(package_name='example-*', actions=[PackageAction.INSTALL]).filter(entry) == entry
+        assert AptLogQuery(package_name='example-*', actions=[PackageAction.REMOVE]).filter(entry) is None
+        assert AptLogQuery(architecture='i386').filter(entry) is None
+        assert AptLogQuery(start_date=datetime(2023, 1, 1, 10, 20)).filter(entry) is None
+        assert AptLogQuery(end_date=datetime(2023, 1, 1, 9)).filter(entry) is None
+
+    def test_matches_header(self):
+        assert AptLogQuery(requested_by='alice').matches_header('alice (1000)', None)
+        assert AptLogQuery(requested_by='alice (1000)').matches_header('alice (1000)', None)
+        assert AptLogQuery(requested_by='alice').matches_header('alice', None)
+        assert not AptLogQuery(requested_by='alice').matches_header('alice2 (1001)', None)
+        assert not AptLogQuery(requested_by='1000').matches_header('alice (1000)', None)
+        assert not AptLogQuery(requested_by='alice').matches_header(None, None)
+
+    def test_matches_package(self):
+        query = AptLogQuery(package_name='lib*', architecture='amd64', version='1.0')
+
+        assert query.matches_package('libc6', 'amd64', '1.0')
+        assert not query.matches_package('libc6', 'i386', '1.0')
+        assert not query.matches_package('python3', 'amd64', '1.0')
+        assert not query.matches_package('libc6', 'amd64', '2.0')
+
+
+def _create_entry(day: int, action: PackageAction, name: str, version: str, **kwargs) -> AptLogEntry:
+    return AptLogEntry(
+        start_date=datetime(2023, 1, day),
+        end_date=datetime(2023, 1, day, 0, 1),
+        changed_packages_by_action={action: [ChangedPackage(name, 'amd64', version, action, **kwargs)]},
+    )
+
+
+@pytest.fixture
+def state_log_entries() -> list[AptLogEntry]:
+    return [
+        _create_entry(1, PackageAction.INSTALL, 'a', '1.0', is_automatic=True),
+        _create_entry(2, PackageAction.INSTALL, 'b', '1.0'),
+        _create_entry(3, PackageAction.UPGRADE, 'a', '2.0', previous_version='1.0'),
+        _create_entry(4, PackageAction.REMOVE, 'b', '1.0'),
+        _create_entry(5, PackageAction.INSTALL, 'c', '1.0'),
+        _create_entry(6, PackageAction.DOWNGRADE, 'c', '0.9', previous_version='1.0'),
+        _create_entry(7, PackageAction.PURGE, 'a', '2.0'),
+    ]
+
+
 class TestAptLog:
 
     def test_init(self, sample_log_entries):
@@ -44,6 +116,62 @@ class TestAptLog:
         assert apt_log.entries[0].id == 1
         assert apt_log.entries[1].id == 2
 
+    def test_init_sorts_runs(self):
+        # Three log files out of order, one of them with an entry out of order and two entries at the same time
+        files = [
+            [AptLogEntry(start_date=datetime(2023, 1, day)) for day in (1, 3, 2, 4)],
+            [AptLogEntry(start_date=datetime(2023, 2, day)) for day in (1, 2, 2)],
+            [AptLogEntry(start_date=datetime(2022, 12, day)) for day in (30, 31)],
+        ]
+        entries = [*files[1], *files[2], *files[0]]
+
+        apt_log = AptLog(entries)
+
+        assert list(map(id, apt_log.entries)) == list(map(id, sorted(entries, key=lambda entry: entry.start_date)))
+        assert [entry.id for entry in apt_log.entries] == list(range(1, 10))
+
+    def test_init_with_undated_entries(self):
+        entries = [
+            AptLogEntry(command_line='first'),
+            AptLogEntry(start_date=datetime(2023, 1, 2)),
+            AptLogEntry(command_line='after 2'),
+            AptLogEntry(start_date=datetime(2023, 1, 1)),
+            AptLogEntry(start_date=datetime(2023, 1, 3)),
+        ]
+
+        apt_log = AptLog(entries)
+
+        assert list(map(id, apt_log.entries)) == list(map(id, [entries[n] for n in (0, 3, 1, 2, 4)]))
+        assert apt_log._get_date_range(None, datetime(2023, 1, 1)) == range(2)
+        assert apt_log._get_date_range(None, datetime(2023, 1, 2)) == range(4)
+
+    def test_get_entries_with_unended_entries(self):
+        # An interrupted transaction long ago, without end date, overlaps any later dates.
+        entries = [AptLogEntry(start_date=datetime(2010, 1, 1), command_line='interrupted')] + [
+            AptLogEntry(start_date=datetime(year, 1, 1), end_date=datetime(year, 1, 1, 1)) for year in range(2011, 2021)
+        ]
+        for entry in entries:
+            entry.changed_packages_by_action = {PackageAction.INSTALL: [
+                ChangedPackage(name=f'package-{entry.start_date.year}', architecture='amd64', version='1.0',
+                               action=PackageAction.INSTALL),
+            ]}
+        apt_log = AptLog(entries)
+
+        assert apt_log._get_date_range(datetime(2020, 1, 1), None) == range(10, 11)
+        assert [entry.id for entry in apt_log.get_entries(start_date=datetime(2020, 1, 1))] == [1, 11]
+        assert [entry.id for entry in apt_log.get_entries(start_date=datetime(2020, 1, 1), reverse=True)] == [11, 1]
+        assert [entry.id for entry in apt_log.get_entries(start_date=datetime(2015, 6, 1),
+                                                          end_date=datetime(2015, 12, 1))] == [1]
+        assert [entry.id for entry in apt_log.get_entries(start_date=datetime(2020, 1, 1),
+                                                          package_name='package-2010')] == [1]
+        assert list(apt_log.get_entries(end_date=datetime(2009, 1, 1))) == []
+
+        apt_log.append(AptLogEntry(start_date=datetime(2021, 1, 1), changed_packages_by_action={
+            PackageAction.INSTALL: [ChangedPackage(name='late', architecture='amd64', version='1.0',
+                                                   action=PackageAction.INSTALL)],
+        }))
+        assert [entry.id for entry in apt_log.get_entries(start_date=datetime(2022, 1, 1))] == [1, 12]
+
     def test_get_entries(self, sample_log_entries):
         apt_log = AptLog(sample_log_entries)
 
@@ -65,6 +193,185 @@ class TestAptLog:
         entries = list(apt_log.get_entries(package_name='*-p'))
         assert len(entries) == 0
 
+    def test_get_entries_by_package(self, sample_log_entries):
+        sample_log_entries[1].changed_packages_by_action[PackageAction.UPGRADE].append(ChangedPackage(
+            name="example-package",
+            architecture="i386",
+            version="1.0.1",
+            previous_version="1.0.0",
+            action=PackageAction.UPGRADE,
+        ))
+        apt_log = AptLog(sample_log_entries)
+
+        assert apt_log.get_package_names() == {'example-package', 'upgraded-package'}
+        assert apt_log.get_package_names('*-package') == {'example-package', 'upgraded-package'}
+        assert apt_log.get_package_names('example-package') == {'example-package'}
+        assert apt_log.get_package_names('another-package') == set()
+
+        entries = list(apt_log.get_entries(package_name='example-package'))
+        assert [entry.id for entry in entries] == [1, 2]
+        assert entries[1].changed_packages_by_action[PackageAction.UPGRADE][0].architecture == 'i386'
+
+        entries = list(apt_log.get_entries(architecture='i386'))
+        assert [entry.id for entry in entries] == [2]
+        assert len(entries[0].changed_packages_by_action[PackageAction.UPGRADE]) == 1
+
+        entries = list(apt_log.get_entries(package_name='upgraded-*', architecture='i386'))
+        assert entries == []
+
+        entries = list(apt_log.get_entries(package_name='*-package', start_date=datetime(2023, 1, 1, 10, 20, 0)))
+        assert [entry.id for entry in entries] == [2]
+        assert len(entries[0].changed_packages_by_action[PackageAction.UPGRADE]) == 2
+
+    def test_get_entries_in_date_range(self):
+        entries = [
+            AptLogEntry(
+                start_date=datetime(2023, 1, 1) + timedelta(hours=n),
+                end_date=datetime(2023, 1, 1) + timedelta(hours=n, minutes=30 if n != 3 else 300),
+                changed_packages_by_action={PackageAction.INSTALL: [ChangedPackage(
+                    name=f"package-{n}",
+                    architecture="amd64",
+                    version="1.0.0",
+                    action=PackageAction.INSTALL,
+                )]},
+            )
+            for n in range(10)
+        ]
+        apt_log = AptLog(entries)
+
+        def _get_entry_ids(start_date, end_date):
+            return [entry.id for entry in apt_log.get_entries(start_date=start_date, end_date=end_date)]
+
+        assert _get_entry_ids(datetime(2023, 1, 1, 5, 45), datetime(2023, 1, 1, 7, 0)) == [4, 7, 8]
+        assert _get_entry_ids(datetime(2023, 1, 1, 5, 15), None) == [4, 6, 7, 8, 9, 10]
+        assert _get_entry_ids(None, datetime(2023, 1, 1, 1, 59)) == [1, 2]
+        assert _get_entry_ids(datetime(2023, 1, 2), None) == []
+
+        # Dates are compared at the resolution of the log, but entries that end right before a date do not match it.
+        assert _get_entry_ids(datetime(2023, 1, 1, 0, 30, 0, 1), datetime(2023, 1, 1, 1, 0, 0, 1)) == [2]
+
+    def test_entry_dates(self):
+        entry = AptLogEntry(start_date=datetime(2023, 1, 1, 10), end_date=datetime(2023, 1, 1, 10, 1, 30))
+
+        assert (entry.start_timestamp, entry.end_timestamp) == (1672567200, 1672567290)
+        assert entry.duration == timedelta(seconds=90)
+
+        entry.end_timestamp = None
+        assert entry.end_date is None
+        assert entry.duration is None
+
+    def test_get_entries_by_requester_and_command(self, sample_log_entries):
+        apt_log = AptLog(sample_log_entries)
+
+        assert [entry.id for entry in apt_log.get_entries(requested_by='user')] == [1]
+        assert [entry.id for entry in apt_log.get_entries(command_pattern='upgrade$')] == [2]
+        assert [entry.id for entry in apt_log.get_entries(command_pattern='^apt-get', requested_by='user')] == [1]
+        assert [entry.id for entry in apt_log.get_entries(command_pattern='remove')] == []
+
+    def test_get_entries_with_limit(self, sample_log_entries):
+        apt_log = AptLog(sample_log_entries)
+
+        assert [entry.id for entry in apt_log.get_entries(limit=1)] == [1]
+        assert [entry.id for entry in apt_log.get_entries(offset=1)] == [2]
+        assert [entry.id for entry in apt_log.get_entries(offset=1, limit=5)] == [2]
+        assert [entry.id for entry in apt_log.get_entries(reverse=True)] == [2, 1]
+        assert [entry.id for entry in apt_log.get_entries(reverse=True, limit=1)] == [2]
+        assert [entry.id for entry in apt_log.get_entries(package_name='*-package', reverse=True, offset=1)] == [1]
+
+    def test_get_package_timeline(self, sample_log_entries):
+        sample_log_entries[1].changed_packages_by_action[PackageAction.UPGRADE].append(ChangedPackage(
+            name="example-package",
+            architecture="amd64",
+            version="1.0.1",
+            previous_version="1.0.0",
+            action=PackageAction.UPGRADE,
+            is_automatic=True,
+        ))
+        apt_log = AptLog(sample_log_entries)
+
+        assert apt_log.get_package_timeline('example-package') == [
+            PackageChange(1, datetime(2023, 1, 1, 10, 0, 0), PackageAction.INSTALL, 'amd64', '1.0.0'),
+            PackageChange(
+                2, datetime(2023, 1, 1, 10, 25, 0), PackageAction.UPGRADE, 'amd64', '1.0.1', '1.0.0', is_automatic=True,
+            ),
+        ]
+        assert apt_log.get_package_timeline('another-package') == []
+
+        assert list(apt_log.get_package_timelines('*-package')) == ['example-package', 'upgraded-package']
+        assert list(apt_log.get_package_timelines('upgraded-package')) == ['upgraded-package']
+        assert apt_log.get_package_timelines('another-package') == {}
+
+        apt_log.append(AptLogEntry(
+            start_date=datetime(2023, 1, 2),
+            changed_packages_by_action={PackageAction.REMOVE: [ChangedPackage(
+                name="example-package",
+                architecture="amd64",
+                version="1.0.1",
+                action=PackageAction.REMOVE,
+            )]},
+        ))
+
+        assert [change.entry_id for change in apt_log.get_package_timeline('example-package')] == [1, 2, 3]
+
+    @pytest.mark.parametrize('checkpoint_interval', [1, 2, 3, 100])
+    def test_get_state(self, state_log_entries, checkpoint_interval):
+        apt_log = AptLog(state_log_entries)
+        apt_log.STATE_CHECKPOINT_INTERVAL = checkpoint_interval
+
+        assert apt_log.get_state(entry_id=3) == {
+            ('a', 'amd64'): InstalledPackage('a', 'amd64', '2.0', is_automatic=True),
+            ('b', 'amd64'): InstalledPackage('b', 'amd64', '1.0'),
+        }
+        assert apt_log.get_state(date=datetime(2023, 1, 6, 12)) == {
+            ('a', 'amd64'): InstalledPackage('a', 'amd64', '2.0', is_automatic=True),
+            ('c', 'amd64'): InstalledPackage('c', 'amd64', '0.9'),
+        }
+        assert apt_log.get_state(date=datetime(2022, 12, 31)) == {}
+        assert apt_log.get_state() == {('c', 'amd64'): InstalledPackage('c', 'amd64', '0.9')}
+
+        # Every state is replayed from a checkpoint and equals the one replayed from the beginning.
+        state = {}
+        for entry in apt_log.entries:
+            entry.apply_to_state(state)
+            assert apt_log.get_state(entry_id=entry.id) == state
+
+        with pytest.raises(InvalidAptLogEntryIDError):
+            apt_log.get_state(entry_id=8)
+
+    def test_diff_states(self, state_log_entries):
+        apt_log = AptLog(state_log_entries)
+        apt_log.STATE_CHECKPOINT_INTERVAL = 2
+
+        assert apt_log.diff_states(old_entry_id=2, new_date=datetime(2023, 1, 6)) == [
+            PackageStateChange(
+                'a', 'amd64',
+                InstalledPackage('a', 'amd64', '1.0', is_automatic=True),
+                InstalledPackage('a', 'amd64', '2.0', is_automatic=True),
+            ),
+            PackageStateChange('b', 'amd64', InstalledPackage('b', 'amd64', '1.0'), None),
+            PackageStateChange('c', 'amd64', None, InstalledPackage('c', 'amd64', '0.9')),
+        ]
+        assert apt_log.diff_states(old_entry_id=7, new_entry_id=5) == [
+            PackageStateChange('a', 'amd64', None, InstalledPackage('a', 'amd64', '2.0', is_automatic=True)),
+            PackageStateChange(
+                'c', 'amd64',
+                InstalledPackage('c', 'amd64', '0.9'),
+                InstalledPackage('c', 'amd64', '1.0'),
+            ),
+        ]
+        assert apt_log.diff_states(old_entry_id=4, new_entry_id=4) == []
+
+    def test_get_state_after_append(self, state_log_entries):
+        apt_log = AptLog(state_log_entries[:3])
+        apt_log.STATE_CHECKPOINT_INTERVAL = 2
+        apt_log.get_state()
+
+        for entry in state_log_entries[3:]:
+            apt_log.append(entry)
+
+        assert len(apt_log._state_checkpoints) == 4
+        assert apt_log.get_state() == {('c', 'amd64'): InstalledPackage('c', 'amd64', '0.9')}
+
     def test_apt_log_get_entry_by_id(self, sample_log_entries):
         apt_log = AptLog(sample_log_entries)
 
@@ -78,6 +385,29 @@ class TestAptLog:
         with pytest.raises(InvalidAptLogEntryIDError):
             apt_log.get_entry_by_id(3)
 
+    def test_apt_log_get_entry_by_key(self, sample_log_entries):
+        sample_log_entries[0].key = 'first'
+        sample_log_entries[1].key = 'second'
+        apt_log = AptLog(sample_log_entries)
+
+        assert apt_log.get_entry_by_key('second') is sample_log_entries[1]
+        with pytest.raises(InvalidAptLogEntryIDError):
+            apt_log.get_entry_by_key('third')
+
+    def test_deduplicate(self, sample_log_entries):
+        first_entry, second_entry = sample_log_entries
+        first_entry.key, second_entry.key = 'first', 'second'
+        copies = [replace(entry) for entry in sample_log_entries]
+
+        # Entries without key are never duplicates.
+        entries = [second_entry, first_entry, *copies, AptLogEntry(), AptLogEntry()]
+
+        assert len(AptLog(entries).entries) == 6
+        entries = AptLog(entries, deduplicate=True).entries
+        assert len(entries) == 4
+        assert {entry.key for entry in entries} == {'first', 'second', None}
+        assert first_entry in entries and second_entry in entries
+
     def test_apt_log_get_last_entry(self, sample_log_entries):
         apt_log = AptLog(sample_log_entries)
 
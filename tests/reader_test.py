@@ -1,28 +1,35 @@
+import gzip
+import io
 from datetime import datetime, timedelta
+from itertools import chain
+from pathlib import Path
 
 import pytest
 
-from apt_log.log import AptLog, AptLogEntry, PackageAction
-from apt_log.reader import AptLogReader
+from apt_log.log import (
+    AptLog,
+    AptLogEntry,
+    AptLogQuery,
+    InvalidAptLogEntryIDError,
+    LazyAptLogEntry,
+    PackageAction,
+    timestamp_to_date,
+)
+from apt_log.reader import AptLogReader, read_log_file
 
 
 @pytest.fixture
-def sample_package_list() -> str:
-    return "example-package:amd64 (1.0.0), auto-package:i386 (1.0.0, automatic), upgraded-package:arm64 (1.0.0, 2.0.0)"
+def sample_log_paths(tmp_path, sample_log_file) -> list[Path]:
+    paths = [tmp_path / 'history.log.2.gz', tmp_path / 'history.log.1.gz', tmp_path / 'history.log']
 
+    for year, path in enumerate(paths, 2021):
+        content = sample_log_file.replace('2023', str(year)).replace('10:00:00', '{}:00:00')
+        content = content.format(10, 11, 12)
 
-@pytest.fixture
-def sample_log_entry(sample_package_list) -> str:
-    return (f"Start-Date: 2023-01-01 10:00:00\n"
-            f"End-Date: 2023-01-01 10:15:00\n"
-            f"Commandline: apt-get install example-package\n"
-            f"Requested-By: user\n"
-            f"Install: {sample_package_list}")
-
+        with (gzip.open if path.suffix == '.gz' else open)(path, 'wt') as file:
+            file.write(content)
 
-@pytest.fixture
-def sample_log_file(sample_log_entry) -> str:
-    return f"\n{sample_log_entry}\n" * 3
+    return paths
 
 
 class TestAptLogReader:
@@ -32,6 +39,32 @@ class TestAptLogReader:
 
         assert parsed_date == datetime(2023, 1, 1, 12, 0, 0)
 
+    @pytest.mark.parametrize('date_string', [
+        '2023-01-01  12:00:00',
+        '2023-01-01 12:00:00',
+        '2024-02-29  23:59:59',
+        '1969-12-31  23:59:59',
+        # Not in the fixed-width format, which is left to strptime
+        '2023-1-1  12:00:00',
+        '2023-01-01\t12:00:00',
+    ])
+    def test_parse_timestamp(self, date_string):
+        expected = datetime.strptime(date_string, '%Y-%m-%d  %H:%M:%S')
+
+        assert timestamp_to_date(AptLogReader().parse_timestamp(date_string)) == expected
+
+    @pytest.mark.parametrize('date_string', [
+        '2023-02-30  12:00:00',
+        '2023-01-01  24:00:00',
+        '2023-01-01  12:00:60',
+        '2023-01-01  1²:00:00',
+        '2023-01-01  12:00',
+        '',
+    ])
+    def test_parse_invalid_timestamp(self, date_string):
+        with pytest.raises(ValueError):
+            AptLogReader().parse_timestamp(date_string)
+
     def test_parse_package_list(self, sample_package_list):
         packages = list(AptLogReader().parse_package_list(sample_package_list, action=PackageAction.INSTALL))
 
@@ -58,6 +91,13 @@ class TestAptLogReader:
         assert not packages[2].is_automatic
         assert packages[2].action == PackageAction.INSTALL
 
+    def test_parse_package_list_shares_strings(self, sample_package_list):
+        packages = list(AptLogReader().parse_package_list(sample_package_list, action=PackageAction.INSTALL))
+        other_packages = list(AptLogReader().parse_package_list(sample_package_list, action=PackageAction.UPGRADE))
+
+        assert packages[0].name is other_packages[0].name
+        assert packages[0].version is packages[1].version is packages[2].previous_version
+
     def test_parse_log_entry(self, sample_log_entry):
         log_entry = AptLogReader().parse_log_entry(sample_log_entry)
 
@@ -71,6 +111,31 @@ class TestAptLogReader:
         assert log_entry.changed_packages_by_action.keys() == {PackageAction.INSTALL}
         assert len(log_entry.changed_packages_by_action[PackageAction.INSTALL]) == 3
 
+    def test_parse_lazy_log_entry(self, sample_log_entry):
+        eager_log_entry = AptLogReader().parse_log_entry(sample_log_entry)
+        lazy_log_entry = AptLogReader(lazy=True).parse_log_entry(sample_log_entry)
+
+        assert isinstance(lazy_log_entry, LazyAptLogEntry)
+        assert lazy_log_entry.start_date == eager_log_entry.start_date
+        assert lazy_log_entry.has_changed_packages()
+        assert lazy_log_entry._raw_package_lists is not None
+
+        assert lazy_log_entry.changed_packages_by_action == eager_log_entry.changed_packages_by_action
+        assert lazy_log_entry._raw_package_lists is None
+        assert lazy_log_entry == eager_log_entry
+
+    def test_compare_lazy_log_entry(self, sample_log_entry):
+        eager_log_entry = AptLogReader().parse_log_entry(sample_log_entry)
+        lazy_log_entry = AptLogReader(lazy=True).parse_log_entry(sample_log_entry)
+
+        # Keys are not compared, just like between eager entries.
+        eager_log_entry.key = None
+        assert lazy_log_entry == eager_log_entry
+        assert eager_log_entry == lazy_log_entry
+
+        eager_log_entry.error = 'Failed'
+        assert lazy_log_entry != eager_log_entry
+
     def test_read_log_entries(self, sample_log_file, sample_log_entry):
         log_entries = list(AptLogReader().read_log_entries(sample_log_file))
 
@@ -79,6 +144,23 @@ class TestAptLogReader:
         assert log_entries[1] == sample_log_entry
         assert log_entries[2] == sample_log_entry
 
+    def test_read_log_entries_from_lines(self, sample_log_file, sample_log_entry):
+        lines = iter(io.StringIO(sample_log_file))
+        log_entries = AptLogReader().read_log_entries(lines)
+
+        # Entries are yielded as soon as they are complete
+        assert next(log_entries) == sample_log_entry
+        assert len(list(lines)) == 11
+
+    def test_read_log_file(self, tmp_path, sample_log_file, sample_log_entry):
+        path = tmp_path / 'history.log.1.gz'
+        with gzip.open(path, 'wt') as file:
+            file.write(sample_log_file)
+
+        log_entries = list(AptLogReader().read_log_entries(read_log_file(path)))
+
+        assert log_entries == [sample_log_entry] * 3
+
     def test_parse_log_files(self, sample_log_file):
         log_entries = list(AptLogReader().parse_log_files(sample_log_file))
 
@@ -91,3 +173,169 @@ class TestAptLogReader:
         log = AptLogReader().build_log(sample_log_file)
         assert isinstance(log, AptLog)
         assert len(log.entries) == 3
+
+    def test_build_log_in_parallel(self, sample_log_file):
+        log_files = [sample_log_file.replace('2023', str(year)) for year in (2021, 2023, 2022)]
+
+        serial_log = AptLogReader().build_log(*log_files)
+        parallel_log = AptLogReader().build_log(*log_files, jobs=2)
+
+        assert parallel_log.entries == serial_log.entries
+        assert [entry.start_date.year for entry in parallel_log.entries] == [2021] * 3 + [2022] * 3 + [2023] * 3
+
+    def test_entry_keys(self, sample_log_paths):
+        keys = [entry.key for entry in AptLogReader().build_log(*sample_log_paths).entries]
+
+        # Keys depend on the content of entries only, wherever they are read from.
+        assert len(set(keys)) == 3 * 3
+        assert [entry.key for entry in AptLogReader(lazy=True).build_log(*sample_log_paths).entries] == keys
+        assert AptLogReader().find_log_entry(sample_log_paths, 5).key == keys[4]
+
+        queried_log = AptLogReader(query=AptLogQuery(package_name='none')).build_log(*sample_log_paths)
+        assert queried_log.entries[4].key == keys[4]
+
+    def test_build_log_from_overlapping_files(self, sample_log_paths, tmp_path):
+        # A backup copy of the log files that overlaps both of the older ones
+        backup_path = tmp_path / 'backup' / 'history.log'
+        backup_path.parent.mkdir()
+        backup_path.write_text("".join(chain.from_iterable(map(read_log_file, sample_log_paths[:2]))))
+
+        log = AptLogReader(deduplicate=True).build_log(*sample_log_paths, backup_path)
+
+        assert [entry.start_date.year for entry in log.entries] == [2021] * 3 + [2022] * 3 + [2023] * 3
+        assert [entry.id for entry in log.entries] == list(range(1, 10))
+        assert len(AptLogReader().build_log(*sample_log_paths, backup_path).entries) == 15
+
+    def test_count_log_entries(self, sample_log_paths):
+        assert [AptLogReader().count_log_entries(path) for path in sample_log_paths] == [3, 3, 3]
+
+        # Entries are also found across chunk boundaries
+        assert AptLogReader(CHUNK_SIZE=5).count_log_entries(sample_log_paths[-1]) == 3
+
+    def test_count_undated_log_entries(self, tmp_path):
+        path = tmp_path / 'history.log'
+        path.write_text("Commandline: apt-get check\n\n\n\nStart-Date: 2023-01-01  10:00:00\n\nError: Failed\n")
+
+        assert AptLogReader().count_log_entries(path) == 3
+        assert AptLogReader(CHUNK_SIZE=1).count_log_entries(path) == 3
+
+    def test_find_log_entry(self, sample_log_paths):
+        log = AptLogReader().build_log(*sample_log_paths)
+
+        for entry in log.entries:
+            assert AptLogReader().find_log_entry(sample_log_paths, entry.id) == entry
+
+        with pytest.raises(InvalidAptLogEntryIDError):
+            AptLogReader().find_log_entry(sample_log_paths, 10)
+
+    def test_find_log_entry_in_unordered_file(self, sample_log_paths):
+        sample_log_paths[-1].write_text(sample_log_paths[-1].read_text().replace('11:00:00', '09:00:00'))
+        log = AptLogReader().build_log(*sample_log_paths)
+
+        assert AptLogReader().find_log_entry(sample_log_paths, 8) == log.get_entry_by_id(8)
+
+    def test_find_log_entry_before_unordered_entry(self, sample_log_paths):
+        # The entry itself is in order, but a later one of the same file is not.
+        sample_log_paths[-1].write_text(sample_log_paths[-1].read_text().replace('12:00:00', '10:30:00'))
+        log = AptLogReader().build_log(*sample_log_paths)
+
+        assert AptLogReader().find_log_entry(sample_log_paths, 8) == log.get_entry_by_id(8)
+        assert AptLogReader().find_log_entry(sample_log_paths, 8).start_date == datetime(2023, 1, 1, 10, 30)
+
+    def test_find_log_entry_in_overlapping_files(self, sample_log_paths):
+        sample_log_paths[-1].write_text(sample_log_paths[-1].read_text().replace('2023', '2020'))
+        log = AptLogReader().build_log(*sample_log_paths)
+
+        for entry_id in (5, 7):
+            assert AptLogReader().find_log_entry(sample_log_paths, entry_id) == log.get_entry_by_id(entry_id)
+
+    def test_find_log_entry_after_unordered_file(self, tmp_path):
+        # The last entry of the older file is not its latest one, which overlaps the entries of the newer file.
+        paths = [tmp_path / 'history.log.1', tmp_path / 'history.log']
+        for path, times in zip(paths, [('00:01:00', '00:05:00', '00:00:30'), ('00:02:00', '00:03:00')], strict=True):
+            path.write_text(''.join(f"Start-Date: 2023-01-01  {time}\nCommandline: apt check\n\n" for time in times))
+        log = AptLogReader().build_log(*paths)
+
+        for entry in log.entries:
+            assert AptLogReader().find_log_entry(paths, entry.id) == entry
+        assert AptLogReader().find_log_entry(paths, 4).start_date == datetime(2023, 1, 1, 0, 3)
+
+    def test_find_log_entry_after_undated_entry(self, sample_log_paths):
+        sample_log_paths[-1].write_text("Commandline: apt-get check\n" + sample_log_paths[-1].read_text())
+        log = AptLogReader().build_log(*sample_log_paths)
+
+        assert AptLogReader().find_log_entry(sample_log_paths, 10) == log.get_entry_by_id(10)
+        assert AptLogReader().find_log_entry(sample_log_paths, 7).command_line == 'apt-get check'
+
+    def test_find_last_log_entry(self, sample_log_paths):
+        last_entry = AptLogReader().find_last_log_entry(sample_log_paths)
+        assert last_entry.start_date == datetime(2023, 1, 1, 12, 0, 0)
+        assert AptLogReader(CHUNK_SIZE=5).find_last_log_entry(sample_log_paths) == last_entry
+
+        # The last entry is found in rotated log files if the current log file is empty
+        sample_log_paths[-1].write_text('')
+        last_entry = AptLogReader().find_last_log_entry(sample_log_paths)
+        assert last_entry.start_date == datetime(2022, 1, 1, 12, 0, 0)
+
+    def test_find_last_log_entry_in_unordered_file(self, sample_log_paths):
+        sample_log_paths[-1].write_text(sample_log_paths[-1].read_text().replace('12:00:00', '09:00:00'))
+        log = AptLogReader().build_log(*sample_log_paths)
+
+        assert AptLogReader().find_last_log_entry(sample_log_paths) == log.get_last_entry()
+        assert AptLogReader().find_last_log_entry(sample_log_paths).start_date == datetime(2023, 1, 1, 11)
+
+    def test_build_lazy_log(self, sample_log_file):
+        log = AptLogReader(lazy=True).build_log(sample_log_file)
+
+        assert len(list(log.get_entries(package_name='auto-package'))) == 3
+        assert log.entries == AptLogReader().build_log(sample_log_file).entries
+
+    @pytest.mark.parametrize('query', [
+        AptLogQuery(start_date=datetime(2022, 1, 1, 11, 10)),
+        AptLogQuery(end_date=datetime(2022, 1, 1, 11)),
+        AptLogQuery(package_name='auto-package'),
+        AptLogQuery(package_name='*-package', architecture='arm64'),
+        AptLogQuery(version='1.0.0', actions=[PackageAction.INSTALL]),
+        AptLogQuery(actions=[PackageAction.REMOVE]),
+        AptLogQuery(requested_by='user', command_pattern=r'install \S+-package'),
+        AptLogQuery(requested_by='root'),
+        AptLogQuery(command_pattern='^apt remove'),
+    ])
+    def test_build_log_with_query(self, sample_log_paths, query):
+        log = AptLogReader(query=query).build_log(*sample_log_paths)
+        entries = list(log.get_matching_entries(query))
+
+        # The same entries are selected, with the same IDs, as by filtering the complete log.
+        assert entries == list(AptLogReader().build_log(*sample_log_paths).get_matching_entries(query))
+        assert len(log.entries) == 9
+
+        assert list(AptLogReader(query=query).iter_matching_entries(*sample_log_paths)) == entries
+
+    def test_iter_matching_entries(self, sample_log_paths):
+        log = AptLogReader().build_log(*sample_log_paths)
+
+        assert list(AptLogReader().iter_matching_entries(*sample_log_paths)) == log.entries
+
+        entries = list(AptLogReader(deduplicate=True).iter_matching_entries(*sample_log_paths, *sample_log_paths))
+        assert entries == log.entries
+
+    def test_iter_matching_entries_of_unordered_files(self, sample_log_paths):
+        sample_log_paths[-1].write_text(sample_log_paths[-1].read_text().replace('2023', '2020'))
+        query = AptLogQuery(start_date=datetime(2021, 1, 1))
+        log = AptLogReader().build_log(*sample_log_paths)
+
+        # The entries keep the IDs that AptLog assigns after sorting them.
+        assert list(AptLogReader().iter_matching_entries(*sample_log_paths)) == log.entries
+        entries = AptLogReader(query=query).iter_matching_entries(*sample_log_paths)
+        assert [entry.id for entry in entries] == [4, 5, 6, 7, 8, 9]
+
+    def test_parse_log_entry_with_query(self, sample_log_entry):
+        entry = AptLogReader(query=AptLogQuery(package_name='auto-*')).parse_log_entry(sample_log_entry)
+
+        assert [package.name for package in entry.changed_packages_by_action[PackageAction.INSTALL]] == ['auto-package']
+        assert entry.command_line == 'apt-get install example-package'
+
+        # Entries that do not match are reduced to their dates.
+        entry = AptLogReader(query=AptLogQuery(requested_by='root')).parse_log_entry(sample_log_entry)
+
+        assert entry == AptLogEntry(start_date=datetime(2023, 1, 1, 10), end_date=datetime(2023, 1, 1, 10, 15))
@@ -0,0 +1,121 @@
+import threading
+from datetime import datetime
+from http import HTTPStatus
+
+import pytest
+
+from apt_log.follow import AptLogFollower
+from apt_log.log import AptLog, AptLogEntry, AptLogQuery, InvalidAptLogEntryIDError, PackageAction
+from apt_log.reader import AptLogReader
+from apt_log.server import AptLogClient, AptLogServer, AptLogServerError
+from tests.conftest import format_log_entry
+
+
+def _log_entry(hour: int, package: str = 'example-package') -> str:
+    return format_log_entry(
+        datetime(2023, 1, 1, hour),
+        f'{package}:amd64 (1.0.{hour}), libexample:amd64 (2.0, automatic)',
+        command_line=f'apt-get install {package}',
+        requested_by='user (1000)',
+    )
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    log_file = tmp_path / 'history.log'
+    log_file.write_text(_log_entry(1) + _log_entry(2, 'other-package'))
+    return log_file
+
+
+@pytest.fixture
+def server(log_file) -> AptLogServer:
+    follower = AptLogFollower(log_file, reader=AptLogReader(lazy=True))
+    return AptLogServer(AptLog(follower.read_new_entries()), follower)
+
+
+@pytest.fixture
+def client(server, tmp_path) -> AptLogClient:
+    socket_path = tmp_path / 'apt-log.sock'
+    http_server = server.create_http_server(socket_path)
+    thread = threading.Thread(target=http_server.serve_forever)
+    thread.start()
+
+    yield AptLogClient(socket_path)
+
+    http_server.shutdown()
+    http_server.server_close()
+    thread.join()
+
+
+class TestAptLogServer:
+
+    def test_get_matching_entries(self, client, log_file):
+        entries = client.get_matching_entries(AptLogQuery())
+        assert entries == AptLogReader().build_log(log_file).entries
+
+        query = AptLogQuery(package_name='other-*', actions=[PackageAction.INSTALL], start_date=datetime(2023, 1, 1))
+        entries = client.get_matching_entries(query)
+        assert [entry.id for entry in entries] == [2]
+        assert [package.name for package in entries[0].changed_packages_by_action[PackageAction.INSTALL]] == [
+            'other-package',
+        ]
+
+        assert [entry.id for entry in client.get_matching_entries(AptLogQuery(), limit=1, reverse=True)] == [2]
+
+    def test_get_entry(self, client):
+        entry = client.get_entry_by_id(1)
+
+        assert entry.id == 1
+        assert entry.requested_by == 'user (1000)'
+        assert entry.duration.total_seconds() == 15 * 60
+        assert client.get_last_entry().id == 2
+
+        with pytest.raises(InvalidAptLogEntryIDError):
+            client.get_entry_by_id(3)
+
+        assert client.get_entry_by_key(entry.key).id == 1
+        with pytest.raises(InvalidAptLogEntryIDError):
+            client.get_entry_by_key('unknown')
+
+    def test_get_entry_by_decimal_key(self):
+        entries = [AptLogEntry(start_date=datetime(2023, 1, 1, hour), key=f'{hour:016}') for hour in (1, 2)]
+        server = AptLogServer(AptLog(entries))
+
+        status, body = server.handle_request('/entries/0000000000000002', {})
+
+        assert status == HTTPStatus.OK
+        assert body['id'] == 2
+        assert server.handle_request('/entries/2', {})[1]['key'] == '0000000000000002'
+
+    def test_get_package_timelines(self, client):
+        timelines = client.get_package_timelines('lib*')
+
+        assert list(timelines) == ['libexample']
+        assert [(change.entry_id, change.version, change.is_automatic) for change in timelines['libexample']] == [
+            (1, '2.0', True),
+            (2, '2.0', True),
+        ]
+
+    def test_refresh(self, client, log_file):
+        with log_file.open('a') as file:
+            file.write(_log_entry(3, 'new-package'))
+
+        assert client.get_last_entry().id == 3
+        assert list(client.get_package_timelines('new-package')) == ['new-package']
+
+    def test_bad_request(self, client, server):
+        with pytest.raises(AptLogServerError, match='regular expression'):
+            client.get_matching_entries(AptLogQuery(command_pattern='('))
+
+        assert server.handle_request('/unknown', {})[0] == HTTPStatus.NOT_FOUND
+
+    def test_socket_in_use(self, client, server):
+        with pytest.raises(AptLogServerError, match='already listening'):
+            server.create_http_server(client.socket_path)
+
+    def test_server_not_running(self, tmp_path):
+        client = AptLogClient(tmp_path / 'apt-log.sock')
+
+        assert not client.is_running()
+        with pytest.raises(OSError):
+            client.get_last_entry()
@@ -0,0 +1,66 @@
+import subprocess
+import sys
+
+import pytest
+
+# Generous upper bounds for the cumulative import time, which only catch heavy dependencies creeping back in
+LIBRARY_IMPORT_BUDGET = 0.3
+CLI_IMPORT_BUDGET = 1.5
+
+LIBRARY_MODULES = [
+    'apt_log.log', 'apt_log.reader', 'apt_log.cache', 'apt_log.export', 'apt_log.follow', 'apt_log.fleet',
+    'apt_log.server', 'apt_log.stats', 'apt_log.details',
+]
+
+# Dependencies that the CLI must not import unless a command needs them
+DEFERRED_CLI_MODULES = [
+    'humanize', 'pyarrow', 'sqlite3', 'gzip', 'concurrent.futures', 'apt_log.follow', 'apt_log.fleet',
+    'apt_log.server', 'apt_log.details',
+]
+
+
+def _import(module: str | None) -> dict[str, float]:
+    # Imports the module in a fresh interpreter and returns the cumulative import time of each module it imports
+    # (including those that the interpreter imports at startup). Failed imports of optional modules are left out.
+    code = 'import sys; print(*sys.modules)'
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, '-X', 'importtime', '-c', code if module is None else f'import {module}; {code}'],
+        capture_output=True, text=True, check=True,
+    )
+    imported_modules = set(result.stdout.split())
+
+    import_times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:'):
+            _, cumulative, name = line.removeprefix('import time:').split('|')
+            if name.strip() in imported_modules:
+                import_times[name.strip()] = int(cumulative) / 1_000_000
+
+    return import_times
+
+
+@pytest.fixture(scope='module')
+def startup_modules() -> set[str]:
+    return set(_import(None))
+
+
+class TestStartup:
+
+    @pytest.mark.parametrize('module', LIBRARY_MODULES)
+    def test_library_imports_only_standard_library(self, module, startup_modules):
+        third_party_modules = {
+            name for name in _import(module).keys() - startup_modules
+            if name.split('.')[0] not in sys.stdlib_module_names and name.split('.')[0] != 'apt_log'
+        }
+
+        assert third_party_modules == set()
+
+    @pytest.mark.parametrize('module', ['apt_log.log', 'apt_log.reader'])
+    def test_library_import_time(self, module):
+        assert _import(module)[module] < LIBRARY_IMPORT_BUDGET
+
+    def test_cli_defers_imports(self):
+        import_times = _import('apt_log.cli')
+
+        assert [module for module in DEFERRED_CLI_MODULES if module in import_times] == []
+        assert import_times['apt_log.cli'] < CLI_IMPORT_BUDGET
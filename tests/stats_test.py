@@ -0,0 +1,98 @@
+import sys
+from datetime import datetime
+
+import pytest
+
+from apt_log.log import AptLog, AptLogEntry, ChangedPackage, PackageAction
+from apt_log.stats import DateBucket, StatsField, StatsGroup, aggregate_entries, format_date_bucket, get_command
+
+
+def _create_entry(start_date: datetime, seconds: int, user: str | None, **packages_by_action) -> AptLogEntry:
+    return AptLogEntry(
+        start_date=start_date,
+        end_date=start_date.replace(second=seconds),
+        command_line="/usr/bin/apt-get -y install something",
+        requested_by=user,
+        changed_packages_by_action={
+            PackageAction[action.upper()]: [
+                ChangedPackage(name, architecture, '1.0', PackageAction[action.upper()])
+                for name, architecture in packages
+            ]
+            for action, packages in packages_by_action.items()
+        },
+    )
+
+
+@pytest.fixture
+def entries() -> list[AptLogEntry]:
+    return [
+        _create_entry(datetime(2023, 1, 5), 10, 'alice', install=[('a', 'amd64'), ('b', 'i386')]),
+        _create_entry(datetime(2023, 1, 20), 20, 'bob', install=[('c', 'amd64')], remove=[('a', 'amd64')]),
+        _create_entry(datetime(2023, 2, 1), 40, 'alice', upgrade=[('b', 'i386')]),
+    ]
+
+
+class TestAggregateEntries:
+
+    def test_without_groups(self, entries):
+        groups = aggregate_entries(entries)
+
+        assert [(group.key, group.entry_count, group.package_count) for group in groups] == [((), 3, 5)]
+        assert list(groups[0].durations) == [10, 20, 40]
+
+    def test_by_entry_fields(self, entries):
+        groups = aggregate_entries(entries, [StatsField.DATE, StatsField.USER])
+
+        assert [(group.key, group.entry_count, group.package_count) for group in groups] == [
+            (('2023-01', 'alice'), 1, 2),
+            (('2023-01', 'bob'), 1, 2),
+            (('2023-02', 'alice'), 1, 1),
+        ]
+
+    def test_by_package_fields(self, entries):
+        groups = aggregate_entries(entries, [StatsField.ARCHITECTURE, StatsField.ACTION])
+
+        # Entries are counted once per group, however many of their packages fall into it.
+        assert [(group.key, group.entry_count, group.package_count, list(group.durations)) for group in groups] == [
+            (('amd64', 'Install'), 2, 2, [10, 20]),
+            (('amd64', 'Remove'), 1, 1, [20]),
+            (('i386', 'Install'), 1, 1, [10]),
+            (('i386', 'Upgrade'), 1, 1, [40]),
+        ]
+
+    @pytest.mark.parametrize('use_numpy', [True, False])
+    def test_duration_percentiles(self, entries, monkeypatch, use_numpy):
+        if use_numpy:
+            pytest.importorskip('numpy')
+        else:
+            monkeypatch.setitem(sys.modules, 'numpy', None)
+
+        group, = aggregate_entries(entries)
+
+        assert group.get_duration_percentiles([0, 50, 75, 100]) == pytest.approx([10, 20, 30, 40])
+        assert StatsGroup(()).get_duration_percentiles() is None
+
+    def test_get_stats(self, entries):
+        groups = AptLog(entries).get_stats([StatsField.DATE], DateBucket.YEAR, package_name='a')
+
+        assert [(group.key, group.entry_count, group.package_count) for group in groups] == [(('2023',), 2, 2)]
+
+
+@pytest.mark.parametrize(('bucket', 'expected'), [
+    (DateBucket.DAY, '2023-01-01'),
+    (DateBucket.WEEK, '2022-W52'),
+    (DateBucket.MONTH, '2023-01'),
+    (DateBucket.YEAR, '2023'),
+])
+def test_format_date_bucket(bucket, expected):
+    assert format_date_bucket(datetime(2023, 1, 1), bucket) == expected
+
+
+@pytest.mark.parametrize(('command_line', 'expected'), [
+    ("/usr/bin/apt-get -y install something", 'apt-get install'),
+    ("apt upgrade", 'apt upgrade'),
+    ("/usr/bin/unattended-upgrade", 'unattended-upgrade'),
+    (None, ''),
+])
+def test_get_command(command_line, expected):
+    assert get_command(command_line) == expected
@@ -0,0 +1,25 @@
+from apt_log.reader import AptLogReader
+from benchmarks.synthetic import SyntheticHistory
+
+
+class TestSyntheticHistory:
+
+    def test_write(self, tmp_path):
+        history = SyntheticHistory(entry_count=50, packages_per_transaction=5, error_rate=0.5, rotation_count=3)
+        paths = history.write(tmp_path)
+
+        assert [path.name for path in paths] == [
+            'history.log.3.gz', 'history.log.2.gz', 'history.log.1.gz', 'history.log',
+        ]
+
+        log = AptLogReader().build_log(*paths)
+        assert len(log.entries) == 50
+        assert any(entry.error for entry in log.entries)
+        assert all(entry.has_changed_packages() for entry in log.entries)
+
+        # Log files are chronological, as written by APT
+        dates = [entry.start_date for entry in AptLogReader().parse_log_files(*paths)]
+        assert dates == sorted(dates)
+
+    def test_generate_entries_is_deterministic(self):
+        assert list(SyntheticHistory(seed=1).generate_entries()) == list(SyntheticHistory(seed=1).generate_entries())
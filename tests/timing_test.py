@@ -0,0 +1,50 @@
+import pickle
+
+import pytest
+
+from apt_log.reader import AptLogReader
+from apt_log.timing import TimedFunction, Timings, disable_timings, enable_timings, get_timings, measure
+
+
+@pytest.fixture
+def timings():
+    yield enable_timings()
+    disable_timings()
+
+
+class TestTimings:
+
+    def test_disabled_by_default(self):
+        assert get_timings() is None
+
+        with measure('stage') as stage:
+            assert stage is None
+
+    def test_measure(self, timings):
+        with measure('stage') as stage:
+            stage.counts['entries'] += 2
+
+        assert timings.stages['stage'].calls == 1
+        assert timings.stages['stage'].counts['entries'] == 2
+
+    def test_iterate(self):
+        timings = Timings()
+
+        assert list(timings.iterate(range(3), 'stage', unit='items')) == [0, 1, 2]
+        assert timings.stages['stage'].counts['items'] == 3
+
+    def test_parse_log_files(self, timings, sample_log_file):
+        log = AptLogReader().build_log(sample_log_file)
+
+        assert len(log.entries) == 3
+        assert timings.stages['read'].counts['entries'] == 3
+        assert timings.stages['parse_log_entry'].counts['entries'] == 3
+        assert timings.stages['parse_date'].calls == 6
+        assert timings.stages['parse_package_list'].counts['packages'] == 9
+        assert timings.stages['sort'].counts['entries'] == 3
+        assert "parse_log_entry" in timings.format()
+
+    def test_pickle_timed_function(self, timings):
+        function = pickle.loads(pickle.dumps(TimedFunction(len, timings, 'stage')))  # noqa: S301
+
+        assert function is len